@@ -1,8 +1,15 @@
+from concurrent.futures import Future, ThreadPoolExecutor
 from google import genai
-from google.genai.types import Content, Part, ContentListUnion
-from typing import Optional, Union
+from google.genai.types import (
+    Candidate, Content, Part, ContentListUnion, GenerateContentResponse
+)
+from typing import Any, Iterator, List, Optional, Union
+import numpy as np
+from llama_index.core.schema import NodeWithScore
 from pydantic import Field
 from agent.response_formatter import ResponseFormatter
+from agent.history_manager import HistoryManager
+from agent.stream_parser import ResponseStreamParser
 from vecdb_modules.vecdbv2 import VecdbChatRAG
 from repo_cloner import RepoCloner
 
@@ -27,25 +34,58 @@ class UserContent(Content):
         super().__init__(parts=parts, **kwargs)
 
 
+def cosine_similarity(embedding: list[float], other_embedding: list[float]) -> float:
+    vector = np.asarray(embedding, dtype=np.float32)
+    other_vector = np.asarray(other_embedding, dtype=np.float32)
+
+    norms = float(np.linalg.norm(vector) * np.linalg.norm(other_vector))
+    return float(vector @ other_vector) / norms if norms else 0.
+
+
 class DocAgent:
     def __init__(
         self,
         repo_name: str,
         api_key: str = 'gemini_aki_key',
         model_name: str = 'gemini-2.0-flash-001',
+        speculative_retrieval: bool = False,
+        speculation_min_similarity: float = .85,
+        history_token_budget: int = 16_000,
+        federated_repo_names: list[str] | None = None,
     ):
 
         self.repo_name = repo_name
 
+        # Repos searched together, following one question across them.
+        self.federated_repo_names = federated_repo_names
+
+        # Retrieval on the raw prompt runs while the model writes the
+        # search_query, and is reused when both queries embed alike. It's
+        # only started after a turn that retrieved, a follow-up being
+        # likely to retrieve too.
+        self.speculative_retrieval = speculative_retrieval
+        self.speculation_min_similarity = speculation_min_similarity
+        self.speculation: tuple[str, Future] | None = None
+        self.speculation_stats = dict(hits=0, misses=0)
+        self.last_turn_retrieved = False
+        self.executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix='retrieval')
+
         self.client = genai.Client(api_key=api_key)
         self.model = self.client.models.generate_content
 
         self.vecdb = VecdbChatRAG(
             repo_name=repo_name
         )
-        self.vecdb.load_vecdb()
+        if self.federated_repo_names:
+            self.vecdb.load_federated_vecdb(self.federated_repo_names)
+        else:
+            self.vecdb.load_vecdb()
 
+        # Full chat history, rendered by the UI; requests get a compacted
+        # view of it from the history manager.
         self.contents = []
+        self.history = HistoryManager(token_budget=history_token_budget)
 
         self.create_system_prompt()
 
@@ -63,10 +103,18 @@ class DocAgent:
         with open('agent/sys_prompt2.md', 'r') as f:
             self.sys_prompt = f.read()
 
-        repo = RepoCloner.get_repo_info(
-            self.repo_name
-        )
-        repo_structure = repo['repo_structure']
+        if self.federated_repo_names:
+            # Retrieved chunks are tagged with their repo_name.
+            repo_structure = '\n\n'.join(
+                f"Repo `{repo_name}`:\n" +
+                RepoCloner.get_repo_structure(repo_name)
+                for repo_name in self.federated_repo_names
+            )
+
+        else:
+            repo_structure = RepoCloner.get_repo_structure(
+                self.repo_name
+            )
 
         self.sys_prompt = self.sys_prompt.format(repo_structure=repo_structure)
 
@@ -74,12 +122,47 @@ class DocAgent:
 
         self.contents.append(UserContent(text=text))  # type: ignore
 
+        self.start_speculation(text)
+
         return self.invoke()
 
+    def generate_response_stream(self, text: str) -> Iterator[tuple[str, str, Any]]:
+        """Streaming `generate_response`, see `invoke_stream` for the events."""
+
+        self.contents.append(UserContent(text=text))  # type: ignore
+
+        self.start_speculation(text)
+
+        return self.invoke_stream()
+
+    def start_speculation(self, text: str) -> None:
+        """Starts retrieving on the prompt, if on and the last turn retrieved."""
+
+        self.speculation = None
+
+        if self.speculative_retrieval and self.last_turn_retrieved:
+            self.speculation = (
+                text,
+                self.executor.submit(self.vecdb.retrieve_nodes, text)
+            )
+
+        self.last_turn_retrieved = False
+
+    def build_request(self) -> list:
+        request_contents, hidden_node_ids = self.history.build_request(
+            self.contents)
+
+        # Chunks compacted out of the request can be sent again.
+        self.vecdb.retrieved_node_ids -= hidden_node_ids
+
+        return request_contents
+
     def invoke(self) -> ResponseFormatter:
 
+        request_contents = self.build_request()
+
         response = self.model(
-            contents=self.contents,
+            contents=request_contents,
             **self.all_model_config  # type: ignore
         )
 
@@ -87,19 +170,148 @@ class DocAgent:
 
         return response.parsed  # type: ignore
 
-    def rag_on(self, user_search_query: str):
+    def invoke_stream(self) -> Iterator[tuple[str, str, Any]]:
+        """
+        Streams the model response, yielding the `ResponseStreamParser`
+        events as the JSON arrives:
+
+        - ('delta', 'ai_response', text) for the answer text;
+        - ('field', key, value) for each completed field;
+        - ('done', 'response', ResponseFormatter) once the response ends,
+          after which it's in the chat history.
+
+        Retrieval on the search_query starts as soon as it's complete, while
+        the model is still writing the rest of the response.
+        """
+
+        request_contents = self.build_request()
+
+        stream = self.client.models.generate_content_stream(
+            contents=request_contents,
+            **self.all_model_config  # type: ignore
+        )
+
+        parser = ResponseStreamParser()
+        last_chunk = None
+        for chunk in stream:
+            last_chunk = chunk
+
+            for event in parser.feed(chunk.text or ''):
+                kind, key, value = event
+                if kind == 'field' and key == 'search_query' and value:
+                    self.start_retrieval(value)
+
+                yield event
 
-        rag_results_context = self.vecdb.query(
-            text=user_search_query
+        # Same as the blocking response in the history.
+        response = GenerateContentResponse(
+            candidates=[Candidate(
+                content=Content(role='model', parts=[Part(text=parser.text)]),
+                finish_reason=last_chunk.candidates[0].finish_reason
+                if last_chunk and last_chunk.candidates else None,
+            )],
+            usage_metadata=last_chunk.usage_metadata if last_chunk else None,
+            model_version=last_chunk.model_version if last_chunk else None,
         )
+        response.parsed = ResponseFormatter.model_validate_json(parser.text)
+
+        self.contents.append(response)
+
+        yield ('done', 'response', response.parsed)
+
+    def is_same_query(self, text: str, other_text: str) -> bool:
+        """
+        Whether both queries embed alike, their (cached) query embeddings
+        being the ones retrieval computes anyway.
+        """
+        return cosine_similarity(
+            self.vecdb.get_query_embedding(text),
+            self.vecdb.get_query_embedding(other_text)
+        ) >= self.speculation_min_similarity
+
+    def start_retrieval(self, user_search_query: str) -> None:
+        """
+        Starts retrieving for the search_query in the background, reusing
+        the speculative retrieval on the prompt if it's alike.
+        """
+        self.speculation = (
+            user_search_query,
+            self.executor.submit(
+                self.retrieve_nodes, user_search_query, self.speculation)
+        )
+
+    def retrieve_nodes(
+        self,
+        user_search_query: str,
+        speculation: tuple[str, Future] | None = None,
+    ) -> List[NodeWithScore]:
+
+        if speculation is not None:
+            prompt, future = speculation
+
+            if self.is_same_query(prompt, user_search_query):
+                try:
+                    nodes = future.result()
+                    self.speculation_stats['hits'] += 1
+                    return nodes
+                except Exception as e:
+                    print(f"Speculative Retrieval Failed: {e}")
+
+            self.speculation_stats['misses'] += 1
 
+        return self.vecdb.retrieve_nodes(user_search_query)
+
+    def retrieve(self, user_search_query: str) -> str:
+        speculation, self.speculation = self.speculation, None
+
+        nodes = None
+        if speculation is not None and speculation[0] == user_search_query:
+            try:
+                nodes = speculation[1].result()
+            except Exception as e:
+                print(f"Background Retrieval Failed: {e}")
+                speculation = None
+
+        if nodes is None:
+            nodes = self.retrieve_nodes(user_search_query, speculation)
+
+        return self.vecdb.format_results(user_search_query, nodes)
+
+    def add_rag_context(self, user_search_query: str) -> str:
+
+        rag_results_context = self.retrieve(user_search_query)
+        self.last_turn_retrieved = True
+
+        self.history.record_rag(
+            index=len(self.contents),
+            query=user_search_query,
+            node_ids=self.vecdb.last_result_node_ids,
+            sources=self.vecdb.last_result_sources,
+        )
         self.contents.append(
             Part(text=rag_results_context)
         )
+        return rag_results_context
+
+    def rag_on(self, user_search_query: str):
+
+        rag_results_context = self.add_rag_context(user_search_query)
         return rag_results_context, self.invoke()
 
+    def rag_on_stream(self, user_search_query: str):
+
+        rag_results_context = self.add_rag_context(user_search_query)
+        return rag_results_context, self.invoke_stream()
+
+    def release(self):
+        """Give the shared repo index back, when switching repos."""
+        self.vecdb.release()
+
     def get_chat_hist(self):
         return self.contents
 
     def clear_chat_hist(self):
         self.contents = []
+        self.history.clear()
+        self.vecdb.retrieved_node_ids = set()
+        self.last_turn_retrieved = False
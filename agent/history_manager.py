@@ -0,0 +1,136 @@
+from google.genai.types import Content, GenerateContentResponse, Part
+
+
+class HistoryManager:
+    """
+    Builds the contents sent to the model from the full chat history, within
+    a token budget. The full history is left untouched for the UI.
+
+    - RAG context blocks older than the last `keep_recent_turns` turns are
+      replaced by a one line reference (query and source files), the model
+      having already answered from them.
+    - If the request is still over `token_budget`, the oldest turns are
+      dropped, always keeping the last one.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 16_000,
+        keep_recent_turns: int = 2,
+    ) -> None:
+
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+
+        # {index in contents: reference of the RAG block there}
+        self.rag_refs: dict[int, dict] = {}
+
+        self.last_full_tokens = 0
+        self.last_request_tokens = 0
+
+    @staticmethod
+    def get_text(item: Content | Part | GenerateContentResponse) -> str:
+        if isinstance(item, Part):
+            return item.text or ''
+
+        if isinstance(item, GenerateContentResponse):
+            content = item.candidates[0].content if item.candidates else None
+        else:
+            content = item
+
+        if content is None or not content.parts:
+            return ''
+
+        return ''.join(part.text or '' for part in content.parts)
+
+    @staticmethod
+    def estimate_tokens(item: Content | Part | GenerateContentResponse) -> int:
+        return len(HistoryManager.get_text(item)) // 4 + 1
+
+    def record_rag(
+        self,
+        index: int,
+        query: str,
+        node_ids: list[str],
+        sources: list[str],
+    ) -> None:
+        """Reference of the RAG block appended at `index` of the contents."""
+
+        self.rag_refs[index] = dict(
+            query=query,
+            node_ids=node_ids,
+            sources=list(dict.fromkeys(sources)),
+        )
+
+    def clear(self) -> None:
+        self.rag_refs = {}
+
+    @staticmethod
+    def split_turns(contents: list) -> list[list[tuple[int, object]]]:
+        """(index, item) pairs of the contents, grouped by turn: a user message and what follows it."""
+
+        turns: list[list[tuple[int, object]]] = []
+        for i, item in enumerate(contents):
+            if (isinstance(item, Content) and item.role == 'user') or not turns:
+                turns.append([])
+            turns[-1].append((i, item))
+
+        return turns
+
+    def make_ref_part(self, rag_ref: dict) -> Part:
+        sources = ', '.join(rag_ref['sources']) or 'no new sources'
+        return Part(
+            text=f"[Code context retrieved earlier for: {rag_ref['query'][:100]}... "
+                 f"(from {sources}), already answered above and omitted.]"
+        )
+
+    def build_request(self, contents: list) -> tuple[list, set[str]]:
+        """
+        Returns the contents to send, and the ids of the retrieved nodes
+        whose text isn't in them anymore.
+        """
+
+        turns = self.split_turns(contents)
+
+        recent_turns_start = len(turns) - self.keep_recent_turns
+
+        hidden_node_ids: set[str] = set()
+        request_turns = []
+        for turn_i, turn in enumerate(turns):
+            request_turn = []
+            for i, item in turn:
+                if turn_i < recent_turns_start and i in self.rag_refs:
+                    hidden_node_ids.update(self.rag_refs[i]['node_ids'])
+                    item = self.make_ref_part(self.rag_refs[i])
+
+                request_turn.append((i, item))
+            request_turns.append(request_turn)
+
+        self.last_full_tokens = sum(
+            self.estimate_tokens(item) for item in contents)
+
+        turns_tokens = [
+            sum(self.estimate_tokens(item) for _, item in turn)
+            for turn in request_turns
+        ]
+
+        n_dropped = 0
+        while len(request_turns) - n_dropped > 1 and \
+                sum(turns_tokens[n_dropped:]) > self.token_budget:
+
+            for i, _ in request_turns[n_dropped]:
+                if i in self.rag_refs:
+                    hidden_node_ids.update(self.rag_refs[i]['node_ids'])
+            n_dropped += 1
+
+        request = [
+            item for turn in request_turns[n_dropped:] for _, item in turn]
+
+        if n_dropped:
+            request.insert(0, Part(
+                text=f"[{n_dropped} earlier turns of this chat omitted.]"))
+
+        self.last_request_tokens = sum(
+            self.estimate_tokens(item) for item in request)
+
+        return request, hidden_node_ids
@@ -0,0 +1,163 @@
+import json
+from typing import Any, Iterator
+
+
+class ResponseStreamParser:
+    """
+    Incremental parser of the streamed JSON object of a `ResponseFormatter`.
+
+    `feed` takes the text chunks as they arrive and yields events:
+
+    - ('delta', key, text): new decoded text of a top level string value
+      still being written, for the keys in `stream_keys`;
+    - ('field', key, value): a top level value just completed.
+    """
+
+    def __init__(self, stream_keys: tuple[str, ...] = ('ai_response',)) -> None:
+        self.stream_keys = stream_keys
+
+        self.text = ''
+        self.fields: dict[str, Any] = {}
+
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+        # Top level key being parsed, and the one whose value is.
+        self._key_start: int | None = None
+        self._key: str | None = None
+
+        # Start of the current top level value, and how much of a string
+        # value was already emitted as deltas.
+        self._value_start: int | None = None
+        self._value_is_string = False
+        self._emitted_raw = 0
+
+    @staticmethod
+    def _safe_end(raw: str) -> int:
+        """End of the longest prefix of raw string content not cut inside an escape."""
+        end = len(raw)
+        backslash = raw.rfind('\\', max(0, end - 12))
+
+        while backslash != -1:
+            # Only a backslash opening an escape counts.
+            n_backslashes = 0
+            while backslash - n_backslashes >= 0 and raw[backslash - n_backslashes] == '\\':
+                n_backslashes += 1
+
+            if n_backslashes % 2 == 0:
+                break
+
+            # Cut escape, the text before it may end in a high surrogate.
+            if end - backslash < 2 or (raw[backslash + 1] == 'u' and end - backslash < 6):
+                return ResponseStreamParser._safe_end(raw[:backslash])
+
+            if raw[backslash + 1] != 'u':
+                break
+
+            # A high surrogate needs its low half to decode.
+            if 0xD800 <= int(raw[backslash + 2: backslash + 6], 16) <= 0xDBFF:
+                if end - backslash < 12:
+                    return backslash
+            break
+
+        return end
+
+    def _string_delta(self, raw_end: int) -> str:
+        """Decoded text of the streamed string value since the last delta."""
+        raw = self.text[self._value_start + 1 + self._emitted_raw: raw_end]  # type: ignore
+        safe_end = self._safe_end(raw)
+        if safe_end == 0:
+            return ''
+
+        self._emitted_raw += safe_end
+        return json.loads(f'"{raw[:safe_end]}"')
+
+    def _end_value(self, end: int) -> tuple[str, str, Any]:
+        value = json.loads(self.text[self._value_start: end])
+        key = self._key
+
+        self.fields[key] = value  # type: ignore
+        self._value_start = None
+        self._key = None
+
+        return ('field', key, value)  # type: ignore
+
+    def feed(self, chunk: str) -> Iterator[tuple[str, str, Any]]:
+        self.text += chunk
+        text = self.text
+
+        while self._pos < len(text):
+            char = text[self._pos]
+            pos = self._pos
+            self._pos += 1
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+
+                    if self._depth == 1 and self._key_start is not None:
+                        self._key = json.loads(text[self._key_start: pos + 1])
+                        self._key_start = None
+
+                    elif self._depth == 1 and self._value_is_string:
+                        if self._key in self.stream_keys:
+                            delta = self._string_delta(pos)
+                            if delta:
+                                yield ('delta', self._key, delta)  # type: ignore
+
+                        yield self._end_value(pos + 1)
+                continue
+
+            if char.isspace():
+                continue
+
+            if char == '"':
+                self._in_string = True
+
+                if self._depth == 1 and self._key is None:
+                    self._key_start = pos
+
+                elif self._depth == 1 and self._value_start is None:
+                    self._value_start = pos
+                    self._value_is_string = True
+                    self._emitted_raw = 0
+
+            elif char in '{[':
+                if self._depth == 1 and self._value_start is None:
+                    self._value_start = pos
+                    self._value_is_string = False
+                self._depth += 1
+
+            elif char in '}]':
+                self._depth -= 1
+
+                # End of a scalar (null, number...) top level value.
+                if self._depth == 0 and self._value_start is not None:
+                    yield self._end_value(pos)
+
+                elif self._depth == 1 and self._value_start is not None \
+                        and not self._value_is_string:
+                    yield self._end_value(pos + 1)
+
+            elif char == ',' and self._depth == 1:
+                if self._value_start is not None:
+                    yield self._end_value(pos)
+
+            elif char != ':' and self._depth == 1 and self._value_start is None \
+                    and self._key is not None:
+                # First character of a null, boolean or number value.
+                self._value_start = pos
+                self._value_is_string = False
+
+        # Text of the string value written so far.
+        if self._in_string and self._depth == 1 and self._value_is_string \
+                and self._value_start is not None and self._key in self.stream_keys:
+            delta = self._string_delta(len(text))
+            if delta:
+                yield ('delta', self._key, delta)  # type: ignore
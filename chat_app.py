@@ -17,7 +17,10 @@ if st.sidebar.button(
     st.session_state.agent.clear_chat_hist()
 
 
-st.session_state.ui_agent = ChatHandler()
+# Kept across reruns with its rendered turns, until the agent changes.
+if st.session_state.get('ui_agent') is None or \
+        st.session_state.ui_agent.agent is not st.session_state.agent:
+    st.session_state.ui_agent = ChatHandler()
 
 
 st.session_state.ui_agent.render_chat()
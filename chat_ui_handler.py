@@ -1,15 +1,24 @@
+import hashlib
 import streamlit as st
-from time import sleep
+from typing import Any, Iterable
 
 from google.genai.types import Content, Part, GenerateContentResponse
 
 from agent.response_formatter import ResponseFormatter, ContextSourceFormatter
 from agent.doc_agent import DocAgent
+from agent.history_manager import HistoryManager
 from source_component import SourceCard
+from markdown_stream import MarkdownStream
 
 
 class ChatHandler:
-    def __init__(self) -> None:
+    """
+    Renders the chat of the session's agent. Kept in the session state across
+    reruns, with the rendered view of each past turn cached by
+    (turn index, content hash), so reruns only rebuild new turns.
+    """
+
+    def __init__(self, stream_fps: float = 15.) -> None:
 
         self.agent: DocAgent = st.session_state.agent
 
@@ -19,6 +28,12 @@ class ChatHandler:
         self.chat_hist = []
         self.src_card_render = SourceCard()
 
+        # Streamed text is re-rendered at most this many times a second.
+        self.stream_fps = stream_fps
+
+        # {turn index: (content hash, turn view)}
+        self.turn_views: dict[int, tuple[str, dict]] = {}
+
     def render_user_msg(self, msg: Content | str) -> None:
 
         if isinstance(msg, Content):
@@ -30,67 +45,137 @@ class ChatHandler:
 
         st.subheader("Sources")
 
-        cols = st.columns(4)
+        self.src_card_render.render_many(
+            [src.model_dump() for src in context_sources]
+        )
 
-        for src_i, src in enumerate(context_sources):
-            with cols[src_i % 4]:
-                self.src_card_render.render(
-                    src.model_dump()
-                )
+    @staticmethod
+    def turn_hash(turn: list[tuple[int, object]]) -> str:
+        digest = hashlib.sha1()
+        for _, item in turn:
+            digest.update(type(item).__name__.encode())
+            digest.update(HistoryManager.get_text(item).encode())  # type: ignore
 
-    def render_ai_msg(
-            self,
-            msg: ResponseFormatter,
-            i: int | None = None
-    ) -> int:
+        return digest.hexdigest()
 
-        if msg is None:
-            st.write(self.agent.get_chat_hist())
+    def build_turn_view(self, turn: list[tuple[int, object]]) -> dict:
+        """What a past turn renders, computed once per turn."""
 
-        with st.chat_message("ai"):
-            st.markdown(msg.ai_response)
+        view = dict(
+            user_text=None,
+            ai_responses=[],
+            search_query=None,
+            rag_results=None,
+            sources_html=None,
+        )
 
-            if msg.search_query and i:
-                with st.expander("Search In Repo with..."):
-                    st.write(msg.search_query)
+        for _, item in turn:
+            if isinstance(item, Content):
+                view['user_text'] = item.parts[0].text  # type: ignore
+
+            elif isinstance(item, Part):
+                view['rag_results'] = item.text
+
+            elif isinstance(item, GenerateContentResponse):
+                msg: ResponseFormatter = item.parsed  # type: ignore
+                if msg is None:
+                    continue
 
-                    rag_results = self.chat_hist[i+1].text
-                    st.container(border=True).write(rag_results)
+                view['ai_responses'].append(msg.ai_response)
 
-                msg = self.chat_hist[i+2].parsed
-                st.markdown(msg.ai_response)
+                if msg.search_query and view['search_query'] is None:
+                    view['search_query'] = msg.search_query
 
-                i += 2
+                # The sources of the last response of the turn.
+                view['sources_html'] = self.src_card_render.grid_html(
+                    [src.model_dump() for src in msg.context_sources]
+                ) if msg.context_sources else None
+
+        return view
+
+    def render_turn(self, view: dict) -> None:
+
+        if view['user_text'] is not None:
+            self.render_user_msg(view['user_text'])
+
+        if not view['ai_responses']:
+            return
+
+        with st.chat_message("ai"):
+            st.markdown(view['ai_responses'][0])
+
+            if view['search_query']:
+                with st.expander("Search In Repo with..."):
+                    st.write(view['search_query'])
 
-            if msg.context_sources:
-                self.render_sources(msg.context_sources)
+                    if view['rag_results'] is not None:
+                        st.container(border=True).write(view['rag_results'])
 
-        return i or 0
+                for ai_response in view['ai_responses'][1:]:
+                    st.markdown(ai_response)
+
+            if view['sources_html']:
+                st.subheader("Sources")
+                st.markdown(view['sources_html'], unsafe_allow_html=True)
 
     def render_chat(self) -> None:
         self.chat_hist = self.agent.get_chat_hist()
-        chat_len = len(self.chat_hist)
 
-        i = 0
-        while i < chat_len:
-            msg = self.chat_hist[i]
+        # Elements not sent again in a rerun are removed, the CSS included.
+        self.src_card_render.inject_css()
 
-            if isinstance(msg, Content):
-                self.render_user_msg(msg)
+        turns = HistoryManager.split_turns(self.chat_hist)
 
-            elif isinstance(msg, GenerateContentResponse):
-                i = self.render_ai_msg(msg.parsed, i)  # type: ignore
+        for turn_i, turn in enumerate(turns):
+            turn_hash = self.turn_hash(turn)
+
+            cached = self.turn_views.get(turn_i)
+            if cached is None or cached[0] != turn_hash:
+                cached = (turn_hash, self.build_turn_view(turn))
+                self.turn_views[turn_i] = cached
+
+            self.render_turn(cached[1])
+
+        # Turns of a cleared chat.
+        for turn_i in [i for i in self.turn_views if i >= len(turns)]:
+            del self.turn_views[turn_i]
+
+    def stream_markdown(
+            self,
+            text: str,
+            duration: float = .5,
+            max_animated_chars: int = 2_000
+    ) -> None:
 
-            i += 1
+        MarkdownStream(fps=self.stream_fps).type_out(
+            text, duration=duration, max_animated_chars=max_animated_chars)
 
-    def stream_markdown(self, text: str, delay: float = .001) -> None:
+    def render_stream(
+            self,
+            events: Iterable[tuple[str, str, Any]]
+    ) -> ResponseFormatter:
+        """Renders the ai_response of a streamed model response as it arrives."""
+
+        events = iter(events)
+        with st.spinner("Thinking...", show_time=True):
+            event = next(events, None)
+
+        md_stream = MarkdownStream(fps=self.stream_fps)
+        response = None
+        while event is not None:
+            kind, key, value = event
+
+            if kind == 'delta' and key == 'ai_response':
+                md_stream.write(value)
 
-        plc = st.empty()
-        rendered_text = ''
-        for chr in text:
-            rendered_text += chr
-            plc.markdown(rendered_text, unsafe_allow_html=True)
-            sleep(delay)
+            elif kind == 'done':
+                response = value
+
+            event = next(events, None)
+
+        md_stream.flush()
+
+        return response  # type: ignore
 
     def handle_prompt(self, prompt: str) -> None:
 
@@ -98,26 +183,24 @@ class ChatHandler:
 
         with st.chat_message('ai'):
 
-            with st.spinner("Thinking...", show_time=True):
-                response: ResponseFormatter = self.agent.generate_response(
-                    prompt)
-
-            self.stream_markdown(response.ai_response)
+            response = self.render_stream(
+                self.agent.generate_response_stream(prompt)
+            )
 
             if response.search_query:
                 with st.expander("Search In Repo with...", expanded=True):
 
-                    self.stream_markdown(response.search_query)
+                    st.markdown(response.search_query)
 
                     with st.spinner("Searching In VecDB", show_time=True):
-                        rag_results, response = self.agent.rag_on(
+                        rag_results, events = self.agent.rag_on_stream(
                             response.search_query
                         )
 
                     with st.container(border=True):
-                        self.stream_markdown(rag_results, delay=.00001)
+                        self.stream_markdown(rag_results)
 
-                self.stream_markdown(response.ai_response)
+                response = self.render_stream(events)
 
             if response.context_sources:
                 self.render_sources(response.context_sources)
@@ -1,60 +1,86 @@
 import streamlit as st
 from repo_cloner import RepoCloner
-from vecdb_modules.vecdbv2 import VecDB
 from agent.doc_agent import DocAgent
+from job_queue import get_job_queue
 
 
-with st.container(border=True):
+@st.fragment(run_every=2)
+def render_jobs() -> None:
+    """Clone/pull jobs progress, polled from the job store."""
 
-    st.title("Hi, Choose or Clone Github Repo")
-    st.subheader("Clone/Pull Github Repo")
+    jobs = get_job_queue().store.list(limit=5)
+    if not jobs:
+        return
 
-    label_btn_cols = st.columns([3, 1], vertical_alignment='bottom')
+    st.subheader("Jobs")
+    for job in jobs:
+        label = f"**{job['kind'].capitalize()}** `{job['repo_name']}`"
 
-    repo_url = label_btn_cols[0].text_input("Repo URL")
+        if job['status'] == 'failed':
+            st.error(f"{label} Failed: {job['error']}")
+        elif job['status'] == 'done':
+            st.success(f"{label} Done.")
+        else:
+            st.progress(
+                job['progress'],
+                text=f"{label} - {job['stage']}: {job['message'] or ''}"
+            )
 
-    if label_btn_cols[1].button("Clone Repo", use_container_width=True, type='primary'):
+    # A job that started or finished since the last poll changes the local
+    # repos and which of them can be chosen or removed.
+    jobs_state = frozenset((job['job_id'], job['status']) for job in jobs)
+    seen = st.session_state.get('jobs_state')
+    st.session_state.jobs_state = jobs_state
 
-        if repo_url:
-            try:
-                with st.spinner("Cloning the Repo...", show_time=True):
+    if seen is not None and jobs_state != seen:
+        st.rerun()
 
-                    cohere_api_key = st.session_state.get("coher_api_key")
-                    if cohere_api_key is None:
-                        st.warning("You Should Set Coher API key.")
-                        st.stop()
 
-                    RepoCloner(repo_url)
+with st.container(border=True):
 
-                    st.session_state.repo_name_str = RepoCloner.extract_repo_name(
-                        repo_url=repo_url)
-                    st.success("Repo Cloned Successfully.")
+    st.title("Hi, Choose or Clone Github Repo")
+    st.subheader("Clone/Pull Github Repo")
 
-                with st.spinner("Vectoring the Repo...", show_time=True):
+    label_btn_cols = st.columns([3, 1, 1], vertical_alignment='bottom')
 
-                    cohere_api_key = st.session_state.get("coher_api_key")
-                    if cohere_api_key is None:
-                        st.warning("You Should Set Coher API key.")
-                        st.stop()
+    repo_url = label_btn_cols[0].text_input("Repo URL")
 
-                    vecdb = VecDB(
-                        st.session_state.repo_name_str,
-                        cohere_api_key=cohere_api_key)
+    clone_mode = label_btn_cols[1].selectbox(
+        "Clone Mode",
+        options=RepoCloner.CLONE_MODES,
+        index=RepoCloner.CLONE_MODES.index('full'),
+        help="full: the whole history and files. "
+             "sparse: only the last commit's supported files, the fastest."
+    )
 
-                    vecdb.vectorize_db()
+    if label_btn_cols[2].button("Clone Repo", use_container_width=True, type='primary'):
 
-                st.success("Repo Vectorized Successfully.")
+        if repo_url:
+            cohere_api_key = st.session_state.get("coher_api_key")
+            if cohere_api_key is None:
+                st.warning("You Should Set Coher API key.")
+                st.stop()
+
+            try:
+                get_job_queue().submit_clone(
+                    repo_url, cohere_api_key=cohere_api_key, clone_mode=clone_mode)
+
+                st.session_state.repo_name_str = RepoCloner.extract_repo_name(
+                    repo_url=repo_url)
+                st.success("Repo Clone Started, Follow it in the Jobs Below.")
 
             except Exception as e:
                 st.error(
                     f"Can't Cloning this Repo URL: Because this error {e}")
 
+    render_jobs()
+
     all_repos_infos = RepoCloner.get_all_repos_info()
 
     st.subheader("Local Repos")
     repo_name = st.session_state.get('repo_name_str', None)
     index = 0
-    if repo_name:
+    if repo_name in all_repos_infos:
         index = list(all_repos_infos.keys()).index(repo_name)
 
     repo_name = st.selectbox(
@@ -78,17 +104,28 @@ with st.container(border=True):
         with st.expander("**Repo Structure:**"):
             st.code(all_repos_infos[repo_name]['repo_structure'])
 
+    # The clone and index of a repo are rewritten while it has a job.
+    repo_has_job = bool(repo_name) and \
+        get_job_queue().store.active_job_id(repo_name) is not None  # type: ignore
+
+    if repo_has_job:
+        st.info("This Repo is Being Pulled, Choose or Remove it Once Done.")
+
     btns_cols = st.columns([1, 1, 1, 1])
 
     if btns_cols[0].button(
         label="Remove Repo",
         use_container_width=True,
-        disabled=not bool(repo_name),
+        disabled=not bool(repo_name) or repo_has_job,
     ):
         @st.dialog("Removing Repo")
         def ensure_remove_repo():
             st.write(f"Are you Sure to remove this Repo: `{repo_name}`?")
             if st.columns([1, 1, 1])[2].button("Remove", use_container_width=True, type='primary'):
+                if get_job_queue().store.active_job_id(repo_name) is not None:  # type: ignore
+                    st.error("This Repo is Being Pulled, Remove it Once Done.")
+                    st.stop()
+
                 RepoCloner.remove_repo(repo_name)  # type: ignore
                 st.rerun()
 
@@ -97,27 +134,17 @@ with st.container(border=True):
     if btns_cols[2].button(
         "Pull Repo",
         use_container_width=True,
-        disabled=not bool(repo_name)
+        disabled=not bool(repo_name) or repo_has_job
     ):
 
-        try:
-            with st.spinner("Pulling the Repo...", show_time=True):
-                RepoCloner(
-                    all_repos_infos[repo_name]['repo_url']
-                )
-            st.success("Repo Pulled Successfully.")
-
-            with st.spinner("Re-Vectoring the Repo...", show_time=True):
-
-                cohere_api_key = st.session_state.get("coher_api_key")
-                if cohere_api_key is None:
-                    st.warning("You Should Set Coher API key.")
-                    st.stop()
+        cohere_api_key = st.session_state.get("coher_api_key")
+        if cohere_api_key is None:
+            st.warning("You Should Set Coher API key.")
+            st.stop()
 
-                vecdb = VecDB(repo_name, cohere_api_key=cohere_api_key)
-                vecdb.vectorize_db()
-
-                st.success("Repo Re-Vectorized Successfully.")
+        try:
+            get_job_queue().submit_pull(repo_name, cohere_api_key=cohere_api_key)
+            st.success("Repo Pull Started, Follow it in the Jobs Below.")
 
         except Exception as e:
             st.error(
@@ -127,7 +154,7 @@ with st.container(border=True):
             "Choose Repo",
             use_container_width=True,
         type='primary',
-        disabled=not bool(repo_name)
+        disabled=not bool(repo_name) or repo_has_job
     ):
 
         with st.spinner("Loading Repo from Disk...", show_time=True):
@@ -139,10 +166,53 @@ with st.container(border=True):
                 st.stop()
 
             else:
+                if st.session_state.get('agent') is not None:
+                    st.session_state.agent.release()
+
                 st.session_state.agent = DocAgent(
                     repo_name=repo_name,
-                    api_key=gemini_api_key
+                    api_key=gemini_api_key,
+                    speculative_retrieval=True,
                 )
 
         if gemini_api_key:
             st.success("Setting The Repo Doc Successfully.")
+
+    st.subheader("Chat Across Repos")
+
+    federated_repo_names = st.multiselect(
+        label="Select Repos to Search Together",
+        options=all_repos_infos.keys(),
+    )
+
+    if st.button(
+        "Choose Repos",
+        use_container_width=True,
+        type='primary',
+        disabled=len(federated_repo_names) < 2 or any(
+            get_job_queue().store.active_job_id(name) is not None
+            for name in federated_repo_names
+        )
+    ):
+
+        with st.spinner("Loading Repos from Disk...", show_time=True):
+
+            gemini_api_key = st.session_state.get('gemini_api_key')
+
+            if gemini_api_key is None:
+                st.error("You Should Set Gemini API key First.")
+                st.stop()
+
+            else:
+                if st.session_state.get('agent') is not None:
+                    st.session_state.agent.release()
+
+                st.session_state.agent = DocAgent(
+                    repo_name=federated_repo_names[0],
+                    api_key=gemini_api_key,
+                    speculative_retrieval=True,
+                    federated_repo_names=federated_repo_names
+                )
+
+        if gemini_api_key:
+            st.success("Setting The Repos Doc Successfully.")
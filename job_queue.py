@@ -0,0 +1,278 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from repo_cloner import RepoCloner
+from vecdb_modules.vecdbv2 import VecDB
+
+
+# Share of a job's overall progress taken by each stage.
+STAGE_SPANS = {
+    'queued': (0., 0.),
+    'clone': (0., .15),
+    'pull': (0., .15),
+    'embed': (.15, .95),
+    'persist': (.95, 1.),
+    'done': (1., 1.),
+}
+
+JOBS_SETTINGS_PATH = os.path.join("settings", "jobs.json")
+
+JOB_FIELDS = (
+    'job_id', 'kind', 'repo_name', 'status', 'stage', 'progress', 'message',
+    'error', 'created_at', 'started_at', 'finished_at',
+)
+
+
+class JobStore:
+    """SQLite record of the jobs and their progress, read by the UI."""
+
+    def __init__(self, db_path: str = os.path.join("settings", "jobs.sqlite")) -> None:
+        self.db_path = db_path
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    repo_name TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at)"
+            )
+
+    def create(self, kind: str, repo_name: str) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, kind, repo_name, status, stage, created_at) "
+                "VALUES (?, ?, ?, 'queued', 'queued', ?)",
+                (job_id, kind, repo_name, time.time())
+            )
+        return job_id
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{key} = ?' for key in fields)} WHERE job_id = ?",
+                [*fields.values(), job_id]
+            )
+
+    def _to_dicts(self, rows: list[tuple]) -> list[dict[str, Any]]:
+        return [dict(zip(JOB_FIELDS, row)) for row in rows]
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return self._to_dicts(rows)[0] if rows else None
+
+    def list(self, limit: int = 10) -> list[dict[str, Any]]:
+        """The latest jobs, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs ORDER BY created_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return self._to_dicts(rows)
+
+    def active_job_id(self, repo_name: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE repo_name = ? AND status IN ('queued', 'running')",
+                (repo_name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def fail_interrupted(self) -> None:
+        """Jobs of a previous process that were still queued or running."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted by a restart.', "
+                "finished_at = ? WHERE status IN ('queued', 'running')",
+                (time.time(),)
+            )
+
+
+class JobProgress:
+    """
+    Progress callback of a job, `progress(stage, fraction, message)`.
+    Writes are throttled to one per `min_interval` seconds, stage changes
+    and completions being always written.
+    """
+
+    def __init__(self, store: JobStore, job_id: str, min_interval: float = .5) -> None:
+        self.store = store
+        self.job_id = job_id
+        self.min_interval = min_interval
+
+        self.stage: str | None = None
+        self._last_write = 0.
+
+    def __call__(self, stage: str, fraction: float, message: str = '') -> None:
+        now = time.monotonic()
+        if stage == self.stage and fraction < 1. and \
+                now - self._last_write < self.min_interval:
+            return
+
+        start, end = STAGE_SPANS.get(stage, (0., 1.))
+        self.store.update(
+            self.job_id,
+            stage=stage,
+            progress=round(start + (end - start) * min(max(fraction, 0.), 1.), 4),
+            message=message,
+        )
+
+        self.stage = stage
+        self._last_write = now
+
+
+class JobQueue:
+    """
+    Runs repo clone/pull + vectorize jobs on a pool of `max_workers`
+    threads, recording their progress in a `JobStore`. A repo has at most
+    one queued or running job, submitting another returns its id.
+    """
+
+    def __init__(self, store: JobStore | None = None, max_workers: int = 2) -> None:
+        self.store = store or JobStore()
+        self.max_workers = max_workers
+
+        self.store.fail_interrupted()
+
+        self._submit_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='repo_job')
+
+    def submit(
+        self,
+        kind: str,
+        repo_name: str,
+        fn: Callable[[JobProgress], None],
+    ) -> str:
+
+        with self._submit_lock:
+            active_job_id = self.store.active_job_id(repo_name)
+            if active_job_id is not None:
+                return active_job_id
+
+            job_id = self.store.create(kind, repo_name)
+
+        self._executor.submit(self._run, job_id, fn)
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable[[JobProgress], None]) -> None:
+        self.store.update(job_id, status='running', started_at=time.time())
+
+        try:
+            fn(JobProgress(self.store, job_id))
+
+        except Exception as e:
+            print(f"Job {job_id} Failed: {e}")
+            self.store.update(
+                job_id, status='failed', error=str(e), finished_at=time.time())
+
+        else:
+            self.store.update(
+                job_id, status='done', stage='done', progress=1.,
+                message='', finished_at=time.time())
+
+    def submit_clone(
+        self,
+        repo_url: str,
+        cohere_api_key: str,
+        clone_mode: str | None = None,
+    ) -> str:
+        """Clone (or pull) a repo and vectorize it from scratch."""
+
+        repo_name = RepoCloner.extract_repo_name(repo_url)
+
+        def clone(progress: JobProgress) -> None:
+            is_new_clone = not os.path.exists(os.path.join("repos", repo_name))
+
+            try:
+                repo_cloner = RepoCloner(
+                    repo_url, clone_mode=clone_mode, progress=progress, publish=False)
+
+                VecDB(repo_name, cohere_api_key=cohere_api_key).vectorize_db(
+                    progress=progress, repo_info=repo_cloner.to_repo_info())
+
+            except BaseException:
+                # Not listed, nor pulled later in a mode it has no record of.
+                if is_new_clone and os.path.exists(os.path.join("repos", repo_name)):
+                    RepoCloner.remove_dir(os.path.join("repos", repo_name))
+                raise
+
+            # Listed in the local repos only once it can be chosen.
+            repo_cloner.update_hash_record()
+
+        return self.submit('clone', repo_name, clone)
+
+    def submit_pull(self, repo_name: str, cohere_api_key: str) -> str:
+        """Pull a repo and re-vectorize the files changed."""
+
+        repo_url = RepoCloner.get_repo_info(repo_name)['repo_url']
+
+        def pull(progress: JobProgress) -> None:
+            repo_cloner = RepoCloner(repo_url, progress=progress, publish=False)
+
+            VecDB(repo_name, cohere_api_key=cohere_api_key).update_vecdb(
+                old_commit_hash=repo_cloner.prev_commit_hash,
+                progress=progress,
+                repo_info=repo_cloner.to_repo_info(),
+            )
+
+            # The record moves to the new commit once it's indexed.
+            repo_cloner.update_hash_record()
+
+        return self.submit('pull', repo_name, pull)
+
+
+_job_queue: JobQueue | None = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue(max_workers: int | None = None) -> JobQueue:
+    """
+    The job queue of the process, created on first use with `max_workers`,
+    by default the "max_workers" of settings/jobs.json (2 without it).
+    """
+    global _job_queue
+
+    with _job_queue_lock:
+        if _job_queue is None:
+            if max_workers is None:
+                try:
+                    with open(JOBS_SETTINGS_PATH, 'r') as f:
+                        max_workers = int(json.loads(f.read()).get('max_workers', 2))
+                except FileNotFoundError:
+                    max_workers = 2
+
+            _job_queue = JobQueue(max_workers=max_workers)
+
+    return _job_queue
@@ -0,0 +1,82 @@
+import streamlit as st
+from time import monotonic, sleep
+
+
+class MarkdownStream:
+    """
+    Markdown rendered incrementally into an `st.empty` placeholder.
+
+    Written text is coalesced into frames: the placeholder is re-rendered
+    at most `fps` times a second, and only once at least `min_chunk_chars`
+    new characters are pending, instead of once per written piece.
+    """
+
+    def __init__(
+        self,
+        fps: float = 15.,
+        min_chunk_chars: int = 1,
+        unsafe_allow_html: bool = True,
+    ) -> None:
+
+        self.frame_time = 1 / fps
+        self.min_chunk_chars = min_chunk_chars
+        self.unsafe_allow_html = unsafe_allow_html
+
+        self.plc = st.empty()
+        self.pieces: list[str] = []
+        self.n_chars = 0
+        self.rendered_chars = 0
+        self.renders = 0
+
+        self._last_render = 0.
+
+    @property
+    def text(self) -> str:
+        if len(self.pieces) > 1:
+            self.pieces = [''.join(self.pieces)]
+        return self.pieces[0] if self.pieces else ''
+
+    def write(self, text: str) -> None:
+        self.pieces.append(text)
+        self.n_chars += len(text)
+
+        if self.n_chars - self.rendered_chars >= self.min_chunk_chars and \
+                monotonic() - self._last_render >= self.frame_time:
+            self.render()
+
+    def render(self) -> None:
+        self.plc.markdown(self.text, unsafe_allow_html=self.unsafe_allow_html)
+
+        self.rendered_chars = self.n_chars
+        self.renders += 1
+        self._last_render = monotonic()
+
+    def flush(self) -> None:
+        """Renders the text still pending, at the end of the stream."""
+        if self.n_chars != self.rendered_chars:
+            self.render()
+
+    def type_out(
+        self,
+        text: str,
+        duration: float = .5,
+        max_animated_chars: int = 2_000,
+    ) -> None:
+        """
+        Writes an already complete text as a typing effect lasting about
+        `duration` seconds, in frames. Longer texts than `max_animated_chars`
+        are rendered in one shot.
+        """
+        if len(text) > max_animated_chars or duration <= 0:
+            self.write(text)
+            self.flush()
+            return
+
+        n_frames = max(int(duration / self.frame_time), 1)
+        chunk_size = max(-(-len(text) // n_frames), 1)
+
+        for start in range(0, len(text), chunk_size):
+            self.pieces.append(text[start: start + chunk_size])
+            self.n_chars += len(self.pieces[-1])
+            self.render()
+            sleep(self.frame_time)
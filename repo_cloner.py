@@ -3,21 +3,51 @@ import os
 import json
 import datetime
 import os
+import subprocess
 from pathlib import Path
+from typing import Callable
 import streamlit as st
+from vecdb_modules.retrieval_cache import RETRIEVAL_CACHE
+from repo_walker import MANIFEST_CACHE, walk_repo
+from repo_registry import RepoInfo, RepoRegistry
 
 
 class RepoCloner:
+    # Records are in the registry, the JSON file is only read to import
+    # its records the first time.
+    repo_registry_path: str = "settings/repo_infos.sqlite"
     repo_infos_path: str = "settings/repo_infos.json"
+    _registry: RepoRegistry | None = None
+    supported_files_path: str = "settings/supported_files.json"
+
+    # - full: all history and files.
+    # - shallow: the last commit only (depth 1).
+    # - blobless: all commits and trees, but only the checked out files
+    #   contents (--filter=blob:none).
+    # - sparse: shallow, checking out only the supported files up to
+    #   max_file_size bytes. Files over it aren't downloaded at all
+    #   (--filter=blob:limit), smaller unsupported ones are, but not
+    #   checked out: git can't tell a file size without its content.
+    CLONE_MODES = ('full', 'shallow', 'blobless', 'sparse')
 
     def __init__(
         self,
         repo_url: str,
         repos_dir_path: str = "repos",
+        clone_mode: str | None = None,
+        max_file_size: int | None = 1_000_000,
+        progress: Callable[[str, float, str], None] | None = None,
+        publish: bool = True,
     ) -> None:
+        """
+        Clone or pull the repo. With `publish=False` the repo record isn't
+        written, `to_repo_info` gives it and `update_hash_record` writes it
+        once the repo is ready to be listed.
+        """
 
         self.repos_dir_path = repos_dir_path
         self.repo_url = repo_url
+        self.max_file_size = max_file_size
 
         self.repo_name = RepoCloner.extract_repo_name(
             repo_url=repo_url
@@ -28,13 +58,37 @@ class RepoCloner:
 
         self.target_dir = os.path.join(self.repos_dir_path, self.repo_name)
 
+        # Keep the previously indexed commit, so the vecdb can be updated
+        # incrementally from the diff between it and the new HEAD.
+        repo_info = RepoCloner.get_registry().get(self.repo_name) or {}
+        self.prev_commit_hash: str | None = repo_info.get('commit_hash')
+
+        # An existing clone keeps the mode it was cloned with.
         if os.path.exists(self.target_dir):
+            clone_mode = repo_info.get('clone_mode', 'full')
+
+        self.clone_mode = clone_mode or 'full'
+        if self.clone_mode not in RepoCloner.CLONE_MODES:
+            raise Exception(
+                f"Clone mode must be one of {RepoCloner.CLONE_MODES}, not {self.clone_mode}")
+
+        stage = 'pull' if os.path.exists(self.target_dir) else 'clone'
+        if progress is not None:
+            progress(stage, 0., f"{stage.capitalize()} {self.repo_name} ({self.clone_mode})")
+
+        if stage == 'pull':
             self.commit_hash = self.pull()
         else:
             self.commit_hash = self.clone()
 
+        self.last_updated = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        if progress is not None:
+            progress(stage, 1., f"At commit {self.commit_hash}")
+
         # Update hash records
-        self.update_hash_record()
+        if publish:
+            self.update_hash_record()
 
     @staticmethod
     def extract_repo_name(repo_url: str) -> str:
@@ -42,31 +96,181 @@ class RepoCloner:
         if repo_url.endswith('.git'):
             repo_url = repo_url[:-4]
 
+        # Local repos (paths or file:// URLs) are named owner/repo after
+        # their last two directories.
+        if 'github.com/' not in repo_url:
+            path = repo_url.removeprefix('file://').rstrip('/\\')
+            return '/'.join(Path(path).parts[-2:])
+
         # Get the path part of the URL (remove the domain)
         path = repo_url.split('github.com/')[-1]
 
         return path
 
+    @property
+    def git_url(self) -> str:
+        """
+        URL git clones from. Local paths are given as file:// URLs, git
+        ignoring --depth and --filter for plain local clones.
+        """
+        if os.path.isdir(self.repo_url):
+            return Path(self.repo_url).resolve().as_uri()
+        return self.repo_url
+
+    @staticmethod
+    def run_git(*args: str, cwd: str | None = None, input: str | None = None) -> str:
+        result = subprocess.run(
+            ['git', *args],
+            cwd=cwd,
+            input=input,
+            capture_output=True,
+            text=True,
+        )
+
+        if result.returncode != 0:
+            raise Exception(
+                f"git {args[0]} failed: {result.stderr.strip()}")
+
+        return result.stdout
+
+    def list_tree(self, treeish: str = 'HEAD') -> list[tuple[str, str]]:
+        """(path, object id) of the files of a commit, from its trees only."""
+
+        output = RepoCloner.run_git(
+            'ls-tree', '-r', '-z', treeish, cwd=self.target_dir)
+
+        files = []
+        for entry in output.split('\0'):
+            if not entry:
+                continue
+
+            info, path = entry.split('\t', 1)
+            _, obj_type, oid = info.split()
+            if obj_type == 'blob':
+                files.append((path, oid))
+
+        return files
+
+    def list_missing_blobs(self, treeish: str = 'HEAD') -> set[str]:
+        """Ids of the files of a commit left out by the clone filter, without fetching them."""
+
+        output = RepoCloner.run_git(
+            'rev-list', '--objects', '--missing=print', treeish, cwd=self.target_dir)
+
+        return {
+            line[1:].strip()
+            for line in output.splitlines()
+            if line.startswith('?')
+        }
+
+    @staticmethod
+    def escape_sparse_pattern(path: str) -> str:
+        """Anchored gitignore-style pattern matching exactly this path."""
+        for char in '\\*?[':
+            path = path.replace(char, '\\' + char)
+
+        if path.endswith(' '):
+            path = path[:-1] + '\\ '
+
+        return '/' + path
+
+    def sparse_patterns(self, treeish: str = 'HEAD') -> list[str]:
+        """
+        Sparse checkout patterns of the supported files: one per supported
+        extension, and an exclusion for each supported file of `treeish`
+        the clone filter left out for being over max_file_size.
+        """
+        with open(RepoCloner.supported_files_path, 'r') as sf:
+            supported_files_types = json.loads(sf.read())
+
+        patterns = [f'*{ext}' for ext in supported_files_types]
+
+        if self.max_file_size is not None:
+            missing_blobs = self.list_missing_blobs(treeish)
+
+            patterns.extend(
+                '!' + RepoCloner.escape_sparse_pattern(path)
+                for path, oid in self.list_tree(treeish)
+                if oid in missing_blobs
+                and os.path.splitext(path)[-1] in supported_files_types
+            )
+
+        return patterns
+
+    def set_sparse_checkout(self, treeish: str = 'HEAD') -> None:
+        RepoCloner.run_git(
+            'sparse-checkout', 'set', '--no-cone', '--stdin',
+            cwd=self.target_dir,
+            input='\n'.join(self.sparse_patterns(treeish)) + '\n'
+        )
+
     def clone(self) -> str:
-        print(f"Cloning {self.repo_name} into {self.target_dir}...")
+        print(f"Cloning {self.repo_name} into {self.target_dir} ({self.clone_mode})...")
 
         # Ensure the parent directory exists
         os.makedirs(os.path.dirname(self.target_dir), exist_ok=True)
 
-        repo = git.Repo.clone_from(self.repo_url, self.target_dir)
+        if self.clone_mode == 'full':
+            repo = git.Repo.clone_from(self.repo_url, self.target_dir)
+
+        else:
+            clone_args = dict(
+                shallow=['--depth', '1', '--single-branch', '--no-tags'],
+                blobless=['--filter=blob:none'],
+                sparse=['--depth', '1', '--single-branch', '--no-tags', '--no-checkout',
+                        '--filter=blob:none' if self.max_file_size is None
+                        else f'--filter=blob:limit={self.max_file_size}'],
+            )[self.clone_mode]
+
+            RepoCloner.run_git(
+                'clone', *clone_args, self.git_url, self.target_dir)
+
+            # Nothing is checked out yet, the checkout only writes (and
+            # fetches, if filtered out) the selected files.
+            if self.clone_mode == 'sparse':
+                self.set_sparse_checkout()
+                RepoCloner.run_git('checkout', cwd=self.target_dir)
+
+            repo = git.Repo(self.target_dir)
+
         commit_hash = repo.head.commit.hexsha
         print(f"Current commit hash: {commit_hash}")
         print(f"Repository cloned successfully to {self.target_dir}")
 
         return commit_hash
 
+    def fetch_head(self) -> None:
+        """
+        Moves the clone to the remote HEAD of its branch, fetching as the
+        clone mode does (the blob filter is kept in the remote config).
+        """
+        branch = RepoCloner.run_git(
+            'rev-parse', '--abbrev-ref', 'HEAD', cwd=self.target_dir).strip()
+
+        depth_args = ['--depth', '1'] if self.clone_mode in ('shallow', 'sparse') else []
+        RepoCloner.run_git(
+            'fetch', *depth_args, '--no-tags', 'origin', branch, cwd=self.target_dir)
+
+        # The new commit may add supported files or make some too large.
+        if self.clone_mode == 'sparse':
+            self.set_sparse_checkout('FETCH_HEAD')
+
+        # The clone is never edited, so it's reset rather than merged,
+        # which shallow histories can't always do.
+        RepoCloner.run_git('reset', '--hard', 'FETCH_HEAD', cwd=self.target_dir)
+
     def pull(self) -> str:
         print(f"Repository already exists at {self.target_dir}")
 
         try:
             repo = git.Repo(self.target_dir)
-            print(f"Pulling latest changes...")
-            repo.remotes.origin.pull()
+            print(f"Pulling latest changes ({self.clone_mode})...")
+
+            if self.clone_mode == 'full':
+                repo.remotes.origin.pull()
+            else:
+                self.fetch_head()
+
             commit_hash = repo.head.commit.hexsha
             print(f"Current commit hash: {commit_hash}")
             print(f"Repository updated successfully")
@@ -76,6 +280,60 @@ class RepoCloner:
             print(f"The directory exists but is not a valid git repository")
             return None  # type: ignore
 
+    @staticmethod
+    def get_changed_files(
+        repo_path: str,
+        old_commit_hash: str,
+        new_commit_hash: str
+    ) -> dict[str, list]:
+        """
+        List the files changed between two commits of a local repository.
+
+        Args:
+            repo_path (str): Path to the local repository
+            old_commit_hash (str): The commit the vecdb was built from
+            new_commit_hash (str): The current HEAD commit
+
+        Returns:
+            dict: 'added', 'modified' and 'deleted' lists of paths relative to
+                the repo root, and 'renamed' as a list of (old_path, new_path).
+        """
+        changes: dict[str, list] = dict(
+            added=[], modified=[], deleted=[], renamed=[]
+        )
+
+        if old_commit_hash == new_commit_hash:
+            return changes
+
+        # NUL separated, so paths aren't C-quoted (non-ASCII, tabs, quotes).
+        diff_output = RepoCloner.run_git(
+            'diff', '--name-status', '-z', '-M', '--no-color',
+            old_commit_hash, new_commit_hash, cwd=repo_path
+        )
+
+        fields = diff_output.split('\0')
+        i = 0
+        while i < len(fields) and fields[i]:
+            status = fields[i][:1]
+
+            # Renames and copies have their source and destination paths.
+            n_paths = 2 if status in ('R', 'C') else 1
+            paths = fields[i + 1: i + 1 + n_paths]
+            i += 1 + n_paths
+
+            if status == 'A':
+                changes['added'].append(paths[0])
+            elif status in ('M', 'T'):
+                changes['modified'].append(paths[0])
+            elif status == 'D':
+                changes['deleted'].append(paths[0])
+            elif status == 'R':
+                changes['renamed'].append((paths[0], paths[1]))
+            elif status == 'C':
+                changes['added'].append(paths[1])
+
+        return changes
+
     def generate_repo_structure(
             self,
             exclude_dirs=None,
@@ -85,200 +343,116 @@ class RepoCloner:
         Generate a text representation of a repository folder structure.
 
         Args:
-            repo_path (str): Path to the repository root folder
-            output_file (str, optional): Path to save the output. If None, prints to console.
-            exclude_dirs (list, optional): List of directory names to exclude
-            exclude_files (list, optional): List of file names to exclude
+            exclude_dirs (list, optional): List of directory names (prefixes) to exclude
+            exclude_files (list, optional): List of file names (or '*suffix') to exclude
 
         Returns:
             str: Text representation of the folder structure
         """
-        if exclude_dirs is None:
-            exclude_dirs = [
-                # Version control
-                '.git', '.svn', '.hg', '.bzr',
-
-                # Python
-                '__pycache__', 'venv', 'env', '.env', '.venv', 'virtualenv',
-                '.pytest_cache', '.coverage', 'htmlcov', '.tox', 'dist', 'build', 'eggs',
-
-                # IDE and editors
-                '.idea', '.vscode', '.vs', '.eclipse', '.settings', '.project',
-                '.classpath', '.factorypath', '.nbproject', '.metadata',
-
-                # JavaScript/Node.js
-                'node_modules', 'bower_components', 'jspm_packages', '.npm', '.yarn',
-
-                # Java/Gradle/Maven
-                'target', 'bin', 'out', 'build', '.gradle', '.m2',
-
-                # C/C++
-                'cmake-build-debug', 'cmake-build-release', 'Debug', 'Release', 'x64',
-                'Win32', 'obj', 'libs', 'lib', 'CMakeFiles'
-            ]
-
-        if exclude_files is None:
-            exclude_files = [
-
-                '.gitattributes'
-                '.gitignore',
-
-                # OS files
-                '.DS_Store', 'Thumbs.db',
-
-                # Python
-                '*.pyc', '*.pyo', '*.pyd', '__pycache__', '*.so', '*.egg', '*.egg-info',
-                '.pytest_cache', '.coverage', 'htmlcov', '.tox',
-
-                # C/C++
-                '*.o', '*.obj', '*.exe', '*.out', '*.app', '*.dll', '*.so', '*.dylib',
-                '*.a', '*.lib', '*.la', '*.lo', '*.d', '*.gcda', '*.gcno', '*.dSYM',
-                '*.sln'
-
-                # JavaScript/TypeScript
-                'node_modules', 'npm-debug.log', 'yarn-debug.log', 'yarn-error.log',
-                '.npm', '.yarn', '*.min.js', '*.bundle.js', '*.map', '.eslintcache',
-                'package-lock.json', 'yarn.lock',
-
-                # Java
-                '*.class', '*.jar', '*.war', '*.ear', '*.nar', 'hs_err_pid*',
-                'target/', 'build/', '.gradle/', 'out/', '.mvn/'
-            ]
-
-        # Convert repo_path to a Path object
-        repo_path = Path(self.target_dir)
-
-        # Get the repo name for the top level
-        repo_name = repo_path.name
-
-        # Start building the structure with the repo name
-        structure = [f"├── {repo_name}"]
-
-        def should_exclude(path):
-            # Check if path should be excluded
-            name = path.name
-            # Check directories
-            if path.is_dir() and (name in exclude_dirs or any(name.startswith(d) for d in exclude_dirs)):
-                return True
-            # Check files
-            if path.is_file():
-                for pattern in exclude_files:
-                    if pattern.startswith('*'):
-                        if name.endswith(pattern[1:]):
-                            return True
-                    elif name == pattern:
-                        return True
-            return False
-
-        def build_structure(directory, prefix=""):
-            paths = sorted(directory.iterdir(),
-                           key=lambda p: (p.is_file(), p.name))
-            items = []
-
-            # Filter out excluded paths
-            paths = [p for p in paths if not should_exclude(p)]
-
-            for i, path in enumerate(paths):
-                is_last = i == len(paths) - 1
-
-                # Determine the connector symbol
-                connector = "└──" if is_last else "├──"
-
-                # Add current item to the result
-                if path.is_file():
-                    items.append(f"{prefix}{connector} {path.name}")
-                else:
-                    items.append(f"{prefix}{connector} {path.name}")
-
-                    # Prepare the prefix for the next level
-                    next_prefix = f"{prefix}{'    ' if is_last else '│   '}"
+        # The default walk of a commit is shared with the document loader.
+        if exclude_dirs is None and exclude_files is None:
+            manifest = MANIFEST_CACHE.get(self.target_dir, self.commit_hash)
+        else:
+            manifest = walk_repo(self.target_dir, exclude_dirs, exclude_files)
 
-                    # Process the subdirectory
-                    items.extend(build_structure(path, next_prefix))
+        result = manifest.tree_text(Path(self.target_dir).name)
 
-            return items
+        print(result)
 
-        # Build the structure starting from the repo root
-        structure.extend(build_structure(repo_path))
+        return result
 
-        # Join all lines
-        result = "\n".join(structure)
+    def to_repo_info(self) -> dict[str, str]:
+        """The repo record `update_hash_record` writes, without the structure."""
 
-        print(result)
+        repo_info = RepoCloner.get_registry().get(self.repo_name) or {}
 
-        return result
+        return dict(
+            repo_url=repo_info.get('repo_url') or self.repo_url.removesuffix('.git'),
+            repo_path=repo_info.get('repo_path') or self.target_dir,
+            clone_mode=self.clone_mode,
+            commit_hash=self.commit_hash,
+            last_updated=self.last_updated,
+        )
 
     def update_hash_record(self) -> None:
-        """Update or add the repository hash in the hash record file"""
+        """Update or add the repository hash in the repo registry"""
         if self.commit_hash is None:
             return
 
-        # Load existing records or create new
-        if os.path.exists(RepoCloner.repo_infos_path):
-            try:
-                with open(RepoCloner.repo_infos_path, 'r') as f:
-                    records = json.load(f)
-            except json.JSONDecodeError:
-                records = {}
-        else:
-            records = {}
-
         if self.repo_url.endswith('.git'):
             self.repo_url = self.repo_url[:-4]
-        # Update the record for this repository
-        if self.repo_name not in records:
-            records[self.repo_name] = {
-                'repo_url': self.repo_url,
-                'repo_path': self.target_dir,
-                'commit_hash': self.commit_hash,
-                'last_updated': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'repo_structure': self.generate_repo_structure()
-            }
-        else:
-            records[self.repo_name]['commit_hash'] = self.commit_hash
-            records[self.repo_name]['last_updated'] = datetime.datetime.now().strftime(
-                "%Y-%m-%d %H:%M:%S")
-            records[self.repo_name]['repo_structure'] = self.generate_repo_structure()
 
-        # Save the updated records
-        with open(RepoCloner.repo_infos_path, 'w') as f:
-            json.dump(records, f, indent=2)
+        # Walked before the transaction, which only writes.
+        repo_structure = self.generate_repo_structure()
+
+        RepoCloner.get_registry().upsert(
+            self.repo_name,
+            repo_structure=repo_structure,
+            insert_only_fields=dict(
+                repo_url=self.repo_url,
+                repo_path=self.target_dir,
+            ),
+            clone_mode=self.clone_mode,
+            commit_hash=self.commit_hash,
+            last_updated=self.last_updated,
+        )
+
+        # Retrieval results cached for older commits are stale now.
+        RETRIEVAL_CACHE.invalidate_repo(self.repo_name)
 
         print(f"Updated hash record for {self.repo_name}")
 
+    @staticmethod
+    def get_registry() -> RepoRegistry:
+        if RepoCloner._registry is None or \
+                RepoCloner._registry.db_path != RepoCloner.repo_registry_path:
+            RepoCloner._registry = RepoRegistry(
+                RepoCloner.repo_registry_path,
+                legacy_json_path=RepoCloner.repo_infos_path
+            )
+
+        return RepoCloner._registry
+
     @staticmethod
     def get_repo_info(
         repo_name
-    ) -> dict:
+    ) -> RepoInfo:
 
-        with open(RepoCloner.repo_infos_path, 'r') as f:
-            records = json.loads(f.read())
+        repo_info = RepoCloner.get_registry().get(repo_name)
+        if repo_info is None:
+            raise KeyError(repo_name)
 
-        return records[repo_name]
+        return repo_info
 
     @staticmethod
-    def get_all_repos_info():
-        with open(RepoCloner.repo_infos_path, 'r') as f:
-            repos_infos = json.loads(f.read())
-        return repos_infos
+    def get_all_repos_info() -> dict[str, RepoInfo]:
+        """All the repos records, their structures being read when accessed."""
+        return RepoCloner.get_registry().get_all()
 
     @staticmethod
-    def remove_repo(del_repo_name: str):
+    def get_repo_structure(repo_name: str) -> str:
+        return RepoCloner.get_registry().get_repo_structure(repo_name)
+
+    @staticmethod
+    def remove_dir(path: str) -> None:
+        """`shutil.rmtree`, read-only files (git objects on Windows) included."""
         import shutil
         import stat
-        import subprocess
 
         def remove_readonly(func, path, _):
             os.chmod(path, stat.S_IWRITE)
             func(path)
 
-        repos_infos = RepoCloner.get_all_repos_info()
+        shutil.rmtree(path, onerror=remove_readonly)
+
+    @staticmethod
+    def remove_repo(del_repo_name: str):
 
-        repo_info = repos_infos[del_repo_name]
+        repo_info = RepoCloner.get_repo_info(del_repo_name)
 
         try:
-            shutil.rmtree(repo_info['repo_path'], onerror=remove_readonly)
-            shutil.rmtree(f'vec_db/{del_repo_name}', onerror=remove_readonly)
+            RepoCloner.remove_dir(repo_info['repo_path'])
+            RepoCloner.remove_dir(f'vec_db/{del_repo_name}')
 
             st.success("Repo Removed Successfully.")
 
@@ -288,10 +462,7 @@ class RepoCloner:
         except OSError as e:
             st.error(f"Error: {e.strerror}")
 
-        del repos_infos[del_repo_name]
-
-        with open(RepoCloner.repo_infos_path, 'w') as f:
-            json.dump(repos_infos, f, indent=2)
+        RepoCloner.get_registry().remove(del_repo_name)
 
 
 # # Example usage
@@ -0,0 +1,211 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Any
+
+
+REPO_FIELDS = ('repo_url', 'repo_path', 'clone_mode', 'commit_hash', 'last_updated')
+
+
+class RepoInfo(dict):
+    """
+    A repo record. Its 'repo_structure' is only read from the registry
+    the first time it's accessed.
+    """
+
+    def __init__(self, registry: "RepoRegistry", repo_name: str, **fields: Any) -> None:
+        super().__init__(**fields)
+
+        self.registry = registry
+        self.repo_name = repo_name
+
+    def __missing__(self, key: str) -> Any:
+        if key != 'repo_structure':
+            raise KeyError(key)
+
+        self[key] = self.registry.get_repo_structure(self.repo_name)
+        return self[key]
+
+
+class RepoRegistry:
+    """
+    SQLite store of the cloned repos records, indexed by repo name.
+
+    Lookups read a single row, and updates are atomic transactions, safe
+    between sessions and processes (WAL mode). The repo structures, the
+    large part of a record, are kept in their own table and read lazily.
+    Records of a legacy `repo_infos.json` are imported on first use.
+    """
+
+    def __init__(
+        self,
+        db_path: str = os.path.join("settings", "repo_infos.sqlite"),
+        legacy_json_path: str | None = os.path.join("settings", "repo_infos.json"),
+    ) -> None:
+
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            db_path, timeout=30, check_same_thread=False, isolation_level=None)
+
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS repos (
+                        repo_name TEXT PRIMARY KEY,
+                        repo_url TEXT,
+                        repo_path TEXT,
+                        clone_mode TEXT,
+                        commit_hash TEXT,
+                        last_updated TEXT
+                    )
+                    """
+                )
+                self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS repo_structures (
+                        repo_name TEXT PRIMARY KEY,
+                        repo_structure TEXT
+                    )
+                    """
+                )
+
+                # user_version 1: the legacy records are imported.
+                if self._conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+                    self._migrate_legacy_json()
+                    self._conn.execute("PRAGMA user_version = 1")
+
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _migrate_legacy_json(self) -> None:
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return
+
+        try:
+            with open(self.legacy_json_path, 'r') as f:
+                records = json.load(f)
+        except json.JSONDecodeError:
+            records = {}
+
+        for repo_name, record in records.items():
+            self._write(repo_name, record, record.get('repo_structure'))
+
+        if records:
+            print(f"Migrated {len(records)} Repo Records to: {self.db_path}")
+
+    def _write(
+        self,
+        repo_name: str,
+        fields: dict[str, Any],
+        repo_structure: str | None,
+    ) -> None:
+        """Insert or update a record, within the caller's transaction."""
+
+        fields = {key: fields[key] for key in REPO_FIELDS if key in fields}
+
+        self._conn.execute(
+            "INSERT OR IGNORE INTO repos (repo_name) VALUES (?)", (repo_name,))
+
+        if fields:
+            self._conn.execute(
+                f"UPDATE repos SET {', '.join(f'{key} = ?' for key in fields)} "
+                f"WHERE repo_name = ?",
+                [*fields.values(), repo_name]
+            )
+
+        if repo_structure is not None:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO repo_structures (repo_name, repo_structure) "
+                "VALUES (?, ?)",
+                (repo_name, repo_structure)
+            )
+
+    def upsert(
+        self,
+        repo_name: str,
+        repo_structure: str | None = None,
+        insert_only_fields: dict[str, Any] | None = None,
+        **fields: Any,
+    ) -> None:
+        """
+        Atomically add or update a repo record. `insert_only_fields` are only
+        set when the record is new.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if insert_only_fields and not self._exists(repo_name):
+                    fields = {**insert_only_fields, **fields}
+
+                self._write(repo_name, fields, repo_structure)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _exists(self, repo_name: str) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM repos WHERE repo_name = ?", (repo_name,)
+        ).fetchone() is not None
+
+    def _to_info(self, row: tuple) -> RepoInfo:
+        return RepoInfo(self, row[0], **dict(zip(REPO_FIELDS, row[1:])))
+
+    def get(self, repo_name: str) -> RepoInfo | None:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT repo_name, {', '.join(REPO_FIELDS)} FROM repos WHERE repo_name = ?",
+                (repo_name,)
+            ).fetchone()
+
+        return self._to_info(row) if row is not None else None
+
+    def get_all(self) -> dict[str, RepoInfo]:
+        """All the records by repo name, without their structures."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT repo_name, {', '.join(REPO_FIELDS)} FROM repos ORDER BY rowid"
+            ).fetchall()
+
+        return {row[0]: self._to_info(row) for row in rows}
+
+    def get_repo_structure(self, repo_name: str) -> str:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT repo_structure FROM repo_structures WHERE repo_name = ?",
+                (repo_name,)
+            ).fetchone()
+
+        return row[0] if row is not None else ''
+
+    def remove(self, repo_name: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM repos WHERE repo_name = ?", (repo_name,))
+                self._conn.execute(
+                    "DELETE FROM repo_structures WHERE repo_name = ?", (repo_name,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
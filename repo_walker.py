@@ -0,0 +1,247 @@
+import os
+import re
+import threading
+from typing import NamedTuple
+
+
+DEFAULT_EXCLUDE_DIRS = [
+    # Version control
+    '.git', '.svn', '.hg', '.bzr',
+
+    # Python
+    '__pycache__', 'venv', 'env', '.env', '.venv', 'virtualenv',
+    '.pytest_cache', '.coverage', 'htmlcov', '.tox', 'dist', 'build', 'eggs',
+
+    # IDE and editors
+    '.idea', '.vscode', '.vs', '.eclipse', '.settings', '.project',
+    '.classpath', '.factorypath', '.nbproject', '.metadata',
+
+    # JavaScript/Node.js
+    'node_modules', 'bower_components', 'jspm_packages', '.npm', '.yarn',
+
+    # Java/Gradle/Maven
+    'target', 'bin', 'out', 'build', '.gradle', '.m2',
+
+    # C/C++
+    'cmake-build-debug', 'cmake-build-release', 'Debug', 'Release', 'x64',
+    'Win32', 'obj', 'libs', 'lib', 'CMakeFiles'
+]
+
+DEFAULT_EXCLUDE_FILES = [
+
+    '.gitattributes',
+    '.gitignore',
+
+    # OS files
+    '.DS_Store', 'Thumbs.db',
+
+    # Python
+    '*.pyc', '*.pyo', '*.pyd', '__pycache__', '*.so', '*.egg', '*.egg-info',
+    '.pytest_cache', '.coverage', 'htmlcov', '.tox',
+
+    # C/C++
+    '*.o', '*.obj', '*.exe', '*.out', '*.app', '*.dll', '*.so', '*.dylib',
+    '*.a', '*.lib', '*.la', '*.lo', '*.d', '*.gcda', '*.gcno', '*.dSYM',
+    '*.sln',
+
+    # JavaScript/TypeScript
+    'node_modules', 'npm-debug.log', 'yarn-debug.log', 'yarn-error.log',
+    '.npm', '.yarn', '*.min.js', '*.bundle.js', '*.map', '.eslintcache',
+    'package-lock.json', 'yarn.lock',
+
+    # Java
+    '*.class', '*.jar', '*.war', '*.ear', '*.nar', 'hs_err_pid*',
+    'target/', 'build/', '.gradle/', 'out/', '.mvn/'
+]
+
+
+class ManifestEntry(NamedTuple):
+    path: str  # relative to the repo root, '/' separated
+    size: int
+    mtime: float
+    ext: str
+    in_tree: bool  # not excluded from the repo structure
+    hidden: bool  # a part of the path starts with '.'
+
+
+class ExcludeMatcher:
+    """
+    Precompiled exclude patterns: directories are excluded when their name
+    starts with one of `exclude_dirs`, files when their name is one of
+    `exclude_files`, or ends like one of its '*' patterns.
+    """
+
+    def __init__(self, exclude_dirs: list[str], exclude_files: list[str]) -> None:
+        self.dir_regex = re.compile(
+            '|'.join(re.escape(name) for name in exclude_dirs) or r'(?!)')
+
+        self.file_names = frozenset(
+            pattern for pattern in exclude_files if not pattern.startswith('*'))
+        self.file_suffixes = tuple(
+            pattern[1:] for pattern in exclude_files if pattern.startswith('*'))
+
+    def exclude_dir(self, name: str) -> bool:
+        return self.dir_regex.match(name) is not None
+
+    def exclude_file(self, name: str) -> bool:
+        return name in self.file_names or name.endswith(self.file_suffixes)
+
+
+class RepoManifest:
+    """Files and directories of a repo, from a single walk."""
+
+    def __init__(
+        self,
+        root: str,
+        files: list[ManifestEntry],
+        dirs: list[tuple[str, bool]],
+    ) -> None:
+
+        self.root = root
+        self.files = files
+        self.dirs = dirs  # (path, in_tree)
+
+        self.files_by_path = {entry.path: entry for entry in files}
+
+    def get(self, path: str) -> ManifestEntry | None:
+        return self.files_by_path.get(path.replace('\\', '/'))
+
+    def loadable_files(self, extensions: list[str]) -> list[ManifestEntry]:
+        """The files documents are read from: supported and not hidden."""
+        extensions_set = set(extensions)
+        return [
+            entry for entry in self.files
+            if entry.ext in extensions_set and not entry.hidden
+        ]
+
+    def tree_text(self, root_name: str) -> str:
+        """The repo structure, directories first, then files, by name."""
+
+        children: dict[str, tuple[list[str], list[str]]] = {'': ([], [])}
+        for path, in_tree in self.dirs:
+            if in_tree:
+                children[path] = ([], [])
+
+        for path, in_tree in self.dirs:
+            if in_tree:
+                children[path.rpartition('/')[0]][0].append(path)
+
+        for entry in self.files:
+            if entry.in_tree:
+                children[entry.path.rpartition('/')[0]][1].append(entry.path)
+
+        lines = [f"├── {root_name}"]
+
+        def build_structure(directory: str, prefix: str = "") -> None:
+            sub_dirs, files = children[directory]
+            paths = [(path, True) for path in sorted(sub_dirs)] + \
+                [(path, False) for path in sorted(files)]
+
+            for i, (path, is_dir) in enumerate(paths):
+                is_last = i == len(paths) - 1
+
+                # Determine the connector symbol
+                connector = "└──" if is_last else "├──"
+                lines.append(f"{prefix}{connector} {path.rpartition('/')[2]}")
+
+                if is_dir:
+                    build_structure(
+                        path, f"{prefix}{'    ' if is_last else '│   '}")
+
+        build_structure('')
+
+        return "\n".join(lines)
+
+
+def walk_repo(
+    root: str,
+    exclude_dirs: list[str] | None = None,
+    exclude_files: list[str] | None = None,
+) -> RepoManifest:
+    """
+    Walks the repo once with `os.scandir`, one stat per file.
+
+    Excluded directories are still walked (their files aren't in the repo
+    structure, but can be read as documents), except hidden ones, read by
+    neither. Symlinked directories aren't followed.
+    """
+    matcher = ExcludeMatcher(
+        DEFAULT_EXCLUDE_DIRS if exclude_dirs is None else exclude_dirs,
+        DEFAULT_EXCLUDE_FILES if exclude_files is None else exclude_files,
+    )
+
+    files: list[ManifestEntry] = []
+    dirs: list[tuple[str, bool]] = []
+
+    # (relative path, in tree, hidden)
+    stack = [('', True, False)]
+    while stack:
+        rel_dir, dir_in_tree, dir_hidden = stack.pop()
+
+        with os.scandir(os.path.join(root, rel_dir)) as entries:
+            for entry in entries:
+                name = entry.name
+                path = f'{rel_dir}/{name}' if rel_dir else name
+                hidden = dir_hidden or name.startswith('.')
+
+                if entry.is_dir(follow_symlinks=False):
+                    in_tree = dir_in_tree and not matcher.exclude_dir(name)
+                    if not in_tree and hidden:
+                        continue
+
+                    dirs.append((path, in_tree))
+                    stack.append((path, in_tree, hidden))
+
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files.append(ManifestEntry(
+                        path=path,
+                        size=stat.st_size,
+                        mtime=stat.st_mtime,
+                        ext=os.path.splitext(name)[-1],
+                        in_tree=dir_in_tree and not matcher.exclude_file(name),
+                        hidden=hidden,
+                    ))
+
+    files.sort(key=lambda entry: entry.path)
+
+    return RepoManifest(root, files, dirs)
+
+
+class ManifestCache:
+    """
+    Manifests of the default walk by (repo root, commit hash), so the repo
+    structure and the document loader of a commit share a single walk.
+    """
+
+    def __init__(self, max_entries: int = 32) -> None:
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[str, str], RepoManifest] = {}
+
+    def get(self, root: str, commit_hash: str | None) -> RepoManifest:
+        if commit_hash is None:
+            return walk_repo(root)
+
+        key = (os.path.abspath(root), commit_hash)
+        with self._lock:
+            manifest = self._entries.get(key)
+
+        if manifest is None:
+            manifest = walk_repo(root)
+
+            with self._lock:
+                # A root has a single current commit.
+                for old_key in [k for k in self._entries if k[0] == key[0]]:
+                    del self._entries[old_key]
+
+                self._entries[key] = manifest
+                while len(self._entries) > self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+
+        return manifest
+
+
+# Shared by the repo cloner and the vecdbs of the process.
+MANIFEST_CACHE = ManifestCache()
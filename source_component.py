@@ -1,5 +1,6 @@
 import streamlit as st
-from typing import Dict, Any, Optional
+from textwrap import dedent
+from typing import Dict, Any, List, Optional
 
 
 class SourceCard:
@@ -23,12 +24,21 @@ class SourceCard:
             "Markdown": "https://res.cloudinary.com/dcu6hrqeq/image/upload/v1741824368/file_qikjrq.png",
         }
         # Inject CSS once
-        self._inject_css()
+        self.inject_css()
 
-    def _inject_css(self):
-        """Inject the required CSS for the component."""
+    def inject_css(self):
+        """
+        Inject the required CSS for the component. Has to be called on every
+        script run the cards are rendered in when the component is reused.
+        """
         st.markdown("""
         <style>
+        .sources-grid {
+            display: grid;
+            grid-template-columns: repeat(var(--sources-columns, 4), minmax(0, 1fr));
+            gap: 4px;
+        }
+
         .clickable-container {
             display: inline-block;
             width: auto;
@@ -153,11 +163,38 @@ class SourceCard:
         # Use the provided parent or default to st
         container = parent if parent is not None else st
 
+        container.markdown(self.to_html(data), unsafe_allow_html=True)
+
+    def render_many(
+            self,
+            datas: List[Dict[str, Any]],
+            columns: int = 4,
+
+            parent: Optional[
+                st.delta_generator.DeltaGenerator  # type: ignore
+            ] = None
+    ) -> None:
+        """Render several source cards in a grid, as a single element."""
+
+        container = parent if parent is not None else st
+
+        container.markdown(
+            self.grid_html(datas, columns),
+            unsafe_allow_html=True
+        )
+
+    def grid_html(self, datas: List[Dict[str, Any]], columns: int = 4) -> str:
+        cards = ''.join(self.to_html(data) for data in datas)
+        return f'<div class="sources-grid" style="--sources-columns: {columns};">{cards}</div>'
+
+    def to_html(self, data: Dict[str, Any]) -> str:
+        """HTML of the card of a source."""
+
         # Get appropriate icon
         icon_url = self._get_icon_for_file(data['source'])
 
         # Create clickable container with image and content and tooltip
-        container.markdown(f"""
+        return dedent(f"""
         <div class="tooltip">
             <a href="{data['source_url']}" target="_blank" class="clickable-container" style="text-decoration: none;">
                 <div class="container-content">
@@ -170,7 +207,7 @@ class SourceCard:
                 </div>
             </a>
         </div>
-        """, unsafe_allow_html=True)
+        """).strip()
 
 
 # # Example usage:
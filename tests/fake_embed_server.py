@@ -0,0 +1,156 @@
+"""
+A local stand-in for the Cohere embed API, to exercise the ingestion
+pipeline and `EmbeddingScheduler` without an API key or quota.
+
+It answers `POST /v1/embed` and `POST /v2/embed` with deterministic
+vectors, and returns 429 (with Retry-After) when more than `max_in_flight`
+requests are served at once or the `rps` budget is exceeded, like a
+rate-limited provider would.
+
+Run it with:
+    python tests/fake_embed_server.py --port 8765 --rps 20
+then point `VecDB(embed_base_url="http://127.0.0.1:8765")` at it.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text: str, dim: int) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+    rng = random.Random(seed)
+    return [rng.uniform(-1, 1) for _ in range(dim)]
+
+
+class FakeEmbedServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 8765,
+        dim: int = 1024,
+        rps: float = 20.,
+        max_in_flight: int = 4,
+        latency: float = .05,
+    ) -> None:
+
+        super().__init__((host, port), FakeEmbedHandler)
+
+        self.dim = dim
+        self.rps = rps
+        self.max_in_flight = max_in_flight
+        self.latency = latency
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.tokens = rps
+        self.last_refill = time.monotonic()
+
+        self.n_served = 0
+        self.n_throttled = 0
+
+    def try_admit(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.rps, self.tokens + (now - self.last_refill) * self.rps)
+            self.last_refill = now
+
+            if self.in_flight >= self.max_in_flight or self.tokens < 1:
+                self.n_throttled += 1
+                return False
+
+            self.tokens -= 1
+            self.in_flight += 1
+            return True
+
+    def done(self) -> None:
+        with self.lock:
+            self.in_flight -= 1
+            self.n_served += 1
+
+
+class FakeEmbedHandler(BaseHTTPRequestHandler):
+    server: FakeEmbedServer
+
+    def _send_json(self, status: int, body: dict, headers: dict | None = None):
+        payload = json.dumps(body).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self) -> None:
+        if self.path not in ('/v1/embed', '/v2/embed'):
+            self._send_json(404, {'message': f'Unknown path {self.path}'})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+
+        if not self.server.try_admit():
+            self._send_json(
+                429,
+                {'message': 'You are past the rate limit.'},
+                headers={'Retry-After': str(round(1 / self.server.rps, 3))}
+            )
+            return
+
+        try:
+            time.sleep(self.server.latency)
+
+            texts = request.get('texts') or []
+            embeddings = [fake_embedding(text, self.server.dim) for text in texts]
+
+            body = {
+                'id': str(uuid.uuid4()),
+                'texts': texts,
+                'meta': {'billed_units': {'input_tokens': sum(len(t) // 4 for t in texts)}},
+            }
+
+            if request.get('embedding_types') or self.path == '/v2/embed':
+                body['response_type'] = 'embeddings_by_type'
+                body['embeddings'] = {'float': embeddings}
+            else:
+                body['response_type'] = 'embeddings_floats'
+                body['embeddings'] = embeddings
+
+            self._send_json(200, body)
+
+        finally:
+            self.server.done()
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--rps', type=float, default=20.)
+    parser.add_argument('--max-in-flight', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=.05)
+    args = parser.parse_args()
+
+    server = FakeEmbedServer(
+        host=args.host,
+        port=args.port,
+        dim=args.dim,
+        rps=args.rps,
+        max_in_flight=args.max_in_flight,
+        latency=args.latency,
+    )
+    print(f"Fake embed server on http://{args.host}:{args.port}")
+    server.serve_forever()
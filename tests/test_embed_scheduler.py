@@ -0,0 +1,98 @@
+"""
+Drives `EmbeddingScheduler`, as `VecDB` sets it up, against the fake
+Cohere embed server, throttling included.
+
+Run from the repo root with:
+    python -m unittest discover tests
+"""
+import tempfile
+import threading
+import unittest
+
+from vecdb_modules.embed_scheduler import EmbeddingScheduler
+from vecdb_modules.vecdbv2 import VecDB
+
+from fake_embed_server import FakeEmbedServer, fake_embedding
+
+
+DIM = 32
+
+
+class EmbeddingSchedulerTest(unittest.TestCase):
+
+    def start_server(self, **server_kwargs) -> FakeEmbedServer:
+        server = FakeEmbedServer(port=0, dim=DIM, **server_kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        return server
+
+    def get_scheduler(self, server: FakeEmbedServer, max_concurrency: int) -> EmbeddingScheduler:
+        persist_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(persist_dir.cleanup)
+
+        host, port = server.server_address[:2]
+        vecdb = VecDB(
+            repo_name="owner/repo",
+            persist_directory=persist_dir.name,
+            cohere_api_key="test",
+            embed_concurrency=max_concurrency,
+            embed_base_url=f"http://{host}:{port}",
+        )
+
+        vecdb.get_doc_embed_model()
+        self.addCleanup(vecdb.embedding_cache.close)  # type: ignore
+
+        return vecdb.embed_scheduler  # type: ignore
+
+    def test_embeds_in_order_under_throttling(self) -> None:
+        server = self.start_server(rps=100, max_in_flight=2, latency=.02)
+        scheduler = self.get_scheduler(server, max_concurrency=8)
+        scheduler.max_batch_size = 8
+        scheduler.backoff_max = .5
+
+        texts = [f"def function_{i}():\n    return {i}\n" for i in range(400)]
+        embeddings = scheduler.embed(texts)
+
+        self.assertEqual(embeddings, [fake_embedding(text, DIM) for text in texts])
+
+        stats = scheduler.stats()
+        self.assertEqual(stats['chunks'], len(texts))
+        self.assertEqual(stats['requests'], len(scheduler.pack_batches(texts)))
+        self.assertEqual(stats['requests'], server.n_served)
+
+        # The server rejected requests over its limits, the scheduler
+        # retried them and lowered its concurrency.
+        self.assertGreater(server.n_throttled, 0)
+        self.assertEqual(stats['throttled'], server.n_throttled)
+        self.assertLess(stats['concurrency'], 8)
+
+    def test_unthrottled_runs_at_full_concurrency(self) -> None:
+        server = self.start_server(rps=10_000, max_in_flight=16, latency=.01)
+        scheduler = self.get_scheduler(server, max_concurrency=4)
+
+        texts = [f"chunk {i}" for i in range(1000)]
+        embeddings = scheduler.embed(texts)
+
+        self.assertEqual(embeddings, [fake_embedding(text, DIM) for text in texts])
+
+        stats = scheduler.stats()
+        self.assertEqual(stats['throttled'], 0)
+        self.assertEqual(stats['concurrency'], 4)
+        self.assertEqual(stats['requests'], len(scheduler.pack_batches(texts)))
+
+    def test_pack_batches_limits(self) -> None:
+        scheduler = EmbeddingScheduler(
+            embed_fn=lambda texts: [], max_batch_size=3, max_batch_tokens=10)
+
+        # 4 tokens each, so 2 per batch; then one over the token limit alone.
+        texts = ['x' * 12] * 5 + ['x' * 100]
+        batches = scheduler.pack_batches(texts)
+
+        self.assertEqual(batches, [[0, 1], [2, 3], [4], [5]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from vecdb_modules.ivf_index import IVFIndex
+from vecdb_modules.numpy_vector_store import NumpyVectorStore
+
+
+DIM = 8
+
+
+def random_vectors(n_rows: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(n_rows, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class IVFIndexTest(unittest.TestCase):
+
+    def test_build_and_probe(self) -> None:
+        matrix = random_vectors(200)
+        ivf_index = IVFIndex.build(matrix, n_lists=8)
+
+        self.assertEqual(ivf_index.n_lists, 8)
+        self.assertEqual(sorted(ivf_index.list_rows.tolist()), list(range(200)))
+
+        # Probing every list gives every row.
+        rows = ivf_index.probe(matrix[0], n_probe=8)
+        self.assertEqual(sorted(rows.tolist()), list(range(200)))
+
+    def test_build_without_rows(self) -> None:
+        ivf_index = IVFIndex.build(np.zeros((0, DIM), dtype=np.float32))
+
+        self.assertEqual(ivf_index.n_lists, 0)
+        self.assertEqual(len(ivf_index.probe(random_vectors(1)[0], n_probe=8)), 0)
+
+    def test_persist_after_deleting_every_row(self) -> None:
+        store = NumpyVectorStore()
+        store.set_index_type('ivf')
+
+        store.add([
+            TextNode(
+                id_=f"node_{i}",
+                text="x",
+                embedding=vector.tolist(),
+                relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id="file.py")},
+            )
+            for i, vector in enumerate(random_vectors(20))
+        ])
+        store.delete("file.py")
+
+        with tempfile.TemporaryDirectory() as persist_dir:
+            store.persist(os.path.join(persist_dir, "default__vector_store.json"))
+
+            loaded = NumpyVectorStore.from_persist_dir(persist_dir)
+            result = loaded.query(VectorStoreQuery(
+                query_embedding=random_vectors(1)[0].tolist(), similarity_top_k=3))
+
+        self.assertEqual(result.ids, [])
+
+    def test_persist_without_ever_adding_rows(self) -> None:
+        store = NumpyVectorStore()
+        store.set_index_type('ivf')
+
+        with tempfile.TemporaryDirectory() as persist_dir:
+            persist_path = os.path.join(persist_dir, "default__vector_store.json")
+            store.persist(persist_path)
+
+            loaded = NumpyVectorStore.from_persist_dir(persist_dir)
+            self.assertEqual(loaded._ivf.n_lists, 0)  # type: ignore
+
+            # Updated once the repo has files, the IVF index is rebuilt.
+            vectors = random_vectors(50)
+            loaded.add([
+                TextNode(id_=f"node_{i}", text="x", embedding=vector.tolist())
+                for i, vector in enumerate(vectors)
+            ])
+            loaded.persist(persist_path)
+
+            # Without its IVF file, a store builds the index on query.
+            os.remove(os.path.join(persist_dir, "ivf_index.npz"))
+            reloaded = NumpyVectorStore.from_persist_dir(persist_dir)
+            result = reloaded.query(VectorStoreQuery(
+                query_embedding=vectors[7].tolist(), similarity_top_k=1))
+
+        self.assertEqual(result.ids, ["node_7"])
+        self.assertGreater(reloaded._ivf.n_lists, 0)  # type: ignore
+
+    def test_concurrent_queries_with_n_probe_per_query(self) -> None:
+        store = NumpyVectorStore()
+        store.set_index_type('ivf', ivf_n_lists=16)
+
+        vectors = random_vectors(2000)
+        store.add([
+            TextNode(id_=f"node_{i}", text="x", embedding=vector.tolist())
+            for i, vector in enumerate(vectors)
+        ])
+
+        queries = random_vectors(32, seed=1)
+        exact_ids = [
+            [f"node_{row}" for row in np.argsort(-(vectors @ query))[:10]]
+            for query in queries
+        ]
+
+        def search(query: np.ndarray, n_probe: int) -> list[str]:
+            return store.query(
+                VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=10),
+                ivf_n_probe=n_probe,
+            ).ids  # type: ignore
+
+        # The first queries consolidate the additions and build the IVF
+        # index concurrently; probing every list is exact search.
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda query: search(query, 16), queries))
+
+        self.assertEqual(results, exact_ids)
+        self.assertEqual(store.ivf_n_probe, 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
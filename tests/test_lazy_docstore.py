@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from vecdb_modules.lazy_docstore import DOCSTORE_DATA_FNAME, OffsetKVStore
+
+
+class OffsetKVStoreTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+
+        self.data_path = os.path.join(tmp_dir.name, DOCSTORE_DATA_FNAME)
+
+    def test_puts_are_spilled_to_disk(self) -> None:
+        kvstore = OffsetKVStore(spill_dir=os.path.dirname(self.data_path))
+
+        vals = {f"node_{i}": {"text": "x" * 1000, "i": i} for i in range(100)}
+        for key, val in vals.items():
+            kvstore.put(key, val)
+
+        # Only offsets into the spill file are kept in memory.
+        offset, length = kvstore._spilled["data"]["node_7"]
+        kvstore._spill_file.seek(offset)  # type: ignore
+        self.assertEqual(len(kvstore._spill_file.read(length)), length)  # type: ignore
+        self.assertEqual(kvstore.get("node_42"), vals["node_42"])
+
+        kvstore.delete("node_0")
+        kvstore.put("node_1", {"text": "overwritten"})
+        kvstore.persist(self.data_path)
+
+        self.assertEqual(kvstore._spilled, {})
+        self.assertIsNone(kvstore._spill_file)
+
+        loaded = OffsetKVStore(self.data_path)
+        self.assertIsNone(loaded.get("node_0"))
+        self.assertEqual(loaded.get("node_1"), {"text": "overwritten"})
+        self.assertEqual(len(loaded.get_all()), 99)
+
+    def test_update_a_persisted_store(self) -> None:
+        kvstore = OffsetKVStore()
+        kvstore.put("a", {"v": 1})
+        kvstore.put("b", {"v": 2})
+        kvstore.persist(self.data_path)
+
+        loaded = OffsetKVStore(self.data_path)
+        self.assertTrue(loaded.delete("a"))
+        self.assertFalse(loaded.delete("a"))
+        loaded.put("c", {"v": 3})
+
+        self.assertIsNone(loaded.get("a"))
+        self.assertEqual(sorted(loaded.get_all()), ["b", "c"])
+
+        loaded.put("a", {"v": 4})
+        loaded.persist(self.data_path)
+
+        self.assertEqual(
+            OffsetKVStore(self.data_path).get_all(),
+            {"b": {"v": 2}, "c": {"v": 3}, "a": {"v": 4}})
+
+
+if __name__ == "__main__":
+    unittest.main()
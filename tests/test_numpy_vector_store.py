@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from vecdb_modules.numpy_vector_store import NumpyVectorStore
+from vecdb_modules.vecdbv2 import VecDB
+
+
+DIM = 8
+
+
+def make_nodes(n_nodes: int, ref_doc_id: str, seed: int = 0) -> list[TextNode]:
+    vectors = np.random.default_rng(seed).normal(size=(n_nodes, DIM))
+    return [
+        TextNode(
+            id_=f"{ref_doc_id}_{i}",
+            text="x",
+            embedding=vector.tolist(),
+            relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=ref_doc_id)},
+        )
+        for i, vector in enumerate(vectors)
+    ]
+
+
+class NumpyVectorStoreTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+
+        self.tmp_dir = tmp_dir.name
+
+    def persist_and_load(self, store: NumpyVectorStore, name: str) -> NumpyVectorStore:
+        persist_dir = os.path.join(self.tmp_dir, name)
+
+        store.persist(os.path.join(persist_dir, "default__vector_store.json"))
+        return NumpyVectorStore.from_persist_dir(persist_dir)
+
+    def query_ids(self, store: NumpyVectorStore, node: TextNode) -> list[str]:
+        return store.query(VectorStoreQuery(
+            query_embedding=node.get_embedding(), similarity_top_k=1)).ids  # type: ignore
+
+    def test_update_an_empty_index(self) -> None:
+        for quantization in (None, 'int8', 'binary'):
+            with self.subTest(quantization=quantization):
+                # A repo without supported files is indexed without rows.
+                store = self.persist_and_load(
+                    NumpyVectorStore(quantization=quantization), str(quantization))
+                self.assertEqual(self.query_ids(store, make_nodes(1, "any.py")[0]), [])
+
+                nodes = make_nodes(5, "new.py")
+                store.add(nodes)
+                store = self.persist_and_load(store, str(quantization))
+
+                self.assertEqual(store._matrix.shape, (5, DIM))  # type: ignore
+                self.assertEqual(store._codes is not None, quantization is not None)
+                self.assertEqual(self.query_ids(store, nodes[3]), [nodes[3].node_id])
+
+    def test_rebuild_keeps_persisted_settings(self) -> None:
+        store = NumpyVectorStore(quantization='int8')
+        store.set_index_type('ivf', ivf_n_lists=4)
+        store.ivf_n_probe = 2
+        store.add(make_nodes(20, "file.py"))
+        self.persist_and_load(store, "owner/repo")
+
+        # Jobs rebuild with the VecDB defaults.
+        vecdb = VecDB("owner/repo", persist_directory=self.tmp_dir)
+        rebuilt = vecdb.get_vector_store(os.path.join(self.tmp_dir, "owner/repo"))
+
+        self.assertEqual(
+            (rebuilt.quantization, rebuilt.index_type, rebuilt.ivf_n_lists, rebuilt.ivf_n_probe),
+            ('int8', 'ivf', 4, 2))
+
+        # Settings given to the VecDB win.
+        vecdb = VecDB("owner/repo", persist_directory=self.tmp_dir, index_type='flat')
+        rebuilt = vecdb.get_vector_store(os.path.join(self.tmp_dir, "owner/repo"))
+
+        self.assertEqual((rebuilt.quantization, rebuilt.index_type), ('int8', 'flat'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+"""
+Clones, pulls and diffs a local bare repository in every clone mode.
+
+Run from the repo root with:
+    python -m unittest discover tests
+"""
+import os
+import subprocess
+import tempfile
+import unittest
+
+from repo_cloner import RepoCloner
+
+
+SETTINGS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "settings")
+
+MAX_FILE_SIZE = 10_000
+
+
+def git(*args: str, cwd: str) -> str:
+    return subprocess.run(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@test', *args],
+        cwd=cwd, check=True, capture_output=True, text=True,
+    ).stdout
+
+
+def commit_files(src_dir: str, files: dict[str, str | None], message: str) -> str:
+    """Write (or delete, for None) files and commit them, returning the commit."""
+
+    for path, content in files.items():
+        file_path = os.path.join(src_dir, path)
+        if content is None:
+            os.remove(file_path)
+            continue
+
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'w') as f:
+            f.write(content)
+
+    git('add', '-A', cwd=src_dir)
+    git('commit', '-qm', message, cwd=src_dir)
+
+    return git('rev-parse', 'HEAD', cwd=src_dir).strip()
+
+
+class RepoClonerModesTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+
+        self.saved_paths = (
+            RepoCloner.repo_registry_path,
+            RepoCloner.repo_infos_path,
+            RepoCloner.supported_files_path,
+        )
+        RepoCloner.repo_registry_path = os.path.join(self.tmp_dir, "repo_infos.sqlite")
+        RepoCloner.repo_infos_path = os.path.join(self.tmp_dir, "repo_infos.json")
+        RepoCloner.supported_files_path = os.path.join(SETTINGS_DIR, "supported_files.json")
+
+        # Upstream: a few commits, with a supported file over MAX_FILE_SIZE,
+        # an unsupported one, and a path needing sparse pattern escaping.
+        self.src_dir = os.path.join(self.tmp_dir, "src")
+        git('init', '-q', '-b', 'main', self.src_dir, cwd=self.tmp_dir)
+
+        for i in range(3):
+            self.first_commit = commit_files(
+                self.src_dir,
+                {
+                    "main.py": f"def main():\n    return {i}\n",
+                    "pkg dir/mod [1].py": f"x = {i}\n",
+                    "huge.py": "# " + "y" * MAX_FILE_SIZE + f"{i}\n",
+                    "asset.bin": "z" * 100 + f"{i}\n",
+                },
+                f"commit {i}"
+            )
+
+        self.bare_dir = os.path.join(self.tmp_dir, "srv", "owner", "repo.git")
+        git('clone', '-q', '--bare', self.src_dir, self.bare_dir, cwd=self.tmp_dir)
+        git('config', 'uploadpack.allowFilter', 'true', cwd=self.bare_dir)
+
+    def tearDown(self) -> None:
+        registry = RepoCloner._registry
+        if registry is not None and registry.db_path == RepoCloner.repo_registry_path:
+            registry._conn.close()
+            RepoCloner._registry = None
+
+        (
+            RepoCloner.repo_registry_path,
+            RepoCloner.repo_infos_path,
+            RepoCloner.supported_files_path,
+        ) = self.saved_paths
+
+        RepoCloner.remove_dir(self.tmp_dir)
+
+    def clone(self, mode: str) -> RepoCloner:
+        return RepoCloner(
+            self.bare_dir,
+            repos_dir_path=os.path.join(self.tmp_dir, f"repos_{mode}"),
+            clone_mode=mode,
+            max_file_size=MAX_FILE_SIZE,
+        )
+
+    def push_next_commit(self) -> str:
+        git('mv', 'asset.bin', 'données.bin', cwd=self.src_dir)
+
+        new_commit = commit_files(
+            self.src_dir,
+            {
+                "main.py": "def main():\n    return 'next'\n",
+                "new_file.md": "# new\n",
+                "café.py": "x = 'café'\n",
+                "huge.py": "small = 1\n",
+                "pkg dir/mod [1].py": None,
+            },
+            "next commit"
+        )
+        git('push', '-q', self.bare_dir, 'main', cwd=self.src_dir)
+
+        return new_commit
+
+    def test_clone_modes(self) -> None:
+        for mode in RepoCloner.CLONE_MODES:
+            with self.subTest(mode=mode):
+                rc = self.clone(mode)
+
+                self.assertEqual(rc.repo_name, "owner/repo")
+                self.assertEqual(rc.commit_hash, self.first_commit)
+                self.assertEqual(RepoCloner.get_repo_info(rc.repo_name)['clone_mode'], mode)
+
+                is_shallow = git(
+                    'rev-parse', '--is-shallow-repository', cwd=rc.target_dir).strip()
+                self.assertEqual(is_shallow, str(mode in ('shallow', 'sparse')).lower())
+
+                checked_out = set(os.listdir(rc.target_dir)) - {'.git'}
+                self.assertTrue({"main.py", "pkg dir"} <= checked_out)
+
+                if mode == 'sparse':
+                    # Oversized and unsupported files are left out.
+                    self.assertNotIn("huge.py", checked_out)
+                    self.assertNotIn("asset.bin", checked_out)
+                    self.assertEqual(rc.list_missing_blobs(), {
+                        oid for path, oid in rc.list_tree() if path == "huge.py"})
+                else:
+                    self.assertTrue({"huge.py", "asset.bin"} <= checked_out)
+
+                if mode == 'blobless':
+                    self.assertEqual(git(
+                        'config', 'remote.origin.partialclonefilter', cwd=rc.target_dir).strip(),
+                        'blob:none')
+
+                RepoCloner.get_registry().remove(rc.repo_name)
+
+    def test_pull_and_diff(self) -> None:
+        clones = {mode: self.clone(mode) for mode in RepoCloner.CLONE_MODES}
+        new_commit = self.push_next_commit()
+
+        for mode, old_rc in clones.items():
+            with self.subTest(mode=mode):
+                RepoCloner.get_registry().upsert(
+                    old_rc.repo_name,
+                    repo_path=old_rc.target_dir,
+                    clone_mode=mode,
+                    commit_hash=old_rc.commit_hash,
+                )
+
+                # An existing clone keeps its mode, whatever is asked.
+                rc = RepoCloner(
+                    self.bare_dir,
+                    repos_dir_path=old_rc.repos_dir_path,
+                    clone_mode='full',
+                    max_file_size=MAX_FILE_SIZE,
+                )
+
+                self.assertEqual(rc.clone_mode, mode)
+                self.assertEqual(rc.prev_commit_hash, self.first_commit)
+                self.assertEqual(rc.commit_hash, new_commit)
+
+                changes = RepoCloner.get_changed_files(
+                    rc.target_dir, rc.prev_commit_hash, rc.commit_hash)  # type: ignore
+                self.assertEqual(changes, dict(
+                    added=["café.py", "new_file.md"],
+                    modified=["huge.py", "main.py"],
+                    deleted=["pkg dir/mod [1].py"],
+                    renamed=[("asset.bin", "données.bin")],
+                ))
+
+                checked_out = set(os.listdir(rc.target_dir)) - {'.git'}
+                self.assertTrue({"main.py", "new_file.md", "café.py", "huge.py"} <= checked_out)
+                self.assertNotIn("pkg dir", checked_out)
+
+                with open(os.path.join(rc.target_dir, "main.py")) as f:
+                    self.assertIn("'next'", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
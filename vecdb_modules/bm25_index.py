@@ -0,0 +1,254 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter
+from typing import Iterable, Sequence
+
+import numpy as np
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+
+from vecdb_modules.quantization import top_k_rows
+
+
+BM25_POSTINGS_FNAME = "bm25_postings.npz"
+BM25_VOCAB_FNAME = "bm25_vocab.json"
+
+IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|\d+')
+CAMEL_CASE_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Code-aware tokens: every identifier as a whole, plus its camelCase and
+    snake_case parts, lowercased. `getHTTPResponse_code` gives
+    gethttpresponse_code, get, http, response, code.
+    """
+    tokens = []
+    for identifier in IDENTIFIER_PATTERN.findall(text):
+        tokens.append(identifier.lower())
+
+        parts = [
+            part.lower()
+            for word in identifier.split('_')
+            for part in CAMEL_CASE_PATTERN.findall(word)
+        ]
+        if len(parts) > 1:
+            tokens.extend(parts)
+
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunks of a repo, for exact identifier matches
+    (function names, config keys, error strings) embeddings tend to miss.
+
+    Postings are kept as flat arrays, a term's (rows, term frequencies)
+    being one slice of them. Adding or deleting chunks switches to a
+    dict of postings and lists of the per chunk values, frozen back into
+    arrays on the next query or persist. Sessions share the index, so the
+    freeze runs under a lock and queries search the frozen arrays.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = .75) -> None:
+        self.k1 = k1
+        self.b = b
+
+        self._ids: list[str] = []
+        # Arrays while frozen, lists while the postings are a dict.
+        self._doc_lens: np.ndarray | list[int] = np.zeros(0, dtype=np.int32)
+        self._alive: np.ndarray | list[bool] = np.zeros(0, dtype=bool)
+        self._id_rows: dict[str, int] | None = None
+
+        # Frozen postings.
+        self._terms: dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int32)
+        self._tfs = np.zeros(0, dtype=np.uint16)
+
+        # Mutable postings: {term: {row: tf}}, None while frozen.
+        self._postings: dict[str, dict[int, int]] | None = None
+
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._alive))
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, BM25_POSTINGS_FNAME))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> "BM25Index":
+        with open(os.path.join(persist_dir, BM25_VOCAB_FNAME), 'r') as f:
+            vocab = json.loads(f.read())
+
+        index = cls(k1=vocab['k1'], b=vocab['b'])
+        index._ids = vocab['ids']
+        index._terms = {term: i for i, term in enumerate(vocab['terms'])}
+
+        with np.load(os.path.join(persist_dir, BM25_POSTINGS_FNAME)) as postings:
+            index._doc_lens = postings['doc_lens']
+            index._offsets = postings['offsets']
+            index._rows = postings['rows']
+            index._tfs = postings['tfs']
+
+        index._alive = np.ones(len(index._ids), dtype=bool)
+
+        return index
+
+    @classmethod
+    def from_docstore(cls, docstore: BaseDocumentStore) -> "BM25Index":
+        """Build the index of a vecdb persisted before BM25 was added."""
+
+        index = cls()
+        index.add_nodes(list(docstore.docs.values()))
+        return index
+
+    def _thaw(self) -> None:
+        if self._postings is not None:
+            return
+
+        self._postings = {
+            term: dict(zip(
+                self._rows[self._offsets[i]: self._offsets[i + 1]].tolist(),
+                self._tfs[self._offsets[i]: self._offsets[i + 1]].tolist()
+            ))
+            for term, i in self._terms.items()
+        }
+        self._doc_lens = self._doc_lens.tolist()  # type: ignore
+        self._alive = self._alive.tolist()  # type: ignore
+
+    def _freeze(self) -> None:
+        """Pack the dict postings into arrays, dropping deleted rows."""
+
+        if self._postings is None:
+            return
+
+        self._doc_lens = np.asarray(self._doc_lens, dtype=np.int32)
+        self._alive = np.asarray(self._alive, dtype=bool)
+
+        new_rows = np.cumsum(self._alive) - 1
+
+        terms, offsets, rows, tfs = {}, [0], [], []
+        for term, term_postings in self._postings.items():
+            alive_postings = [
+                (new_rows[row], tf)
+                for row, tf in term_postings.items() if self._alive[row]
+            ]
+            if not alive_postings:
+                continue
+
+            terms[term] = len(terms)
+            rows.extend(row for row, _ in alive_postings)
+            tfs.extend(tf for _, tf in alive_postings)
+            offsets.append(len(rows))
+
+        self._terms = terms
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        self._rows = np.asarray(rows, dtype=np.int32)
+        self._tfs = np.minimum(np.asarray(tfs, dtype=np.int64), 65535).astype(np.uint16)
+
+        self._ids = [
+            node_id for node_id, is_alive in zip(self._ids, self._alive) if is_alive]
+        self._doc_lens = self._doc_lens[self._alive]
+        self._alive = np.ones(len(self._ids), dtype=bool)
+
+        self._id_rows = None
+        self._postings = None
+
+    def add(self, node_id: str, text: str) -> None:
+        self._thaw()
+
+        row = len(self._ids)
+        tokens = tokenize(text)
+
+        for term, tf in Counter(tokens).items():
+            self._postings.setdefault(term, {})[row] = tf  # type: ignore
+
+        self._ids.append(node_id)
+        self._doc_lens.append(len(tokens))  # type: ignore
+        self._alive.append(True)  # type: ignore
+
+        if self._id_rows is not None:
+            self._id_rows[node_id] = row
+
+    def add_nodes(self, nodes: Sequence[BaseNode]) -> None:
+        for node in nodes:
+            self.add(node.node_id, node.get_content(MetadataMode.NONE))
+
+    def delete(self, node_ids: Iterable[str]) -> None:
+        if self._id_rows is None:
+            self._id_rows = {node_id: i for i, node_id in enumerate(self._ids)}
+
+        for node_id in node_ids:
+            row = self._id_rows.get(node_id)
+            if row is not None and self._alive[row]:
+                self._thaw()
+                self._alive[row] = False
+
+    def query(self, text: str, top_k: int) -> list[tuple[str, float]]:
+        """Top `top_k` (node id, BM25 score), only chunks matching a token."""
+
+        # Freezing replaces the arrays rather than editing them.
+        with self._lock:
+            self._freeze()
+            ids, doc_lens, terms = self._ids, self._doc_lens, self._terms
+            offsets, all_rows, all_tfs = self._offsets, self._rows, self._tfs
+
+        n_docs = len(ids)
+        if not n_docs:
+            return []
+
+        avg_doc_len = max(float(doc_lens.mean()), 1.)
+        length_norm = self.k1 * (1 - self.b + self.b * doc_lens / avg_doc_len)
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term in set(tokenize(text)):
+            i = terms.get(term)
+            if i is None:
+                continue
+
+            rows = all_rows[offsets[i]: offsets[i + 1]]
+            tfs = all_tfs[offsets[i]: offsets[i + 1]].astype(np.float32)
+
+            idf = math.log(1 + (n_docs - len(rows) + .5) / (len(rows) + .5))
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + length_norm[rows])
+
+        top_rows = [row for row in top_k_rows(scores, top_k) if scores[row] > 0]
+
+        return [(ids[row], float(scores[row])) for row in top_rows]
+
+    def persist(self, persist_dir: str) -> None:
+        with self._lock:
+            self._freeze()
+        os.makedirs(persist_dir, exist_ok=True)
+
+        postings_path = os.path.join(persist_dir, BM25_POSTINGS_FNAME)
+        vocab_path = os.path.join(persist_dir, BM25_VOCAB_FNAME)
+
+        with open(postings_path + '.tmp', 'wb') as f:
+            np.savez(
+                f,
+                doc_lens=self._doc_lens,
+                offsets=self._offsets,
+                rows=self._rows,
+                tfs=self._tfs,
+            )
+
+        with open(vocab_path + '.tmp', 'w') as f:
+            json.dump(
+                dict(
+                    k1=self.k1,
+                    b=self.b,
+                    ids=self._ids,
+                    terms=list(self._terms),
+                ),
+                f
+            )
+
+        os.replace(postings_path + '.tmp', postings_path)
+        os.replace(vocab_path + '.tmp', vocab_path)
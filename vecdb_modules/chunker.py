@@ -0,0 +1,114 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from langchain_text_splitters import (
+    Language,
+    RecursiveCharacterTextSplitter,
+)
+
+
+TEXT_SPLITTER_KEY = 'text'
+
+# Names of `supported_files_names.json` langchain knows by another value.
+LANGUAGE_ALIASES = {
+    'javascript': Language.JS.value,
+    'typescript': Language.TS.value,
+}
+
+# One splitter per language and process, built on first use.
+_splitters: dict[str, RecursiveCharacterTextSplitter] = {}
+
+
+def get_splitter(code_lang: str) -> RecursiveCharacterTextSplitter:
+
+    splitter = _splitters.get(code_lang)
+    if splitter is not None:
+        return splitter
+
+    if code_lang == TEXT_SPLITTER_KEY:
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1024, chunk_overlap=50)
+
+    else:
+        try:
+            splitter = RecursiveCharacterTextSplitter.from_language(
+                language=Language(LANGUAGE_ALIASES.get(code_lang, code_lang)),
+                chunk_size=1500, chunk_overlap=100
+            )
+        except ValueError:
+            # Languages langchain has no separators for are split as
+            # plain text, with the code chunk sizes.
+            splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1500, chunk_overlap=100)
+
+    _splitters[code_lang] = splitter
+    return splitter
+
+
+def split_text(item: tuple[str, str]) -> list[str]:
+    code_lang, text = item
+    return get_splitter(code_lang).split_text(text)
+
+
+class ChunkingEngine:
+    """
+    Splits file texts into chunks with one cached splitter per language.
+
+    Batches of at least `min_parallel_files` files are fanned out over a
+    process pool; results keep the input order, so chunk order and
+    metadata are the same as when splitting serially. Its workers are
+    spawned, not forked: splits run from threads of the Streamlit server
+    and the job queue, and forking a threaded process can deadlock.
+    """
+
+    def __init__(
+        self,
+        supported_files_types_names: dict[str, str],
+        num_workers: int | None = None,
+        min_parallel_files: int = 64,
+    ) -> None:
+
+        self.supported_files_types_names = supported_files_types_names
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.min_parallel_files = min_parallel_files
+
+        self._pool: ProcessPoolExecutor | None = None
+
+    def get_code_lang(self, file_name: str) -> str:
+        file_ex = '.' + file_name.split('.')[-1]
+
+        if file_ex == '.txt':
+            return TEXT_SPLITTER_KEY
+
+        return self.supported_files_types_names.get(file_ex, TEXT_SPLITTER_KEY)
+
+    def split(self, files: list[tuple[str, str]]) -> list[list[str]]:
+        """
+        Args:
+            files (list): (file_name, text) pairs
+
+        Returns:
+            list: the chunk texts of every file, in the input order
+        """
+        items = [
+            (self.get_code_lang(file_name), text)
+            for file_name, text in files
+        ]
+
+        if self.num_workers < 2 or len(items) < self.min_parallel_files:
+            return [split_text(item) for item in items]
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+
+        chunksize = max(1, len(items) // (self.num_workers * 4))
+        return list(self._pool.map(split_text, items, chunksize=chunksize))
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,207 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+
+EmbedFn = Callable[[list[str]], list[list[float]]]
+
+
+def is_throttle_error(error: Exception) -> bool:
+    """Whether the embedding provider rejected a request for rate limiting."""
+
+    if getattr(error, 'status_code', None) == 429:
+        return True
+
+    error_text = f'{type(error).__name__} {error}'.lower()
+    return (
+        'toomanyrequests' in error_text
+        or 'rate limit' in error_text
+        or ' 429' in error_text
+    )
+
+
+def get_retry_after(error: Exception) -> float | None:
+    headers = getattr(error, 'headers', None) or {}
+
+    try:
+        return float(headers.get('retry-after') or headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    Caps the number of in-flight requests, halving the cap when the provider
+    throttles and raising it by one after a cap-sized streak of successes.
+    """
+
+    def __init__(self, max_limit: int) -> None:
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+
+        self.in_flight = 0
+        self.successes = 0
+
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+
+            if throttled:
+                self.limit = max(1., self.limit / 2)
+                self.successes = 0
+
+            else:
+                self.successes += 1
+                if self.successes >= int(self.limit):
+                    self.limit = min(float(self.max_limit), self.limit + 1)
+                    self.successes = 0
+
+            self._cond.notify_all()
+
+
+class EmbeddingScheduler:
+    """
+    Embeds texts through `embed_fn` in token-bounded batches, with up to
+    `max_concurrency` requests in flight.
+
+    Throttled (429) requests are retried with exponential backoff (or the
+    provider's Retry-After) while the allowed concurrency backs off, so a
+    long ingestion runs close to the provider quota without failing.
+    """
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn,
+        max_batch_size: int = 96,
+        max_batch_tokens: int = 20_000,
+        max_concurrency: int = 4,
+        max_retries: int = 8,
+        backoff_base: float = 1.,
+        backoff_max: float = 60.,
+    ) -> None:
+
+        self.embed_fn = embed_fn
+
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.limiter = AdaptiveLimiter(max_limit=max_concurrency)
+
+        self._stats_lock = threading.Lock()
+        self.n_chunks = 0
+        self.n_requests = 0
+        self.n_throttled = 0
+        self.busy_seconds = 0.
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        return len(text) // 4 + 1
+
+    def pack_batches(self, texts: list[str]) -> list[list[int]]:
+        """Group text indices into batches under the size and token limits."""
+
+        batches: list[list[int]] = []
+        batch: list[int] = []
+        batch_tokens = 0
+
+        for i, text in enumerate(texts):
+            n_tokens = self.estimate_tokens(text)
+
+            if batch and (
+                len(batch) == self.max_batch_size
+                or batch_tokens + n_tokens > self.max_batch_tokens
+            ):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+
+            batch.append(i)
+            batch_tokens += n_tokens
+
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+
+            try:
+                embeddings = self.embed_fn(texts)
+
+            except Exception as e:
+                throttled = is_throttle_error(e)
+                self.limiter.release(throttled=throttled)
+
+                if not throttled or attempt == self.max_retries:
+                    raise
+
+                with self._stats_lock:
+                    self.n_throttled += 1
+
+                backoff = get_retry_after(e) or min(
+                    self.backoff_max, self.backoff_base * 2 ** attempt)
+                time.sleep(backoff * (.5 + random.random()))
+                continue
+
+            self.limiter.release()
+
+            with self._stats_lock:
+                self.n_requests += 1
+
+            return embeddings
+
+        raise Exception("Embedding retries exhausted.")
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+
+        start_time = time.perf_counter()
+
+        batches = self.pack_batches(texts)
+        embeddings: list[list[float]] = [[] for _ in texts]
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            batches_embeddings = executor.map(
+                lambda batch: self._embed_batch([texts[i] for i in batch]),
+                batches
+            )
+
+            for batch, batch_embeddings in zip(batches, batches_embeddings):
+                for i, embedding in zip(batch, batch_embeddings):
+                    embeddings[i] = embedding
+
+        with self._stats_lock:
+            self.n_chunks += len(texts)
+            self.busy_seconds += time.perf_counter() - start_time
+
+        return embeddings
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            return dict(
+                chunks=self.n_chunks,
+                requests=self.n_requests,
+                throttled=self.n_throttled,
+                concurrency=int(self.limiter.limit),
+                chunks_per_sec=round(
+                    self.n_chunks / self.busy_seconds, 2) if self.busy_seconds else 0.,
+            )
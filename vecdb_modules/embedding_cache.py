@@ -0,0 +1,389 @@
+import os
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from vecdb_modules.embed_scheduler import EmbeddingScheduler
+
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed cache of chunk embeddings.
+
+    Vectors are keyed by hash(chunk text, embedding model, input_type), so
+    the same chunk is embedded once no matter how many rebuilds or repos
+    (forks, vendored libs...) it shows up in. The least recently used
+    entries are evicted once the cache holds more than `max_entries`.
+    """
+
+    def __init__(
+        self,
+        db_path: str = os.path.join("vec_db", "embedding_cache.sqlite"),
+        max_entries: int = 500_000,
+    ) -> None:
+
+        self.db_path = db_path
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)"
+            )
+
+    @staticmethod
+    def make_key(text: str, model_name: str, input_type: str) -> str:
+        key_src = f'{model_name}\x00{input_type}\x00{text}'
+        return hashlib.sha256(key_src.encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+
+        with self._lock, self._conn:
+            # Stay under SQLite's bound variables limit.
+            for i in range(0, len(unique_keys), 500):
+                keys_batch = unique_keys[i: i + 500]
+                placeholders = ','.join('?' * len(keys_batch))
+
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    keys_batch
+                ).fetchall()
+
+                for key, vector in rows:
+                    found[key] = array('f', vector).tolist()
+
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})",
+                        [time.time(), *keys_batch]
+                    )
+
+            hits = sum(key in found for key in keys)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        return found
+
+    def put_many(self, items: dict[str, list[float]]) -> None:
+        if not items:
+            return
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [
+                    (key, array('f', vector).tobytes(), now)
+                    for key, vector in items.items()
+                ]
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = self._conn.execute(
+            "SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+        if entries <= self.max_entries:
+            return
+
+        # Evict down to 90% of the bound, so eviction doesn't run on every put.
+        n_evict = entries - int(self.max_entries * .9)
+        self._conn.execute(
+            """
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_used LIMIT ?
+            )
+            """,
+            (n_evict,)
+        )
+        self.evictions += n_evict
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            entries, size_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            ).fetchone()
+
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=round(self.hits / lookups, 4) if lookups else 0.0,
+            evictions=self.evictions,
+            entries=entries,
+            size_mb=round(size_bytes / 2**20, 2),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps a document embedding model, embedding only the texts missing from
+    the `EmbeddingCache` and writing the new vectors back to it.
+
+    When a `scheduler` is given the misses are embedded through it, so the
+    wrapper can take batches larger than the provider's request limit.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _scheduler: EmbeddingScheduler | None = PrivateAttr()
+    _input_type: str = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache: EmbeddingCache,
+        scheduler: EmbeddingScheduler | None = None,
+        **kwargs: Any
+    ) -> None:
+
+        kwargs.setdefault('embed_batch_size', embed_model.embed_batch_size)
+
+        super().__init__(
+            model_name=embed_model.model_name,
+            **kwargs
+        )
+
+        self._embed_model = embed_model
+        self._cache = cache
+        self._scheduler = scheduler
+        self._input_type = getattr(embed_model, 'input_type', None) or ''
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _make_keys(self, texts: List[str]) -> list[str]:
+        return [
+            EmbeddingCache.make_key(text, self.model_name, self._input_type)
+            for text in texts
+        ]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys = self._make_keys(texts)
+        embeddings = self._cache.get_many(keys)
+
+        missing_ids = [i for i, key in enumerate(keys) if key not in embeddings]
+        if missing_ids:
+            missing_texts = [texts[i] for i in missing_ids]
+
+            if self._scheduler is not None:
+                new_embeddings = self._scheduler.embed(missing_texts)
+            else:
+                new_embeddings = self._embed_model._get_text_embeddings(
+                    missing_texts)
+
+            new_items = {
+                keys[i]: embedding
+                for i, embedding in zip(missing_ids, new_embeddings)
+            }
+            self._cache.put_many(new_items)
+            embeddings.update(new_items)
+
+        return [embeddings[key] for key in keys]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys = self._make_keys(texts)
+        embeddings = self._cache.get_many(keys)
+
+        missing_ids = [i for i, key in enumerate(keys) if key not in embeddings]
+        if missing_ids:
+            missing_texts = [texts[i] for i in missing_ids]
+
+            if self._scheduler is not None:
+                new_embeddings = await asyncio.to_thread(
+                    self._scheduler.embed, missing_texts)
+            else:
+                new_embeddings = await self._embed_model._aget_text_embeddings(
+                    missing_texts)
+
+            new_items = {
+                keys[i]: embedding
+                for i, embedding in zip(missing_ids, new_embeddings)
+            }
+            self._cache.put_many(new_items)
+            embeddings.update(new_items)
+
+        return [embeddings[key] for key in keys]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed_model._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._embed_model._aget_query_embedding(query)
+
+
+class QueryEmbeddingCache:
+    """
+    In-memory LRU cache of query embeddings, shared by every session of the
+    process, with a time to live so a changed model never serves stale
+    vectors for long.
+
+    Keys are (model name, input type, normalized query): queries differing
+    only in case or whitespace share an entry.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 24 * 3600.) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, tuple[float, Embedding]] = OrderedDict()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return ' '.join(query.split()).lower()
+
+    def make_key(self, query: str, model_name: str, input_type: str) -> tuple:
+        return (model_name, input_type, self.normalize(query))
+
+    def get(self, key: tuple) -> Embedding | None:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, embedding: Embedding) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=round(self.hits / lookups, 4) if lookups else 0.0,
+            expirations=self.expirations,
+            evictions=self.evictions,
+            entries=len(self._entries),
+        )
+
+
+# Shared by every VecDB of the process.
+QUERY_EMBEDDING_CACHE = QueryEmbeddingCache()
+
+
+class CachedQueryEmbedding(BaseEmbedding):
+    """
+    Wraps a query embedding model, answering repeated queries from a
+    `QueryEmbeddingCache` without the network round-trip.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: QueryEmbeddingCache = PrivateAttr()
+    _input_type: str = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache: QueryEmbeddingCache = QUERY_EMBEDDING_CACHE,
+        **kwargs: Any
+    ) -> None:
+
+        kwargs.setdefault('embed_batch_size', embed_model.embed_batch_size)
+
+        super().__init__(
+            model_name=embed_model.model_name,
+            **kwargs
+        )
+
+        self._embed_model = embed_model
+        self._cache = cache
+        self._input_type = getattr(embed_model, 'input_type', None) or ''
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedQueryEmbedding"
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        key = self._cache.make_key(query, self.model_name, self._input_type)
+
+        embedding = self._cache.get(key)
+        if embedding is None:
+            embedding = self._embed_model._get_query_embedding(query)
+            self._cache.put(key, embedding)
+
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        key = self._cache.make_key(query, self.model_name, self._input_type)
+
+        embedding = self._cache.get(key)
+        if embedding is None:
+            embedding = await self._embed_model._aget_query_embedding(query)
+            self._cache.put(key, embedding)
+
+        return embedding
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed_model._get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await self._embed_model._aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._embed_model._get_text_embeddings(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await self._embed_model._aget_text_embeddings(texts)
@@ -0,0 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+
+def min_max_normalize(nodes: List[NodeWithScore]) -> list[float]:
+    """
+    Scores of a repo's results mapped to [0, 1], so cosine similarities and
+    RRF scores of different repos can be ranked together.
+    """
+    scores = [node.score or 0. for node in nodes]
+    if not scores:
+        return []
+
+    low, high = min(scores), max(scores)
+    if high == low:
+        return [1.] * len(scores)
+
+    return [(score - low) / (high - low) for score in scores]
+
+
+class FederatedRetriever(BaseRetriever):
+    """
+    Queries the retrievers of several repos concurrently and merges their
+    results into one global top k, on per repo min-max normalized scores.
+
+    The query is embedded once and shared by every repo. Each result is a
+    copy of the node tagged with a `repo_name` metadata. A repo whose
+    retrieval fails is left out of the results.
+    """
+
+    def __init__(
+        self,
+        retrievers: dict[str, BaseRetriever],
+        embed_model: BaseEmbedding,
+        similarity_top_k: int = 15,
+        max_workers: int = 8,
+    ) -> None:
+
+        super().__init__()
+
+        self.retrievers = retrievers
+        self.embed_model = embed_model
+        self.similarity_top_k = similarity_top_k
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(min(max_workers, len(retrievers)), 1),
+            thread_name_prefix='federated_retriever')
+
+    def _retrieve_repo(
+        self,
+        repo_name: str,
+        query_bundle: QueryBundle,
+    ) -> List[NodeWithScore]:
+
+        try:
+            return self.retrievers[repo_name].retrieve(query_bundle)
+        except Exception as e:
+            print(f"Federated Retrieval Failed for {repo_name}: {e}")
+            return []
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self.embed_model.get_agg_embedding_from_queries(
+                query_bundle.embedding_strs)
+
+        futures = {
+            repo_name: self._executor.submit(
+                self._retrieve_repo, repo_name, query_bundle)
+            for repo_name in self.retrievers
+        }
+
+        candidates: list[tuple[float, float, str, NodeWithScore]] = []
+        for repo_name, future in futures.items():
+            nodes = future.result()
+
+            for node, norm_score in zip(nodes, min_max_normalize(nodes)):
+                candidates.append((norm_score, node.score or 0., repo_name, node))
+
+        candidates.sort(key=lambda item: (item[0], item[1]), reverse=True)
+
+        return [
+            NodeWithScore(
+                node=node.node.model_copy(
+                    update=dict(metadata={**node.node.metadata, 'repo_name': repo_name})
+                ),
+                score=norm_score
+            )
+            for norm_score, _, repo_name, node in candidates[:self.similarity_top_k]
+        ]
@@ -0,0 +1,219 @@
+import os
+import subprocess
+import threading
+from typing import Iterator, NamedTuple
+
+from repo_cloner import RepoCloner
+from repo_walker import DEFAULT_EXCLUDE_FILES, ExcludeMatcher
+
+
+# Regular and executable files; symlinks and submodules aren't read.
+FILE_MODES = ('100644', '100755')
+
+# Git's own binary heuristic: a NUL byte in the first 8000 bytes.
+BINARY_SNIFF_SIZE = 8000
+
+# Headers of files written by code generators.
+GENERATED_MARKERS = (b'@generated', b'DO NOT EDIT', b'Code generated by')
+GENERATED_SNIFF_SIZE = 1024
+
+
+class GitBlob(NamedTuple):
+    path: str  # relative to the repo root, '/' separated
+    oid: str
+    size: int
+
+
+class GitBlobReader:
+    """
+    Reads the files of a commit from the repo's object database, without
+    checking it out: the tracked files are listed with `git ls-tree`, and
+    their contents streamed through one persistent `git cat-file --batch`.
+
+    Binary, generated, and over `max_file_size` files are skipped. Blobs a
+    `blob:limit` partial clone left out are oversized, and skipped without
+    fetching them; other missing blobs are fetched by git on read.
+    """
+
+    def __init__(
+        self,
+        repo_path: str,
+        commit: str = 'HEAD',
+        max_file_size: int | None = 1_000_000,
+    ) -> None:
+
+        self.repo_path = repo_path
+        self.max_file_size = max_file_size
+
+        self.commit_hash = RepoCloner.run_git(
+            'rev-parse', '--verify', f'{commit}^{{commit}}', cwd=repo_path).strip()
+
+        self.generated_matcher = ExcludeMatcher([], DEFAULT_EXCLUDE_FILES)
+
+        # Files skipped by the last `list_files` and `iter_blobs`, by reason.
+        self.skipped = dict(missing=0, oversized=0, generated=0, binary=0)
+        self.n_blobs_read = 0
+
+        self._lock = threading.Lock()
+        self._process: subprocess.Popen | None = None
+
+    def __enter__(self) -> "GitBlobReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def get_commit_date(self) -> str:
+        return RepoCloner.run_git(
+            'show', '-s', '--date=format:%Y-%m-%d %H:%M:%S', '--format=%cd',
+            self.commit_hash, cwd=self.repo_path).strip()
+
+    def list_tree(self) -> list[tuple[str, str]]:
+        """(path, object id) of the regular files of the commit."""
+
+        output = RepoCloner.run_git(
+            'ls-tree', '-r', '-z', '--full-tree', self.commit_hash, cwd=self.repo_path)
+
+        files = []
+        for entry in output.split('\0'):
+            if not entry:
+                continue
+
+            info, path = entry.split('\t', 1)
+            mode, _, oid = info.split()
+            if mode in FILE_MODES:
+                files.append((path, oid))
+
+        return files
+
+    def list_missing_oversized(self) -> set[str]:
+        """Ids of the commit's blobs a `blob:limit` partial clone left out."""
+
+        partial_clone_filter = RepoCloner.run_git(
+            'config', '--default', '', '--get', 'remote.origin.partialclonefilter',
+            cwd=self.repo_path).strip()
+
+        if not partial_clone_filter.startswith('blob:limit='):
+            return set()
+
+        output = RepoCloner.run_git(
+            'rev-list', '--objects', '--no-walk', '--missing=print', self.commit_hash,
+            cwd=self.repo_path)
+
+        return {
+            line[1:].strip()
+            for line in output.splitlines()
+            if line.startswith('?')
+        }
+
+    def read_sizes(self, oids: list[str]) -> list[int]:
+        output = RepoCloner.run_git(
+            'cat-file', '--batch-check=%(objectsize)', cwd=self.repo_path,
+            input=''.join(f'{oid}\n' for oid in oids))
+
+        return [int(size) for size in output.split()]
+
+    def list_files(self, extensions: list[str] | None = None) -> list[GitBlob]:
+        """
+        The files of the commit to read, sorted by path: with one of
+        `extensions` (all if None), not hidden, not named like generated
+        files, and not over `max_file_size`.
+        """
+        extensions_set = set(extensions) if extensions is not None else None
+
+        self.skipped = dict.fromkeys(self.skipped, 0)
+
+        candidates = []
+        for path, oid in self.list_tree():
+            name = path.rpartition('/')[2]
+
+            if extensions_set is not None and os.path.splitext(name)[-1] not in extensions_set:
+                continue
+
+            if any(part.startswith('.') for part in path.split('/')):
+                continue
+
+            if self.generated_matcher.exclude_file(name):
+                self.skipped['generated'] += 1
+                continue
+
+            candidates.append((path, oid))
+
+        missing_oids = self.list_missing_oversized()
+        self.skipped['missing'] = sum(oid in missing_oids for _, oid in candidates)
+        candidates = [
+            (path, oid) for path, oid in candidates if oid not in missing_oids]
+
+        blobs = []
+        sizes = self.read_sizes([oid for _, oid in candidates]) if candidates else []
+        for (path, oid), size in zip(candidates, sizes):
+            if self.max_file_size is not None and size > self.max_file_size:
+                self.skipped['oversized'] += 1
+                continue
+
+            blobs.append(GitBlob(path=path, oid=oid, size=size))
+
+        blobs.sort(key=lambda blob: blob.path)
+
+        return blobs
+
+    def get_process(self) -> subprocess.Popen:
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                ['git', 'cat-file', '--batch'],
+                cwd=self.repo_path,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+
+        return self._process
+
+    def read_blob(self, oid: str) -> bytes:
+        """Contents of a blob, through the persistent `cat-file --batch`."""
+
+        with self._lock:
+            process = self.get_process()
+
+            process.stdin.write(f'{oid}\n'.encode())  # type: ignore
+            process.stdin.flush()  # type: ignore
+
+            header = process.stdout.readline().decode().split()  # type: ignore
+            if len(header) != 3:
+                raise Exception(f"Can't read blob {oid}: {' '.join(header)}")
+
+            size = int(header[2])
+            content = process.stdout.read(size)  # type: ignore
+            process.stdout.read(1)  # type: ignore # trailing newline
+
+        return content
+
+    def is_generated(self, content: bytes) -> bool:
+        head = content[:GENERATED_SNIFF_SIZE]
+        return any(marker in head for marker in GENERATED_MARKERS)
+
+    def iter_blobs(self, blobs: list[GitBlob]) -> Iterator[tuple[GitBlob, str]]:
+        """(blob, text) of the text files of `blobs`, in order."""
+
+        self.n_blobs_read = 0
+        for blob in blobs:
+            content = self.read_blob(blob.oid)
+            self.n_blobs_read += 1
+
+            if b'\0' in content[:BINARY_SNIFF_SIZE]:
+                self.skipped['binary'] += 1
+                continue
+
+            if self.is_generated(content):
+                self.skipped['generated'] += 1
+                continue
+
+            yield blob, content.decode('utf-8', errors='ignore')
+
+    def close(self) -> None:
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()  # type: ignore
+                self._process.wait()
+                self._process.stdout.close()  # type: ignore
+                self._process = None
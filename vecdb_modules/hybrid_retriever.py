@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+
+from vecdb_modules.bm25_index import BM25Index
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[str]],
+    rrf_k: int = 60,
+) -> list[tuple[str, float]]:
+    """Fuse rankings of node ids, scoring each by sum(1 / (rrf_k + rank))."""
+
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, start=1):
+            scores[node_id] = scores.get(node_id, 0.) + 1 / (rrf_k + rank)
+
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class FusedNodeWithScore(NodeWithScore):
+    """A fused result, with its vector similarity (None for BM25 only hits)."""
+
+    vector_score: Optional[float] = None
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Runs the vector retriever and a `BM25Index` query in parallel and fuses
+    both rankings with reciprocal-rank fusion, so exact identifier matches
+    make it into the candidates even when their embeddings don't.
+    The returned scores are the fused RRF scores, the vector similarities
+    being kept as `vector_score`.
+    """
+
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        bm25_index: BM25Index,
+        docstore: BaseDocumentStore,
+        similarity_top_k: int = 15,
+        bm25_top_k: int | None = None,
+        rrf_k: int = 60,
+    ) -> None:
+
+        super().__init__()
+
+        self.vector_retriever = vector_retriever
+        self.bm25_index = bm25_index
+        self.docstore = docstore
+
+        self.similarity_top_k = similarity_top_k
+        self.bm25_top_k = bm25_top_k or similarity_top_k
+        self.rrf_k = rrf_k
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='vector_retriever')
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+
+        # The vector side waits on the remote query embedding, BM25 is local.
+        vector_future = self._executor.submit(
+            self.vector_retriever.retrieve, query_bundle)
+
+        bm25_hits = self.bm25_index.query(
+            query_bundle.query_str, self.bm25_top_k)
+
+        vector_nodes = vector_future.result()
+
+        nodes_by_id = {node.node.node_id: node.node for node in vector_nodes}
+        vector_scores = {node.node.node_id: node.score for node in vector_nodes}
+
+        fused = reciprocal_rank_fusion(
+            [
+                [node.node.node_id for node in vector_nodes],
+                [node_id for node_id, _ in bm25_hits],
+            ],
+            rrf_k=self.rrf_k
+        )[:self.similarity_top_k]
+
+        missing_ids = [
+            node_id for node_id, _ in fused if node_id not in nodes_by_id]
+        for node in self.docstore.get_nodes(missing_ids, raise_error=False):
+            nodes_by_id[node.node_id] = node
+
+        return [
+            FusedNodeWithScore(
+                node=nodes_by_id[node_id],
+                score=score,
+                vector_score=vector_scores.get(node_id),
+            )
+            for node_id, score in fused
+            if node_id in nodes_by_id
+        ]
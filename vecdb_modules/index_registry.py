@@ -0,0 +1,172 @@
+import os
+import json
+import threading
+import time
+from typing import Any, Callable
+
+from llama_index.core import VectorStoreIndex
+
+from vecdb_modules.bm25_index import BM25Index
+from vecdb_modules.lazy_docstore import DOCSTORE_DATA_FNAME
+
+
+INDEX_REGISTRY_SETTINGS_PATH = os.path.join("settings", "index_registry.json")
+
+
+def resident_size(persist_dir: str) -> int:
+    """
+    Estimated memory of a loaded index: its persisted files, minus the
+    lazily read docstore data.
+    """
+    return sum(
+        entry.stat().st_size
+        for entry in os.scandir(persist_dir)
+        if entry.is_file() and entry.name != DOCSTORE_DATA_FNAME
+    )
+
+
+class SharedIndex:
+    """A loaded index, shared read-only by every session using it."""
+
+    def __init__(
+        self,
+        repo_name: str,
+        commit_hash: str | None,
+        index: VectorStoreIndex,
+        bm25_index: BM25Index | None,
+        size_bytes: int,
+    ) -> None:
+
+        self.repo_name = repo_name
+        self.commit_hash = commit_hash
+        self.index = index
+        self.bm25_index = bm25_index
+        self.size_bytes = size_bytes
+
+        self.refcount = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def key(self) -> tuple[str, str | None]:
+        return (self.repo_name, self.commit_hash)
+
+
+class IndexRegistry:
+    """
+    Loads each (repo, commit) index once per process and hands it to every
+    session asking for it, counting references.
+
+    When the loaded indexes exceed `memory_budget_mb`, unreferenced ones
+    are evicted, least recently used first. Referenced indexes are never
+    evicted, so the budget can be exceeded while they're all in use.
+    """
+
+    def __init__(self, memory_budget_mb: float = 2048) -> None:
+        self.memory_budget_mb = memory_budget_mb
+
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[str, str | None], SharedIndex] = {}
+        self._key_locks: dict[tuple[str, str | None], threading.Lock] = {}
+
+    def acquire(
+        self,
+        repo_name: str,
+        commit_hash: str | None,
+        loader: Callable[[], SharedIndex],
+    ) -> SharedIndex:
+        key = (repo_name, commit_hash)
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Sessions asking for the same index wait for a single load.
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self.hits += 1
+
+            if entry is None:
+                entry = loader()
+
+                with self._lock:
+                    self._entries[key] = entry
+                    self.loads += 1
+
+            with self._lock:
+                entry.refcount += 1
+                entry.last_used = time.monotonic()
+                self._evict()
+
+        return entry
+
+    def release(self, entry: SharedIndex) -> None:
+        with self._lock:
+            entry.refcount = max(entry.refcount - 1, 0)
+            entry.last_used = time.monotonic()
+            self._evict()
+
+    def invalidate_repo(self, repo_name: str) -> None:
+        """
+        Forget the loaded indexes of a re-indexed repo. Sessions holding one
+        keep using it until they release it, new ones load the new files.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == repo_name]:
+                del self._entries[key]
+                self._key_locks.pop(key, None)
+
+    def _evict(self) -> None:
+        budget_bytes = self.memory_budget_mb * 2**20
+
+        unreferenced = sorted(
+            (entry for entry in self._entries.values() if entry.refcount == 0),
+            key=lambda entry: entry.last_used
+        )
+
+        for entry in unreferenced:
+            if sum(e.size_bytes for e in self._entries.values()) <= budget_bytes:
+                break
+
+            del self._entries[entry.key]
+            self._key_locks.pop(entry.key, None)
+            self.evictions += 1
+
+            print(f"Evicted Index: {entry.repo_name}@{entry.commit_hash}")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return dict(
+                loads=self.loads,
+                hits=self.hits,
+                evictions=self.evictions,
+                indexes=[
+                    dict(
+                        repo_name=entry.repo_name,
+                        commit_hash=entry.commit_hash,
+                        refcount=entry.refcount,
+                        size_mb=round(entry.size_bytes / 2**20, 2),
+                    )
+                    for entry in self._entries.values()
+                ],
+                size_mb=round(
+                    sum(e.size_bytes for e in self._entries.values()) / 2**20, 2),
+            )
+
+
+def load_memory_budget_mb() -> float:
+    """The "memory_budget_mb" of settings/index_registry.json (2048 without it)."""
+
+    try:
+        with open(INDEX_REGISTRY_SETTINGS_PATH, 'r') as f:
+            return float(json.loads(f.read()).get('memory_budget_mb', 2048))
+    except FileNotFoundError:
+        return 2048
+
+
+# Shared by every session of the process.
+INDEX_REGISTRY = IndexRegistry(memory_budget_mb=load_memory_budget_mb())
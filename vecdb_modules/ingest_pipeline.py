@@ -0,0 +1,98 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator
+
+
+Stage = Callable[[Iterable[Any]], Iterable[Any]]
+
+
+class _StageError:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+_END = object()
+
+
+class IngestPipeline:
+    """
+    Runs generator stages (e.g. read -> split -> embed) each on its own
+    thread, connected by bounded queues.
+
+    Every stage takes the iterable produced by the previous one and yields
+    its own items, so the stages overlap in time, and at most `queue_size`
+    items wait between two stages no matter how large the input is.
+    """
+
+    def __init__(
+        self,
+        stages: list[Stage],
+        queue_size: int = 4,
+    ) -> None:
+
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, source: Iterable[Any]) -> Iterator[Any]:
+
+        stop_event = threading.Event()
+
+        def put(out_queue: queue.Queue, item: Any) -> bool:
+            # Give up when the consumer stopped, instead of blocking forever.
+            while not stop_event.is_set():
+                try:
+                    out_queue.put(item, timeout=.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def drain(in_queue: queue.Queue) -> Iterator[Any]:
+            while True:
+                try:
+                    item = in_queue.get(timeout=.1)
+                except queue.Empty:
+                    if stop_event.is_set():
+                        return
+                    continue
+
+                if item is _END:
+                    return
+                if isinstance(item, _StageError):
+                    raise item.error
+                yield item
+
+        def run_stage(stage: Stage, items: Iterable[Any], out_queue: queue.Queue):
+            try:
+                for item in stage(items):
+                    if not put(out_queue, item):
+                        return
+                put(out_queue, _END)
+
+            except BaseException as e:
+                put(out_queue, _StageError(e))
+
+        threads = []
+        items: Iterable[Any] = source
+        for stage in self.stages:
+            out_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+            thread = threading.Thread(
+                target=run_stage,
+                args=(stage, items, out_queue),
+                daemon=True
+            )
+            threads.append(thread)
+
+            items = drain(out_queue)
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            yield from items
+
+        finally:
+            stop_event.set()
+            for thread in threads:
+                thread.join(timeout=1)
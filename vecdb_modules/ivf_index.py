@@ -0,0 +1,219 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index over the
+`NumpyVectorStore` matrix.
+
+Rows are clustered with spherical k-means into `n_lists` lists; a query
+only scores the rows of its `n_probe` closest lists. Run
+`python -m vecdb_modules.ivf_index vec_db/<repo>` to benchmark recall@15
+and latency against exact search.
+"""
+import os
+import sys
+import time
+import json
+
+import numpy as np
+
+from vecdb_modules.quantization import SCORE_BLOCK_ROWS, top_k_rows, rescore
+
+
+IVF_INDEX_FNAME = "ivf_index.npz"
+
+
+class IVFIndex:
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+    ) -> None:
+
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @staticmethod
+    def default_n_lists(n_rows: int) -> int:
+        return max(1, int(4 * np.sqrt(n_rows)))
+
+    @staticmethod
+    def assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+            block = matrix[start: start + SCORE_BLOCK_ROWS]
+            assignments[start: start + SCORE_BLOCK_ROWS] = np.argmax(
+                block @ centroids.T, axis=1)
+
+        return assignments
+
+    @classmethod
+    def build(
+        cls,
+        matrix: np.ndarray,
+        n_lists: int | None = None,
+        n_iter: int = 10,
+        train_size_per_list: int = 64,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """
+        Args:
+            matrix (np.ndarray): L2-normalized vectors
+            n_lists (int, optional): number of clusters, 4 * sqrt(rows) by default
+            n_iter (int): k-means iterations
+            train_size_per_list (int): k-means training rows per list
+        """
+        rng = np.random.default_rng(seed)
+
+        n_rows = len(matrix)
+
+        # No rows to cluster (every file deleted): an index without lists.
+        if n_rows == 0:
+            return cls(
+                centroids=np.zeros((0, matrix.shape[1]), dtype=np.float32),
+                list_offsets=np.zeros(1, dtype=np.int64),
+                list_rows=np.zeros(0, dtype=np.int64),
+            )
+
+        n_lists = min(n_lists or cls.default_n_lists(n_rows), n_rows)
+
+        train_size = min(n_rows, n_lists * train_size_per_list)
+        train = np.asarray(
+            matrix[np.sort(rng.choice(n_rows, size=train_size, replace=False))],
+            dtype=np.float32
+        )
+
+        centroids = train[rng.choice(train_size, size=n_lists, replace=False)]
+
+        for _ in range(n_iter):
+            assignments = cls.assign(train, centroids)
+
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, train)
+            counts = np.bincount(assignments, minlength=n_lists)
+
+            # Re-seed empty lists with random training rows.
+            empty = counts == 0
+            sums[empty] = train[rng.choice(train_size, size=int(empty.sum()))]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            centroids = (sums / norms).astype(np.float32)
+
+        assignments = cls.assign(matrix, centroids)
+
+        list_rows = np.argsort(assignments, kind='stable')
+        list_offsets = np.concatenate([
+            [0], np.cumsum(np.bincount(assignments, minlength=n_lists))
+        ])
+
+        return cls(centroids, list_offsets, list_rows)
+
+    def probe(self, query: np.ndarray, n_probe: int) -> np.ndarray:
+        """Rows of the `n_probe` lists closest to the query."""
+
+        lists = top_k_rows(self.centroids @ query, n_probe)
+
+        return np.concatenate([
+            self.list_rows[self.list_offsets[i]: self.list_offsets[i + 1]]
+            for i in lists
+        ]) if len(lists) else np.zeros(0, dtype=np.int64)
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                list_offsets=self.list_offsets,
+                list_rows=self.list_rows,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(
+                centroids=data['centroids'],
+                list_offsets=data['list_offsets'],
+                list_rows=data['list_rows'],
+            )
+
+
+def ann_benchmark(
+    matrix: np.ndarray,
+    ivf_index: IVFIndex | None = None,
+    n_probes: tuple[int, ...] = (1, 4, 8, 16, 32),
+    queries: np.ndarray | None = None,
+    n_queries: int = 100,
+    top_k: int = 15,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Recall@top_k and per-query latency of IVF search for every `n_probe`,
+    against exact search over the same (L2-normalized) matrix.
+
+    Without `queries`, stored vectors perturbed with gaussian noise are used
+    as stand-in queries.
+    """
+    rng = np.random.default_rng(seed)
+
+    if queries is None:
+        sample = matrix[rng.choice(len(matrix), size=min(n_queries, len(matrix)), replace=False)]
+        queries = sample + rng.normal(
+            scale=1 / np.sqrt(matrix.shape[1]), size=sample.shape)
+
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = queries.astype(np.float32)
+
+    if ivf_index is None:
+        start_time = time.perf_counter()
+        ivf_index = IVFIndex.build(matrix)
+        print(f"IVF built: {ivf_index.n_lists} lists in {time.perf_counter() - start_time:.2f}s")
+
+    start_time = time.perf_counter()
+    exact_results = [set(top_k_rows(matrix @ query, top_k)) for query in queries]
+
+    report = [dict(
+        search='exact',
+        n_probe=None,
+        recall=1.0,
+        query_ms=round(
+            (time.perf_counter() - start_time) * 1000 / len(queries), 2),
+    )]
+
+    for n_probe in n_probes:
+        if n_probe > ivf_index.n_lists:
+            continue
+
+        hits = 0
+        start_time = time.perf_counter()
+
+        for query, exact_rows in zip(queries, exact_results):
+            rows, _ = rescore(
+                matrix, ivf_index.probe(query, n_probe), query, top_k)
+            hits += len(exact_rows.intersection(rows))
+
+        report.append(dict(
+            search='ivf',
+            n_probe=n_probe,
+            recall=round(hits / (len(queries) * top_k), 4),
+            query_ms=round(
+                (time.perf_counter() - start_time) * 1000 / len(queries), 2),
+        ))
+
+    return report
+
+
+if __name__ == "__main__":
+    persist_dir = sys.argv[1]
+
+    matrix = np.load(os.path.join(persist_dir, 'vectors.npy'), mmap_mode='r')
+    print(f"{persist_dir}: {matrix.shape[0]} vectors x {matrix.shape[1]} dims")
+
+    ivf_path = os.path.join(persist_dir, IVF_INDEX_FNAME)
+    ivf_index = IVFIndex.load(ivf_path) if os.path.exists(ivf_path) else None
+
+    for row in ann_benchmark(np.asarray(matrix), ivf_index=ivf_index):
+        print(json.dumps(row))
@@ -0,0 +1,258 @@
+import os
+import json
+import mmap
+import tempfile
+import threading
+from typing import Dict, Optional
+
+import fsspec
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.docstore.simple_docstore import SimpleDocumentStore
+from llama_index.core.storage.kvstore.types import BaseKVStore, DEFAULT_COLLECTION
+
+
+DOCSTORE_DATA_FNAME = "docstore.bin"
+DOCSTORE_OFFSETS_FNAME = "docstore_offsets.json"
+
+
+class OffsetKVStore(BaseKVStore):
+    """
+    Key-value store persisted as one binary file of concatenated JSON
+    values plus an offset table: {collection: {key: [offset, length]}}.
+
+    The data file is mmapped and a value is only decoded when its key is
+    read, so opening the store costs the offset table and nothing else.
+    Written values are appended to a temporary spill file (in `spill_dir`,
+    the data file directory by default) and deletes recorded by key, so
+    only offsets are kept in memory until `persist` rewrites the file.
+    """
+
+    def __init__(
+        self,
+        data_path: str | None = None,
+        spill_dir: str | None = None,
+    ) -> None:
+
+        self.data_path = data_path
+        self.spill_dir = spill_dir or (
+            os.path.dirname(data_path) if data_path is not None else None)
+
+        self._offsets: dict[str, dict[str, list[int]]] = {}
+
+        # Values written since the last persist, and persisted keys deleted.
+        self._spilled: dict[str, dict[str, list[int]]] = {}
+        self._deleted: dict[str, set[str]] = {}
+        self._spill_file = None
+        self._spill_size = 0
+
+        self._file = None
+        self._mm: mmap.mmap | bytes = b''
+        self._lock = threading.Lock()
+
+        if data_path is not None and os.path.exists(data_path):
+            self._open(data_path)
+
+    def _open(self, data_path: str) -> None:
+        offsets_path = os.path.join(
+            os.path.dirname(data_path), DOCSTORE_OFFSETS_FNAME)
+
+        with open(offsets_path, 'r') as f:
+            self._offsets = json.loads(f.read())
+
+        self._file = open(data_path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if os.path.getsize(data_path) else b''
+
+    def _close_spill(self) -> None:
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+        self._spill_size = 0
+        self._spilled = {}
+        self._deleted = {}
+
+    def close(self) -> None:
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._mm = b''
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _read_raw(self, key: str, collection: str) -> bytes | None:
+        location = self._spilled.get(collection, {}).get(key)
+        if location is not None:
+            offset, length = location
+            with self._lock:
+                self._spill_file.seek(offset)  # type: ignore
+                return self._spill_file.read(length)  # type: ignore
+
+        if key in self._deleted.get(collection, ()):
+            return None
+
+        location = self._offsets.get(collection, {}).get(key)
+        if location is None:
+            return None
+
+        offset, length = location
+        return self._mm[offset: offset + length]
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        raw = json.dumps(val).encode('utf-8')
+
+        with self._lock:
+            # Deleted with the store, or on close; never left behind.
+            if self._spill_file is None:
+                if self.spill_dir is not None:
+                    os.makedirs(self.spill_dir, exist_ok=True)
+                self._spill_file = tempfile.TemporaryFile(
+                    prefix=DOCSTORE_DATA_FNAME + '.', suffix='.tmp', dir=self.spill_dir)
+
+            self._spill_file.seek(self._spill_size)
+            self._spill_file.write(raw)
+
+            self._spilled.setdefault(collection, {})[key] = [self._spill_size, len(raw)]
+            self._deleted.get(collection, set()).discard(key)
+            self._spill_size += len(raw)
+
+    async def aput(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put(key, val, collection)
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        raw = self._read_raw(key, collection)
+        return json.loads(raw) if raw is not None else None
+
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        return self.get(key, collection)
+
+    def _has(self, key: str, collection: str) -> bool:
+        if key in self._spilled.get(collection, {}):
+            return True
+
+        return key in self._offsets.get(collection, {}) and \
+            key not in self._deleted.get(collection, ())
+
+    def _keys(self, collection: str) -> list[str]:
+        deleted = self._deleted.get(collection, set())
+
+        keys = dict.fromkeys(
+            key for key in self._offsets.get(collection, {}) if key not in deleted)
+        keys.update(dict.fromkeys(self._spilled.get(collection, {})))
+        return list(keys)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        all_vals = {}
+        for key in self._keys(collection):
+            val = self.get(key, collection)
+            if val is not None:
+                all_vals[key] = val
+
+        return all_vals
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock:
+            if not self._has(key, collection):
+                return False
+
+            self._spilled.get(collection, {}).pop(key, None)
+            if key in self._offsets.get(collection, {}):
+                self._deleted.setdefault(collection, set()).add(key)
+
+        return True
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection)
+
+    def persist(self, data_path: str) -> None:
+        if not self._spilled and not self._deleted and \
+                self.data_path == data_path and os.path.exists(data_path):
+            return
+
+        offsets_path = os.path.join(
+            os.path.dirname(data_path), DOCSTORE_OFFSETS_FNAME)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+        new_offsets: dict[str, dict[str, list[int]]] = {}
+        collections = dict.fromkeys(self._offsets)
+        collections.update(dict.fromkeys(self._spilled))
+
+        # Values are copied as raw bytes, never decoded.
+        with open(data_path + '.tmp', 'wb') as f:
+            offset = 0
+            for collection in collections:
+                collection_offsets = new_offsets.setdefault(collection, {})
+
+                for key in self._keys(collection):
+                    raw = self._read_raw(key, collection)
+
+                    f.write(raw)  # type: ignore
+                    collection_offsets[key] = [offset, len(raw)]  # type: ignore
+                    offset += len(raw)  # type: ignore
+
+        with open(offsets_path + '.tmp', 'w') as f:
+            json.dump(new_offsets, f)
+
+        self.close()
+        os.replace(data_path + '.tmp', data_path)
+        os.replace(offsets_path + '.tmp', offsets_path)
+
+        self.data_path = data_path
+        self._close_spill()
+        self._open(data_path)
+
+
+class LazyDocumentStore(KVDocumentStore):
+    """
+    Docstore over an `OffsetKVStore`, so loading an index doesn't parse every
+    chunk's text and metadata; only the retrieved nodes are read, by id.
+    """
+
+    def __init__(
+        self,
+        kvstore: OffsetKVStore | None = None,
+        namespace: Optional[str] = None,
+    ) -> None:
+
+        super().__init__(kvstore or OffsetKVStore(), namespace=namespace)
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, DOCSTORE_DATA_FNAME))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> "LazyDocumentStore":
+        return cls(OffsetKVStore(os.path.join(persist_dir, DOCSTORE_DATA_FNAME)))
+
+    @classmethod
+    def from_simple_docstore(
+        cls,
+        docstore: SimpleDocumentStore,
+        spill_dir: str | None = None,
+    ) -> "LazyDocumentStore":
+        """Convert a JSON docstore, written by older versions."""
+
+        kvstore = OffsetKVStore(spill_dir=spill_dir)
+        for collection, vals in docstore.to_dict().items():
+            for key, val in vals.items():
+                kvstore.put(key, val, collection)
+
+        return cls(kvstore)
+
+    def persist(
+        self,
+        persist_path: str,
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+    ) -> None:
+        persist_dir = os.path.dirname(persist_path)
+
+        self._kvstore.persist(  # type: ignore
+            os.path.join(persist_dir, DOCSTORE_DATA_FNAME))
+
+        # `persist_path` is the JSON docstore path, stale once converted.
+        if os.path.exists(persist_path):
+            os.remove(persist_path)
@@ -0,0 +1,430 @@
+import os
+import json
+import threading
+from typing import Any, List, Optional, Sequence
+
+import fsspec
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+from vecdb_modules.quantization import (
+    QUANTIZATIONS,
+    quantize_int8,
+    int8_scores,
+    quantize_binary,
+    binary_scores,
+    top_k_rows,
+    rescore,
+)
+from vecdb_modules.ivf_index import IVF_INDEX_FNAME, IVFIndex
+
+
+VECTORS_FNAME = "vectors.npy"
+VECTOR_IDS_FNAME = "vector_ids.json"
+INT8_CODES_FNAME = "vectors.int8.npy"
+INT8_SCALE_FNAME = "vectors.int8_scale.npy"
+BINARY_CODES_FNAME = "vectors.binary.npy"
+
+INDEX_TYPES = ('flat', 'ivf')
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    Vector store keeping all embeddings as one contiguous float32 matrix.
+
+    Rows are L2-normalized, so a query is a single matrix-vector product
+    (cosine similarity) plus `argpartition` for the top-k. The matrix is
+    persisted as `vectors.npy` next to a JSON array of node ids, and loaded
+    back with `np.memmap`, so loading doesn't parse or copy the vectors.
+    Texts live in the docstore (`stores_text = False`).
+
+    With `quantization` set to 'int8' or 'binary', compact codes are also
+    persisted and kept in memory: search runs over the codes, and only the
+    top `similarity_top_k * rescore_multiplier` candidates are rescored
+    against the full-precision rows, read from the mmapped file.
+
+    With `index_type='ivf'`, an `IVFIndex` is built on persist and only the
+    rows of the `ivf_n_probe` closest lists are scored (approximate search,
+    composable with quantization). `ivf_n_lists` is the build parameter,
+    `ivf_n_probe` the search one, overridable per query with an
+    `ivf_n_probe` kwarg.
+
+    The store is shared by the sessions querying a repo: pending changes
+    and the lazily built codes and IVF index are applied under a lock.
+    """
+
+    stores_text: bool = False
+    quantization: str | None = None
+    rescore_multiplier: int = 4
+    index_type: str = 'flat'
+    ivf_n_lists: int | None = None
+    ivf_n_probe: int = 8
+
+    _ids: list[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: list[str] = PrivateAttr(default_factory=list)
+    _matrix: np.ndarray | None = PrivateAttr(default=None)
+    _alive: np.ndarray | None = PrivateAttr(default=None)
+    _pending: list[np.ndarray] = PrivateAttr(default_factory=list)
+    _dirty: bool = PrivateAttr(default=False)
+    _ref_doc_rows: dict[str, list[int]] | None = PrivateAttr(default=None)
+    _codes: np.ndarray | None = PrivateAttr(default=None)
+    _int8_scale: np.ndarray | None = PrivateAttr(default=None)
+    _ivf: IVFIndex | None = PrivateAttr(default=None)
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        return os.path.exists(os.path.join(persist_dir, VECTORS_FNAME))
+
+    @staticmethod
+    def load_settings(persist_dir: str) -> dict:
+        """Quantization and index settings of a persisted store, if any."""
+
+        ids_path = os.path.join(persist_dir, VECTOR_IDS_FNAME)
+        if not os.path.exists(ids_path):
+            return {}
+
+        with open(ids_path, 'r') as f:
+            ids_info = json.loads(f.read())
+
+        return {
+            key: ids_info[key]
+            for key in ('quantization', 'index_type', 'ivf_n_lists', 'ivf_n_probe')
+            if key in ids_info
+        }
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> "NumpyVectorStore":
+
+        with open(os.path.join(persist_dir, VECTOR_IDS_FNAME), 'r') as f:
+            ids_info = json.loads(f.read())
+
+        store = cls(
+            quantization=ids_info.get('quantization'),
+            index_type=ids_info.get('index_type', 'flat'),
+            ivf_n_lists=ids_info.get('ivf_n_lists'),
+            ivf_n_probe=ids_info.get('ivf_n_probe', 8),
+        )
+
+        store._ids = ids_info['ids']
+        store._ref_doc_ids = ids_info['ref_doc_ids']
+
+        store._matrix = np.load(
+            os.path.join(persist_dir, VECTORS_FNAME),
+            mmap_mode='r'
+        )
+        store._alive = np.ones(len(store._ids), dtype=bool)
+
+        # Codes missing (a store persisted without rows) are built lazily.
+        int8_codes_path = os.path.join(persist_dir, INT8_CODES_FNAME)
+        binary_codes_path = os.path.join(persist_dir, BINARY_CODES_FNAME)
+
+        if store.quantization == 'int8' and os.path.exists(int8_codes_path):
+            store._codes = np.load(int8_codes_path)
+            store._int8_scale = np.load(
+                os.path.join(persist_dir, INT8_SCALE_FNAME))
+
+        elif store.quantization == 'binary' and os.path.exists(binary_codes_path):
+            store._codes = np.load(binary_codes_path)
+
+        # Stores persisted without their IVF index build it lazily.
+        ivf_path = os.path.join(persist_dir, IVF_INDEX_FNAME)
+        if store.index_type == 'ivf' and os.path.exists(ivf_path):
+            store._ivf = IVFIndex.load(ivf_path)
+
+        return store
+
+    def set_quantization(self, quantization: str | None) -> None:
+        if quantization is not None and quantization not in QUANTIZATIONS:
+            raise Exception(
+                f"Quantization must be one of {QUANTIZATIONS} or None.")
+
+        self.quantization = quantization
+        self._codes = None
+        self._int8_scale = None
+        self._dirty = True
+
+    def set_index_type(
+        self,
+        index_type: str,
+        ivf_n_lists: int | None = None,
+    ) -> None:
+        if index_type not in INDEX_TYPES:
+            raise Exception(f"Index type must be one of {INDEX_TYPES}.")
+
+        self.index_type = index_type
+        self.ivf_n_lists = ivf_n_lists
+        self._ivf = None
+        self._dirty = True
+
+    def _build_ivf(self) -> None:
+        if self._ivf is not None or self.index_type != 'ivf':
+            return
+
+        # A store rows were never added to gets an index without lists.
+        matrix = self._matrix if self._matrix is not None else np.zeros(
+            (0, 0), dtype=np.float32)
+
+        self._ivf = IVFIndex.build(matrix, n_lists=self.ivf_n_lists)
+
+    def _build_codes(self) -> None:
+        if self._matrix is None or self._codes is not None:
+            return
+
+        if self.quantization == 'int8':
+            self._codes, self._int8_scale = quantize_int8(self._matrix)
+
+        elif self.quantization == 'binary':
+            self._codes = quantize_binary(self._matrix)
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def _consolidate(self) -> None:
+        """Merge pending additions and drop deleted rows."""
+
+        if not self._pending and (self._alive is None or self._alive.all()):
+            return
+
+        # An index persisted without rows has a (0, 0) matrix, of no dimension.
+        blocks = [self._matrix] if self._matrix is not None and len(self._matrix) else []
+        blocks.extend(self._pending)
+
+        alive = self._alive if self._alive is not None else np.ones(
+            len(self._ids), dtype=bool)
+
+        self._matrix = np.ascontiguousarray(
+            np.concatenate(blocks)[alive], dtype=np.float32)
+
+        self._ids = [
+            node_id for node_id, is_alive in zip(self._ids, alive) if is_alive]
+        self._ref_doc_ids = [
+            ref_doc_id for ref_doc_id, is_alive in zip(self._ref_doc_ids, alive) if is_alive]
+
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._pending = []
+        self._ref_doc_rows = None
+        self._codes = None
+        self._int8_scale = None
+        self._ivf = None
+
+    def _get_ref_doc_rows(self) -> dict[str, list[int]]:
+        if self._ref_doc_rows is None:
+            self._ref_doc_rows = {}
+            for i, ref_doc_id in enumerate(self._ref_doc_ids):
+                self._ref_doc_rows.setdefault(ref_doc_id, []).append(i)
+
+        return self._ref_doc_rows
+
+    def add(self, nodes: Sequence[BaseNode], **kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+
+        vectors = np.asarray(
+            [node.get_embedding() for node in nodes],
+            dtype=np.float32
+        )
+        self._pending.append(self.normalize(vectors))
+        self._ref_doc_rows = None
+
+        self._ids.extend(node.node_id for node in nodes)
+        self._ref_doc_ids.extend(node.ref_doc_id or '' for node in nodes)
+
+        self._alive = np.concatenate([
+            self._alive if self._alive is not None else np.ones(0, dtype=bool),
+            np.ones(len(nodes), dtype=bool)
+        ])
+        self._dirty = True
+
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        for i in self._get_ref_doc_rows().get(ref_doc_id, []):
+            self._alive[i] = False  # type: ignore
+            self._dirty = True
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Any = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        node_ids_set = set(node_ids or [])
+        for i, row_id in enumerate(self._ids):
+            if row_id in node_ids_set:
+                self._alive[i] = False  # type: ignore
+                self._dirty = True
+
+    def clear(self) -> None:
+        self._ids = []
+        self._ref_doc_ids = []
+        self._matrix = None
+        self._alive = None
+        self._pending = []
+        self._dirty = True
+        self._ref_doc_rows = None
+        self._codes = None
+        self._int8_scale = None
+        self._ivf = None
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+
+        # Builds replace the arrays rather than editing them, so the search
+        # runs on the snapshot taken under the lock.
+        with self._lock:
+            self._consolidate()
+
+            if self.index_type == 'ivf':
+                self._build_ivf()
+            if self.quantization is not None:
+                self._build_codes()
+
+            matrix, ids, ivf = self._matrix, self._ids, self._ivf
+            all_codes, int8_scale = self._codes, self._int8_scale
+
+        if matrix is None or not len(ids):
+            return VectorStoreQueryResult(ids=[], similarities=[])
+
+        query_vector = self.normalize(
+            np.asarray(query.query_embedding, dtype=np.float32))
+
+        # Rows to score, None for all of them.
+        probe_rows = None
+        if ivf is not None:
+            probe_rows = ivf.probe(
+                query_vector, kwargs.get('ivf_n_probe') or self.ivf_n_probe)
+
+        if self.quantization is None:
+            if probe_rows is None:
+                scores = matrix @ query_vector
+                top_rows = top_k_rows(scores, query.similarity_top_k)
+                top_scores = scores[top_rows]
+            else:
+                top_rows, top_scores = rescore(
+                    matrix,
+                    probe_rows,
+                    query_vector,
+                    query.similarity_top_k
+                )
+
+        else:
+            codes = all_codes if probe_rows is None else all_codes[probe_rows]  # type: ignore
+
+            if self.quantization == 'int8':
+                approx_scores = int8_scores(
+                    codes, int8_scale, query_vector)  # type: ignore
+            else:
+                approx_scores = binary_scores(
+                    codes, query_vector)  # type: ignore
+
+            candidate_rows = top_k_rows(
+                approx_scores,
+                query.similarity_top_k * self.rescore_multiplier
+            )
+            if probe_rows is not None:
+                candidate_rows = probe_rows[candidate_rows]
+
+            top_rows, top_scores = rescore(
+                matrix,
+                candidate_rows,
+                query_vector,
+                query.similarity_top_k
+            )
+
+        return VectorStoreQueryResult(
+            ids=[ids[i] for i in top_rows],
+            similarities=top_scores.tolist(),
+        )
+
+    def persist(
+        self,
+        persist_path: str,
+        fs: Optional[fsspec.AbstractFileSystem] = None
+    ) -> None:
+        with self._lock:
+            persist_dir = os.path.dirname(persist_path)
+            vectors_path = os.path.join(persist_dir, VECTORS_FNAME)
+
+            if not self._dirty and os.path.exists(vectors_path):
+                return
+
+            self._consolidate()
+            os.makedirs(persist_dir, exist_ok=True)
+
+            matrix = self._matrix if self._matrix is not None else np.zeros(
+                (0, 0), dtype=np.float32)
+
+            # Write aside and swap, so a crash never leaves a half written index.
+            with open(vectors_path + '.tmp', 'wb') as f:
+                np.save(f, matrix)
+
+            self._build_codes()
+
+            codes_paths = []
+            if self.quantization == 'int8':
+                codes_paths = [
+                    (os.path.join(persist_dir, INT8_CODES_FNAME), self._codes),
+                    (os.path.join(persist_dir, INT8_SCALE_FNAME), self._int8_scale),
+                ]
+            elif self.quantization == 'binary':
+                codes_paths = [
+                    (os.path.join(persist_dir, BINARY_CODES_FNAME), self._codes),
+                ]
+
+            # No codes are built for a store rows were never added to.
+            stale_codes_paths = [path for path, codes in codes_paths if codes is None]
+            codes_paths = [(path, codes) for path, codes in codes_paths if codes is not None]
+
+            for codes_path, codes in codes_paths:
+                with open(codes_path + '.tmp', 'wb') as f:
+                    np.save(f, codes)
+
+            self._build_ivf()
+
+            ivf_path = os.path.join(persist_dir, IVF_INDEX_FNAME)
+            if self._ivf is not None:
+                self._ivf.save(ivf_path + '.tmp')
+
+            ids_path = os.path.join(persist_dir, VECTOR_IDS_FNAME)
+            with open(ids_path + '.tmp', 'w') as f:
+                json.dump(
+                    dict(
+                        ids=self._ids,
+                        ref_doc_ids=self._ref_doc_ids,
+                        quantization=self.quantization,
+                        index_type=self.index_type,
+                        ivf_n_lists=self.ivf_n_lists,
+                        ivf_n_probe=self.ivf_n_probe,
+                    ),
+                    f
+                )
+
+            os.replace(vectors_path + '.tmp', vectors_path)
+            for codes_path, _ in codes_paths:
+                os.replace(codes_path + '.tmp', codes_path)
+            for codes_path in stale_codes_paths:
+                if os.path.exists(codes_path):
+                    os.remove(codes_path)
+            if self._ivf is not None:
+                os.replace(ivf_path + '.tmp', ivf_path)
+            os.replace(ids_path + '.tmp', ids_path)
+
+            self._matrix = np.load(vectors_path, mmap_mode='r')
+            self._dirty = False
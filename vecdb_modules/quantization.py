@@ -0,0 +1,182 @@
+"""
+Compact codes for the `NumpyVectorStore` matrix: int8 scalar quantization
+and 1-bit binary (sign) codes, with block-wise approximate scoring.
+
+Run `python -m vecdb_modules.quantization vec_db/<repo>` to print the
+recall-vs-memory report of a persisted index.
+"""
+import os
+import sys
+import time
+import json
+
+import numpy as np
+
+
+QUANTIZATIONS = ('int8', 'binary')
+
+# Rows scored per block, bounds the float32 temporaries of a query.
+SCORE_BLOCK_ROWS = 65_536
+
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def quantize_int8(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-dimension int8 quantization, returns (codes, scale)."""
+
+    scale = np.zeros(matrix.shape[1], dtype=np.float32)
+    for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+        block = np.abs(matrix[start: start + SCORE_BLOCK_ROWS])
+        scale = np.maximum(scale, block.max(axis=0))
+
+    scale[scale == 0] = 1
+    scale /= 127
+
+    codes = np.empty(matrix.shape, dtype=np.int8)
+    for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+        block = matrix[start: start + SCORE_BLOCK_ROWS]
+        codes[start: start + SCORE_BLOCK_ROWS] = np.clip(
+            np.rint(block / scale), -127, 127)
+
+    return codes, scale
+
+
+def int8_scores(codes: np.ndarray, scale: np.ndarray, query: np.ndarray) -> np.ndarray:
+    scaled_query = (query * scale).astype(np.float32)
+
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+        block = codes[start: start + SCORE_BLOCK_ROWS].astype(np.float32)
+        scores[start: start + SCORE_BLOCK_ROWS] = block @ scaled_query
+
+    return scores
+
+
+def quantize_binary(matrix: np.ndarray) -> np.ndarray:
+    """Sign bits of every dimension, packed 8 per byte."""
+
+    return np.packbits(matrix > 0, axis=1)
+
+
+def binary_scores(codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+    query_bits = np.packbits(query > 0)
+    n_bits = len(query)
+
+    # Higher is closer: number of matching sign bits.
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+        block = codes[start: start + SCORE_BLOCK_ROWS]
+        hamming = POPCOUNT[np.bitwise_xor(block, query_bits)].sum(
+            axis=1, dtype=np.int32)
+        scores[start: start + SCORE_BLOCK_ROWS] = n_bits - hamming
+
+    return scores
+
+
+def top_k_rows(scores: np.ndarray, top_k: int) -> np.ndarray:
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    top_rows = np.argpartition(-scores, top_k - 1)[:top_k]
+    return top_rows[np.argsort(-scores[top_rows])]
+
+
+def rescore(
+    matrix: np.ndarray,
+    candidate_rows: np.ndarray,
+    query: np.ndarray,
+    top_k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Exact scores of the candidates against the full-precision rows."""
+
+    candidate_rows = np.sort(candidate_rows)
+    exact_scores = matrix[candidate_rows] @ query
+
+    best = top_k_rows(exact_scores, top_k)
+    return candidate_rows[best], exact_scores[best]
+
+
+def quantization_report(
+    matrix: np.ndarray,
+    queries: np.ndarray | None = None,
+    n_queries: int = 100,
+    top_k: int = 15,
+    rescore_multipliers: tuple[int, ...] = (1, 4, 10),
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Recall@top_k and resident memory of every quantization setting against
+    exact search over the same (L2-normalized) matrix.
+
+    Without `queries`, stored vectors perturbed with gaussian noise are used
+    as stand-in queries.
+    """
+    rng = np.random.default_rng(seed)
+
+    if queries is None:
+        sample = matrix[rng.choice(len(matrix), size=min(n_queries, len(matrix)), replace=False)]
+        queries = sample + rng.normal(
+            scale=1 / np.sqrt(matrix.shape[1]), size=sample.shape)
+
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = queries.astype(np.float32)
+
+    start_time = time.perf_counter()
+    exact_results = [set(top_k_rows(matrix @ query, top_k)) for query in queries]
+
+    report = [dict(
+        quantization='float32',
+        rescore_multiplier=None,
+        resident_mb=round(matrix.nbytes / 2**20, 2),
+        recall=1.0,
+        query_ms=round(
+            (time.perf_counter() - start_time) * 1000 / len(queries), 2),
+    )]
+
+    int8_codes, int8_scale = quantize_int8(matrix)
+    binary_codes = quantize_binary(matrix)
+
+    for quantization in QUANTIZATIONS:
+        if quantization == 'int8':
+            resident_bytes = int8_codes.nbytes + int8_scale.nbytes
+
+            def approx_scores(query):
+                return int8_scores(int8_codes, int8_scale, query)
+
+        else:
+            resident_bytes = binary_codes.nbytes
+
+            def approx_scores(query):
+                return binary_scores(binary_codes, query)
+
+        for rescore_multiplier in rescore_multipliers:
+            hits = 0
+            start_time = time.perf_counter()
+
+            for query, exact_rows in zip(queries, exact_results):
+                candidates = top_k_rows(
+                    approx_scores(query), top_k * rescore_multiplier)
+                rows, _ = rescore(matrix, candidates, query, top_k)
+                hits += len(exact_rows.intersection(rows))
+
+            report.append(dict(
+                quantization=quantization,
+                rescore_multiplier=rescore_multiplier,
+                resident_mb=round(resident_bytes / 2**20, 2),
+                recall=round(hits / (len(queries) * top_k), 4),
+                query_ms=round(
+                    (time.perf_counter() - start_time) * 1000 / len(queries), 2),
+            ))
+
+    return report
+
+
+if __name__ == "__main__":
+    persist_dir = sys.argv[1]
+
+    matrix = np.load(os.path.join(persist_dir, 'vectors.npy'), mmap_mode='r')
+    print(f"{persist_dir}: {matrix.shape[0]} vectors x {matrix.shape[1]} dims")
+
+    for row in quantization_report(np.asarray(matrix)):
+        print(json.dumps(row))
@@ -0,0 +1,314 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+from typing import Any, List, Optional
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+
+def relative_margin(scores: list[float], top_n: int) -> float:
+    """
+    Gap between the last kept and the first dropped candidate, relative to
+    the spread of all candidate scores. 1 means the top_n stand clearly
+    apart from the rest, 0 that they don't separate at all.
+    """
+    if len(scores) <= top_n:
+        return 1.
+
+    scores = sorted(scores, reverse=True)
+    spread = scores[0] - scores[-1]
+    if spread <= 0:
+        return 0.
+
+    return (scores[top_n - 1] - scores[top_n]) / spread
+
+
+def margin_scores(nodes: List[NodeWithScore], top_n: int) -> list[float] | None:
+    """
+    Scores the skip margin is measured on. Fused results (`vector_score`
+    set) are measured on their vector similarities, RRF scores being rank
+    based and nearly flat, and only when their top_n are the vector top_n.
+    Other results are measured on their scores. None if not measurable.
+    """
+    vector_scores = [getattr(node, 'vector_score', None) for node in nodes]
+
+    if all(score is None for score in vector_scores):
+        if any(node.score is None for node in nodes):
+            return None
+        return [node.score for node in nodes]  # type: ignore
+
+    if any(score is None for score in vector_scores[:top_n]):
+        return None
+
+    scores = sorted((score for score in vector_scores if score is not None), reverse=True)
+    if len(scores) > top_n and min(vector_scores[:top_n]) < scores[top_n - 1]:  # type: ignore
+        return None
+
+    return scores
+
+
+class RerankScoreCache:
+    """
+    On-disk cache of rerank relevance scores per (query hash, node id).
+
+    Cohere scores every document against the query independently, so a
+    cached score stays valid whatever the other candidates are.
+    """
+
+    def __init__(
+        self,
+        db_path: str = os.path.join("vec_db", "rerank_cache.sqlite"),
+        max_entries: int = 1_000_000,
+    ) -> None:
+
+        self.db_path = db_path
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS rerank_scores (
+                    query_hash TEXT NOT NULL,
+                    node_id TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (query_hash, node_id)
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_rerank_last_used ON rerank_scores(last_used)"
+            )
+
+    @staticmethod
+    def make_query_hash(query: str, model_name: str) -> str:
+        key_src = f"{model_name}\x00{' '.join(query.split()).lower()}"
+        return hashlib.sha256(key_src.encode('utf-8')).hexdigest()
+
+    def get_many(self, query_hash: str, node_ids: list[str]) -> dict[str, float]:
+        if not node_ids:
+            return {}
+
+        placeholders = ','.join('?' * len(node_ids))
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                f"SELECT node_id, score FROM rerank_scores "
+                f"WHERE query_hash = ? AND node_id IN ({placeholders})",
+                [query_hash, *node_ids]
+            ).fetchall()
+
+            if rows:
+                self._conn.execute(
+                    f"UPDATE rerank_scores SET last_used = ? "
+                    f"WHERE query_hash = ? AND node_id IN ({placeholders})",
+                    [time.time(), query_hash, *node_ids]
+                )
+
+            self.hits += len(rows)
+            self.misses += len(node_ids) - len(rows)
+
+        return dict(rows)
+
+    def put_many(self, query_hash: str, scores: dict[str, float]) -> None:
+        if not scores:
+            return
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rerank_scores (query_hash, node_id, score, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                [(query_hash, node_id, score, now) for node_id, score in scores.items()]
+            )
+
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM rerank_scores").fetchone()[0]
+
+            # Evict down to 90% of the bound, so eviction doesn't run on every put.
+            if entries > self.max_entries:
+                self._conn.execute(
+                    """
+                    DELETE FROM rerank_scores WHERE rowid IN (
+                        SELECT rowid FROM rerank_scores ORDER BY last_used LIMIT ?
+                    )
+                    """,
+                    (entries - int(self.max_entries * .9),)
+                )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# One cache (and SQLite connection) per db path, shared by the sessions.
+_score_caches: dict[str, RerankScoreCache] = {}
+_score_caches_lock = threading.Lock()
+
+
+def get_rerank_score_cache(
+    db_path: str = os.path.join("vec_db", "rerank_cache.sqlite"),
+) -> RerankScoreCache:
+
+    key = os.path.abspath(db_path)
+    with _score_caches_lock:
+        if key not in _score_caches:
+            _score_caches[key] = RerankScoreCache(db_path)
+
+        return _score_caches[key]
+
+
+class AdaptiveRerank(BaseNodePostprocessor):
+    """
+    Wraps a reranker (`CohereRerank`), calling it only when needed:
+
+    - when the retrieval scores already separate the top_n candidates from
+      the rest by at least `skip_margin` (see `relative_margin` and
+      `margin_scores`), the candidates are kept in retrieval order and no
+      rerank call is made;
+    - otherwise, candidates with a cached score for the query are not sent,
+      and the call is avoided altogether when all of them are cached.
+    """
+
+    top_n: int = Field(description="Top N nodes to return.")
+    skip_margin: Optional[float] = Field(
+        default=.5,
+        description="Relative score margin above which reranking is skipped, None to always rerank.",
+    )
+
+    _reranker: BaseNodePostprocessor = PrivateAttr()
+    _score_cache: RerankScoreCache | None = PrivateAttr()
+    _counters: dict[str, int] = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _rerank_lock: threading.Lock = PrivateAttr()
+
+    def __init__(
+        self,
+        reranker: BaseNodePostprocessor,
+        score_cache: RerankScoreCache | None = None,
+        top_n: int = 2,
+        skip_margin: float | None = .5,
+    ) -> None:
+
+        super().__init__(top_n=top_n, skip_margin=skip_margin)
+
+        self._reranker = reranker
+        self._score_cache = score_cache
+        self._lock = threading.Lock()
+        self._rerank_lock = threading.Lock()
+        self._counters = dict(
+            queries=0,
+            skipped_by_margin=0,
+            served_from_cache=0,
+            rerank_calls=0,
+            nodes_reranked=0,
+            nodes_from_cache=0,
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "AdaptiveRerank"
+
+    def _count(self, **increments: int) -> None:
+        with self._lock:
+            for name, increment in increments.items():
+                self._counters[name] += increment
+
+    def _rerank_scores(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: QueryBundle,
+    ) -> dict[str, float]:
+
+        # top_n is swapped on the shared reranker, so calls are serialized.
+        with self._rerank_lock:
+            reranker_top_n = getattr(self._reranker, 'top_n', None)
+            if reranker_top_n is not None:
+                self._reranker.top_n = len(nodes)  # type: ignore
+
+            try:
+                reranked = self._reranker.postprocess_nodes(
+                    nodes, query_bundle=query_bundle)
+            finally:
+                if reranker_top_n is not None:
+                    self._reranker.top_n = reranker_top_n  # type: ignore
+
+        return {node.node.node_id: node.score or 0. for node in reranked}
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+
+        if not nodes:
+            return []
+
+        self._count(queries=1)
+
+        scores_for_margin = margin_scores(nodes, self.top_n) \
+            if self.skip_margin is not None else None
+
+        if scores_for_margin is not None and \
+                relative_margin(scores_for_margin, self.top_n) >= self.skip_margin:  # type: ignore
+            self._count(skipped_by_margin=1)
+            return sorted(
+                nodes, key=lambda node: node.score or 0., reverse=True)[:self.top_n]
+
+        scores: dict[str, float] = {}
+        query_hash = ''
+        if self._score_cache is not None:
+            query_hash = RerankScoreCache.make_query_hash(
+                query_bundle.query_str,
+                getattr(self._reranker, 'model', self._reranker.class_name())
+            )
+            scores = self._score_cache.get_many(
+                query_hash, [node.node.node_id for node in nodes])
+
+        missing_nodes = [node for node in nodes if node.node.node_id not in scores]
+        self._count(nodes_from_cache=len(nodes) - len(missing_nodes))
+
+        if missing_nodes:
+            new_scores = self._rerank_scores(missing_nodes, query_bundle)
+            self._count(rerank_calls=1, nodes_reranked=len(missing_nodes))
+
+            if self._score_cache is not None:
+                self._score_cache.put_many(query_hash, new_scores)
+            scores.update(new_scores)
+
+        else:
+            self._count(served_from_cache=1)
+
+        reranked = [
+            NodeWithScore(node=node.node, score=scores[node.node.node_id])
+            for node in nodes
+            if node.node.node_id in scores
+        ]
+        reranked.sort(key=lambda node: node.score, reverse=True)  # type: ignore
+
+        return reranked[:self.top_n]
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+
+        counters['rerank_calls_avoided'] = counters['skipped_by_margin'] + \
+            counters['served_from_cache']
+        return counters
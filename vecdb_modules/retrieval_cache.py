@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+from typing import Any
+
+
+class RetrievalCache:
+    """
+    In-memory LRU cache of reranked retrieval results, shared by every
+    session of the process.
+
+    Keys are (repo_name, commit_hash, normalized query, top_k, top_n) and
+    values the final (node id, score) pairs, so a hit costs no embedding,
+    vector search or rerank call. Entries of a repo are dropped when a new
+    commit of it is recorded or indexed.
+    """
+
+    def __init__(self, max_entries: int = 5_000) -> None:
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, list[tuple[str, float | None]]] = OrderedDict()
+
+    @staticmethod
+    def make_key(
+        repo_name: str,
+        commit_hash: str | None,
+        query: str,
+        top_k: int,
+        top_n: int,
+    ) -> tuple:
+        return (repo_name, commit_hash, ' '.join(query.split()).lower(), top_k, top_n)
+
+    def get(self, key: tuple) -> list[tuple[str, float | None]] | None:
+        with self._lock:
+            results = self._entries.get(key)
+
+            if results is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return results
+
+    def put(self, key: tuple, results: list[tuple[str, float | None]]) -> None:
+        with self._lock:
+            self._entries[key] = results
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_repo(self, repo_name: str) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == repo_name]:
+                del self._entries[key]
+                self.invalidations += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=round(self.hits / lookups, 4) if lookups else 0.0,
+            invalidations=self.invalidations,
+            entries=len(self._entries),
+        )
+
+
+# Shared by every VecDB of the process.
+RETRIEVAL_CACHE = RetrievalCache()
@@ -1,29 +1,80 @@
-from typing import List
+from typing import Callable, Iterable, Iterator, List
 from llama_index.core import Document
 from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
+from llama_index.core import Settings
+from llama_index.core.ingestion import run_transformations
 from llama_index.core.indices.vector_store.retrievers import (
     VectorIndexRetriever,
 )
-from llama_index.core.schema import NodeWithScore
-import nest_asyncio
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core import SimpleDirectoryReader
+from concurrent.futures import ThreadPoolExecutor
 import json
-from langchain_text_splitters import (
-    Language,
-    RecursiveCharacterTextSplitter,
-)
 import os
+import weakref
 from llama_index.embeddings.cohere import CohereEmbedding
 from repo_cloner import RepoCloner
+from repo_walker import MANIFEST_CACHE
+from vecdb_modules.embedding_cache import (
+    EmbeddingCache,
+    CachedEmbedding,
+    CachedQueryEmbedding,
+    QUERY_EMBEDDING_CACHE,
+)
+from vecdb_modules.ingest_pipeline import IngestPipeline
+from vecdb_modules.chunker import ChunkingEngine
+from vecdb_modules.embed_scheduler import EmbeddingScheduler
+from vecdb_modules.numpy_vector_store import NumpyVectorStore
+from vecdb_modules.lazy_docstore import LazyDocumentStore, OffsetKVStore
+from vecdb_modules.bm25_index import BM25Index
+from vecdb_modules.hybrid_retriever import HybridRetriever
+from vecdb_modules.federated_retriever import FederatedRetriever
+from vecdb_modules.git_blob_reader import GitBlobReader
+from vecdb_modules.retrieval_cache import RETRIEVAL_CACHE
+from vecdb_modules.rerank_policy import AdaptiveRerank, get_rerank_score_cache
+from vecdb_modules.index_registry import (
+    INDEX_REGISTRY,
+    SharedIndex,
+    resident_size,
+)
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.index_store import SimpleIndexStore
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+from llama_index.core.data_structs.data_structs import IndexDict
 import streamlit as st
 
 
+# The commit a persisted index was built from, the base of its updates.
+INDEXED_COMMIT_FILE_NAME = "indexed_commit.txt"
+
+# Metadata left out of the embedded text of the chunks.
+EMBED_EXCLUDED_METADATA_KEYS = ('source_url', 'source_last_updated', 'source_path')
+
+
 class VecDB:
     def __init__(
         self,
         repo_name: str | None = None,
         persist_directory="vec_db",
-        cohere_api_key: str = 'cohere_api_key'
+        cohere_api_key: str = 'cohere_api_key',
+        embedding_cache_path: str | None = None,
+        insert_batch_size: int = 512,
+        ingest_queue_size: int = 4,
+        split_workers: int | None = None,
+        split_group_size: int = 256,
+        embed_concurrency: int = 4,
+        embed_base_url: str | None = None,
+        quantization: str | None = None,
+        index_type: str | None = None,
+        ivf_n_lists: int | None = None,
+        ivf_n_probe: int | None = None,
+        similarity_top_k: int = 15,
+        rerank_top_n: int = 2,
+        rerank_skip_margin: float | None = .5,
+        rerank_cache_path: str | None = None,
+        doc_reader: str = 'git',
+        max_file_size: int | None = 1_000_000,
 
     ) -> None:
 
@@ -32,49 +83,147 @@ class VecDB:
 
         self.persist_directory = persist_directory
 
-        self.retriever: None | VectorIndexRetriever = None
+        self.embedding_cache_path = embedding_cache_path or os.path.join(
+            persist_directory, "embedding_cache.sqlite")
+        self.embedding_cache: EmbeddingCache | None = None
+
+        self.insert_batch_size = insert_batch_size
+        self.ingest_queue_size = ingest_queue_size
+
+        self.split_workers = split_workers
+        self.split_group_size = split_group_size
+        self.chunking_engine: ChunkingEngine | None = None
+
+        self.embed_concurrency = embed_concurrency
+        self.embed_base_url = embed_base_url
+        self.embed_scheduler: EmbeddingScheduler | None = None
+
+        self.quantization = quantization
+
+        self.index_type = index_type
+        self.ivf_n_lists = ivf_n_lists
+        self.ivf_n_probe = ivf_n_probe
+
+        self.similarity_top_k = similarity_top_k
+        self.rerank_top_n = rerank_top_n
+        self.rerank_skip_margin = rerank_skip_margin
+
+        self.rerank_cache_path = rerank_cache_path or os.path.join(
+            persist_directory, "rerank_cache.sqlite")
+        self.postprocessor: AdaptiveRerank | None = None
+
+        self.retriever: None | VectorIndexRetriever | HybridRetriever | FederatedRetriever = None
+        self.query_embed_model: CachedQueryEmbedding | None = None
+        self.federated_vecdbs: dict[str, VecDB] = {}
+        self.shared_index: SharedIndex | None = None
+        self._release_shared_index: weakref.finalize | None = None
+        self.docstore: BaseDocumentStore | None = None
+        self.loaded_repo_name: str | None = None
+        self.commit_hash: str | None = None
+        self.bm25_index: BM25Index | None = None
 
         self.index: VectorStoreIndex | None = None
 
+        if doc_reader not in ('git', 'directory'):
+            raise Exception(
+                f"doc_reader must be 'git' or 'directory', not {doc_reader}")
+
+        # 'git': the commit's blobs, 'directory': the working tree files.
+        self.doc_reader = doc_reader
+        self.max_file_size = max_file_size
+
+        # Files to read by the last `iter_docs`, and read so far.
+        self.n_docs_to_read = 0
+        self.n_docs_read = 0
+
+    def get_cohere_embed_model(self, input_type: str) -> CohereEmbedding:
+
+        embed_kwargs = {}
+        if self.embed_base_url:
+            embed_kwargs['base_url'] = self.embed_base_url
+
+        return CohereEmbedding(
+            cohere_api_key=self.cohere_api_key,
+            input_type=input_type,
+            **embed_kwargs
+        )
+
+    def get_doc_embed_model(self) -> CachedEmbedding:
+
+        if self.embedding_cache is None:
+            self.embedding_cache = EmbeddingCache(
+                db_path=self.embedding_cache_path)
+
+        embed_model = self.get_cohere_embed_model(
+            input_type="search_document")
+
+        def embed_fn(texts: list[str]) -> list[list[float]]:
+            # SDK-level retries are off, so throttling reaches the scheduler.
+            result = embed_model._get_client().embed(
+                texts=texts,
+                input_type=embed_model.input_type,
+                embedding_types=[embed_model.embedding_type],
+                model=embed_model.model_name,
+                truncate=embed_model.truncate,
+                request_options={'max_retries': 0},
+            ).embeddings
+            return getattr(result, embed_model.embedding_type)
+
+        self.embed_scheduler = EmbeddingScheduler(
+            embed_fn=embed_fn,
+            max_batch_size=embed_model.embed_batch_size,
+            max_concurrency=self.embed_concurrency
+        )
+
+        return CachedEmbedding(
+            embed_model=embed_model,
+            cache=self.embedding_cache,
+            scheduler=self.embed_scheduler,
+            embed_batch_size=self.insert_batch_size
+        )
+
+    def get_chunking_engine(self) -> ChunkingEngine:
+
+        if self.chunking_engine is None:
+            self.chunking_engine = ChunkingEngine(
+                supported_files_types_names=self.supported_files_types_names,
+                num_workers=self.split_workers
+            )
+
+        return self.chunking_engine
+
     def split_docs(self, docs: list[Document]) -> list[Document]:
 
+        files_chunks = self.get_chunking_engine().split(
+            [(doc.metadata['file_name'], doc.text) for doc in docs]
+        )
+
         splitted_docs: list[Document] = []
-        for doc in docs:
+        for doc, file_chunks in zip(docs, files_chunks):
             file_name = doc.metadata['file_name']
-            file_ex = '.' + doc.metadata['file_name'].split('.')[-1]
 
             file_url = doc.metadata['file_url']
             last_updated = doc.metadata['last_updated']
-
-            if file_ex == '.txt':
-                splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=1024, chunk_overlap=50)
-
-            else:
-                code_lang = self.supported_files_types_names[file_ex]
-                splitter = RecursiveCharacterTextSplitter.from_language(
-                    language=Language(code_lang),
-                    chunk_size=1500, chunk_overlap=100
-                )
-
-            code_text = doc.text
-
-            file_docs = splitter.create_documents([code_text])
+            file_rel_path = doc.metadata['file_rel_path']
 
             splitted_docs.extend(
                 Document(
-                    text=f'// file name: {file_name}\n{doc.page_content}',
+                    text=f'// file name: {file_name}\n{chunk}',
                     metadata=dict(
                         source=file_name,
                         source_url=file_url,
-                        source_last_updated=last_updated
-                    )
+                        source_last_updated=last_updated,
+                        source_path=file_rel_path
+                    ),
+                    # Commit and pull specific, kept out of the embedded
+                    # text so the embedding cache is keyed on the content.
+                    excluded_embed_metadata_keys=list(EMBED_EXCLUDED_METADATA_KEYS),
                 )
-                for doc in file_docs
+                for chunk in file_chunks
             )
         return splitted_docs
 
-    def load_docs(self, repo_name) -> list[Document]:
+    def load_supported_files(self) -> None:
 
         with open("settings/supported_files.json", 'r') as sf:
             self.supported_files_types = json.loads(sf.read())
@@ -82,84 +231,568 @@ class VecDB:
         with open("settings/supported_files_names.json", 'r') as sf:
             self.supported_files_types_names = json.loads(sf.read())
 
+    def iter_docs(
+        self,
+        repo_name,
+        input_files: list[str] | None = None,
+        commit_hash: str | None = None,
+        repo_info: dict | None = None,
+    ) -> Iterator[Document]:
+        """
+        Lazily read the repo files, one Document per file. The 'git' reader
+        can read any `commit_hash`, the 'directory' one only the checked
+        out commit. `repo_info` replaces the repo record, for repos not
+        published yet (see `RepoCloner.to_repo_info`).
+        """
+
+        self.load_supported_files()
+
         repo_path = os.path.join(".", "repos", repo_name)
 
+        repo_info = repo_info or RepoCloner.get_repo_info(repo_name=repo_name)
+        repo_url = repo_info['repo_url']
+        last_commit_hash = repo_info['commit_hash']
+        last_updated = repo_info['last_updated']
+
+        if input_files is not None:
+            input_files = [file_path.replace('\\', '/') for file_path in input_files]
+
+        if self.doc_reader == 'git':
+            return self.iter_git_docs(
+                repo_path, repo_url, commit_hash or last_commit_hash,
+                last_updated if commit_hash in (None, last_commit_hash) else None,
+                input_files
+            )
+
+        if commit_hash not in (None, last_commit_hash):
+            raise Exception(
+                "The 'directory' doc reader only reads the checked out commit.")
+
+        # The files walk of this commit, shared with the repo structure.
+        manifest = MANIFEST_CACHE.get(repo_path, last_commit_hash)
+        loadable_paths = {
+            entry.path for entry in manifest.loadable_files(self.supported_files_types)}
+
+        if input_files is not None:
+            input_files = [
+                file_path for file_path in input_files if file_path in loadable_paths]
+        else:
+            input_files = sorted(loadable_paths)
+
+        self.n_docs_to_read = len(input_files)
+        self.n_docs_read = 0
+
+        if not input_files:
+            return iter([])
+
         reader = SimpleDirectoryReader(
-            input_dir=repo_path,
-            recursive=True,
-            required_exts=self.supported_files_types
+            input_files=[
+                os.path.abspath(os.path.join(repo_path, file_path))
+                for file_path in input_files
+            ],
         )
 
-        docs = reader.load_data(num_workers=4)
+        def read_docs() -> Iterator[Document]:
+            for file_docs in reader.iter_data():
+                for doc in file_docs:
 
-        repo_info = RepoCloner.get_repo_info(repo_name=repo_name)
-        repo_url = repo_info['repo_url']
-        last_commit_hash = repo_info['commit_hash']
-        last_updated = repo_info['last_updated']
+                    doc_last_path = doc.metadata['file_path'].replace(
+                        '\\', '/').split(repo_name)[-1]
+
+                    doc.metadata['file_url'] = f'{repo_url}/blob/{last_commit_hash}{doc_last_path}'
+                    doc.metadata['last_updated'] = last_updated
+                    doc.metadata['file_rel_path'] = os.path.relpath(
+                        os.path.abspath(doc.metadata['file_path']),
+                        os.path.abspath(repo_path)
+                    ).replace('\\', '/')
+
+                    yield doc
+
+                self.n_docs_read += 1
+
+        return read_docs()
+
+    def iter_git_docs(
+        self,
+        repo_path: str,
+        repo_url: str,
+        commit_hash: str,
+        last_updated: str | None,
+        input_files: list[str] | None,
+    ) -> Iterator[Document]:
+        """
+        `iter_docs` from the repo's object database, with the same metadata
+        as the directory reader. `last_updated` defaults to the commit date.
+        """
+
+        reader = GitBlobReader(
+            repo_path, commit=commit_hash, max_file_size=self.max_file_size)
+
+        try:
+            blobs = reader.list_files(self.supported_files_types)
+        except BaseException:
+            reader.close()
+            raise
+
+        if input_files is not None:
+            input_files_set = set(input_files)
+            blobs = [blob for blob in blobs if blob.path in input_files_set]
+
+        if last_updated is None:
+            last_updated = reader.get_commit_date()
+
+        self.n_docs_to_read = len(blobs)
+        self.n_docs_read = 0
+
+        def read_docs() -> Iterator[Document]:
+            try:
+                for blob, text in reader.iter_blobs(blobs):
+                    self.n_docs_read = reader.n_blobs_read
+                    file_path = os.path.abspath(os.path.join(repo_path, blob.path))
+
+                    yield Document(
+                        text=text,
+                        metadata=dict(
+                            file_path=file_path,
+                            file_name=blob.path.rpartition('/')[2],
+                            file_size=blob.size,
+                            file_url=f'{repo_url}/blob/{reader.commit_hash}/{blob.path}',
+                            last_updated=last_updated,
+                            file_rel_path=blob.path,
+                        )
+                    )
+
+                self.n_docs_read = reader.n_blobs_read
+
+            finally:
+                print(f"Git Doc Reader Skipped: {reader.skipped}")
+                reader.close()
+
+        return read_docs()
+
+    def load_docs(
+        self,
+        repo_name,
+        input_files: list[str] | None = None,
+        commit_hash: str | None = None,
+    ) -> list[Document]:
 
-        for i in range(len(docs)):
-            doc = docs[i]
+        return list(self.iter_docs(
+            repo_name, input_files=input_files, commit_hash=commit_hash))
 
-            doc_last_path = doc.metadata['file_path'].replace(
-                '\\', '/').split(repo_name)[-1]
+    def ingest_docs(
+        self,
+        docs: Iterable[Document],
+        embed_model: BaseEmbedding,
+    ) -> Iterator[list[BaseNode]]:
+        """
+        Stream docs through split -> batch -> embed stages, yielding batches
+        of embedded nodes ready to be inserted into the index.
+
+        Each stage runs on its own thread with a bounded queue in between,
+        so reading, splitting and embedding overlap and only a few batches
+        are in memory at any time.
+        """
+
+        def split_stage(docs: Iterable[Document]) -> Iterator[Document]:
+            # Split in groups, so the chunking engine can fan them out.
+            docs_group: list[Document] = []
+            for doc in docs:
+                docs_group.append(doc)
+
+                if len(docs_group) == self.split_group_size:
+                    yield from self.split_docs(docs_group)
+                    docs_group = []
+
+            if docs_group:
+                yield from self.split_docs(docs_group)
+
+        def batch_stage(chunks: Iterable[Document]) -> Iterator[list[BaseNode]]:
+            batch: list[Document] = []
+            for chunk in chunks:
+                batch.append(chunk)
+
+                if len(batch) == self.insert_batch_size:
+                    yield run_transformations(
+                        nodes=batch,  # type: ignore
+                        transformations=Settings.transformations,
+                    )
+                    batch = []
+
+            if batch:
+                yield run_transformations(
+                    nodes=batch,  # type: ignore
+                    transformations=Settings.transformations,
+                )
+
+        def embed_stage(batches: Iterable[list[BaseNode]]) -> Iterator[list[BaseNode]]:
+            for nodes in batches:
+                embeddings = embed_model.get_text_embedding_batch([
+                    node.get_content(metadata_mode=MetadataMode.EMBED)
+                    for node in nodes
+                ])
+
+                for node, embedding in zip(nodes, embeddings):
+                    node.embedding = embedding
+
+                yield nodes
 
-            doc.metadata['file_url'] = f'{repo_url}/blob/{last_commit_hash}{doc_last_path}'
-            doc.metadata['last_updated'] = last_updated
+        pipeline = IngestPipeline(
+            stages=[split_stage, batch_stage, embed_stage],
+            queue_size=self.ingest_queue_size,
+        )
 
-            docs[i] = doc
+        try:
+            yield from pipeline.run(docs)
 
-        return docs
+        finally:
+            if self.chunking_engine is not None:
+                self.chunking_engine.close()
+
+    def report_progress(
+        self,
+        progress: Callable[[str, float, str], None] | None,
+        stage: str,
+        n_chunks: int,
+    ) -> None:
+        if progress is not None:
+            progress(
+                stage,
+                self.n_docs_read / self.n_docs_to_read if self.n_docs_to_read else 1.,
+                f"{self.n_docs_read}/{self.n_docs_to_read} files read, {n_chunks} chunks embedded"
+            )
 
     def vectorize_db(
         self,
         repo_name: str | None = None,
+        progress: Callable[[str, float, str], None] | None = None,
+        repo_info: dict | None = None,
     ) -> None:
+        """
+        Index all the repo files. `progress(stage, fraction, message)` is
+        called as files are embedded, `repo_info` is as in `iter_docs`.
+        """
 
         if self.repo_name is None and repo_name is None:
             raise Exception("Must Specify repo_name!")
 
         repo_name = repo_name or self.repo_name or ''
 
-        documents = self.load_docs(repo_name)
+        repo_info = repo_info or RepoCloner.get_repo_info(repo_name=repo_name)
+        commit_hash = repo_info['commit_hash']
+
+        embed_model = self.get_doc_embed_model()
+
+        persist_dir_name = os.path.join(
+            ".",
+            self.persist_directory,
+            repo_name
+        )
+
+        self.index = VectorStoreIndex(
+            nodes=[],
+            storage_context=StorageContext.from_defaults(
+                # Chunks are spilled next to the index until it's persisted.
+                docstore=LazyDocumentStore(OffsetKVStore(spill_dir=persist_dir_name)),
+                vector_store=self.get_vector_store(persist_dir_name)),
+            embed_model=embed_model,
+        )
 
-        splitted_docs = self.split_docs(docs=documents)
+        self.bm25_index = BM25Index()
 
-        nest_asyncio.apply()
+        n_chunks = 0
+        for nodes in self.ingest_docs(
+            self.iter_docs(repo_name, commit_hash=commit_hash, repo_info=repo_info),
+            embed_model
+        ):
+            self.index.insert_nodes(nodes)
+            self.bm25_index.add_nodes(nodes)
 
-        embed_model = CohereEmbedding(
-            cohere_api_key=self.cohere_api_key,
-            input_type="search_document"
+            n_chunks += len(nodes)
+            print(f"Vectorized {n_chunks} chunks...")
+            self.report_progress(progress, 'embed', n_chunks)
+
+        if progress is not None:
+            progress('persist', 0., f"{n_chunks} chunks")
+
+        self.persist(persist_dir_name, commit_hash)
+
+        RETRIEVAL_CACHE.invalidate_repo(repo_name)
+        INDEX_REGISTRY.invalidate_repo(repo_name)
+
+        print("VecDB Storing Done.")
+        print(f"Embedding Cache: {self.embedding_cache.stats()}")  # type: ignore
+        print(f"Embedding Scheduler: {self.embed_scheduler.stats()}")  # type: ignore
+
+    @staticmethod
+    def get_indexed_commit(persist_dir_name: str) -> str | None:
+        """
+        The commit of the persisted index: '' if its persist was
+        interrupted, None for indexes persisted before it was recorded.
+        """
+
+        try:
+            with open(os.path.join(persist_dir_name, INDEXED_COMMIT_FILE_NAME), 'r') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def persist(self, persist_dir_name: str, commit_hash: str | None) -> None:
+        """
+        Persist the index and its BM25 index, then record `commit_hash`.
+        The record is emptied first, so an interrupted persist leaves an
+        index of unknown commit, rebuilt by the next update.
+        """
+
+        os.makedirs(persist_dir_name, exist_ok=True)
+        indexed_commit_path = os.path.join(persist_dir_name, INDEXED_COMMIT_FILE_NAME)
+
+        with open(indexed_commit_path, 'w') as f:
+            f.write('')
+
+        self.index.storage_context.persist(  # type: ignore
+            persist_dir=persist_dir_name)
+        self.bm25_index.persist(persist_dir_name)  # type: ignore
+
+        with open(indexed_commit_path, 'w') as f:
+            f.write(commit_hash or '')
+
+    def get_vector_store(self, persist_dir_name: str | None = None) -> NumpyVectorStore:
+        """
+        Settings not given to the VecDB are those of the store persisted in
+        `persist_dir_name`, so rebuilding an index keeps its quantization and
+        index type (switch quantization with `quantize_vecdb`).
+        """
+
+        settings = NumpyVectorStore.load_settings(persist_dir_name) \
+            if persist_dir_name is not None else {}
+
+        vector_store = NumpyVectorStore(
+            quantization=self.quantization or settings.get('quantization'))
+        vector_store.set_index_type(
+            self.index_type or settings.get('index_type') or 'flat',
+            self.ivf_n_lists or settings.get('ivf_n_lists'))
+
+        ivf_n_probe = self.ivf_n_probe or settings.get('ivf_n_probe')
+        if ivf_n_probe is not None:
+            vector_store.ivf_n_probe = ivf_n_probe
+
+        return vector_store
+
+    def load_storage_context(self, persist_dir_name: str) -> StorageContext:
+
+        if LazyDocumentStore.exists(persist_dir_name):
+            docstore = LazyDocumentStore.from_persist_dir(persist_dir_name)
+        else:
+            # JSON docstores of older indexes are converted on the next persist.
+            docstore = LazyDocumentStore.from_simple_docstore(
+                SimpleDocumentStore.from_persist_dir(persist_dir_name),
+                spill_dir=persist_dir_name)
+
+        # Indexes built before NumpyVectorStore keep the default JSON store.
+        if not NumpyVectorStore.exists(persist_dir_name):
+            return StorageContext.from_defaults(
+                persist_dir=persist_dir_name,
+                docstore=docstore
+            )
+
+        return StorageContext.from_defaults(
+            persist_dir=persist_dir_name,
+            docstore=docstore,
+            vector_store=NumpyVectorStore.from_persist_dir(persist_dir_name)
+        )
+
+    def load_index(
+        self,
+        storage_context: StorageContext,
+        embed_model: BaseEmbedding,
+    ) -> VectorStoreIndex:
+        """
+        `load_index_from_storage`, minus the dataclasses_json decoding of the
+        index struct, which takes seconds once `nodes_dict` holds every chunk.
+        """
+
+        index_store = storage_context.index_store
+        index_structs = index_store.to_dict().get('index_store/data', {}) \
+            if isinstance(index_store, SimpleIndexStore) else {}
+
+        if len(index_structs) != 1 or \
+                next(iter(index_structs.values()))['__type__'] != 'vector_store':
+            return load_index_from_storage(
+                storage_context=storage_context,
+                embed_model=embed_model
+            )  # type: ignore
+
+        index_struct_data = json.loads(
+            next(iter(index_structs.values()))['__data__'])
+
+        index_struct = IndexDict(
+            index_id=index_struct_data['index_id'],
+            summary=index_struct_data['summary'],
+            nodes_dict=index_struct_data['nodes_dict'],
         )
 
-        self.index = VectorStoreIndex.from_documents(
-            documents=splitted_docs,
+        return VectorStoreIndex(
+            index_struct=index_struct,
+            storage_context=storage_context,
             embed_model=embed_model,
-            insert_batch=100,
-            use_async=True,
-            show_progress=True,
         )
 
+    def update_vecdb(
+        self,
+        old_commit_hash: str | None,
+        repo_name: str | None = None,
+        progress: Callable[[str, float, str], None] | None = None,
+        repo_info: dict | None = None,
+    ) -> None:
+        """
+        Re-vectorize only the files changed since the commit the persisted
+        index was built from (`old_commit_hash` for indexes persisted
+        before it was recorded).
+
+        Nodes of deleted, modified and renamed files are removed from the
+        persisted index, then the added, modified and renamed files are
+        loaded, split and inserted. Falls back to `vectorize_db` when there
+        is no persisted index or previous commit to diff against.
+        `progress` and `repo_info` are as in `vectorize_db`.
+        """
+
+        if self.repo_name is None and repo_name is None:
+            raise Exception("Must Specify repo_name!")
+
+        repo_name = repo_name or self.repo_name or ''
+
         persist_dir_name = os.path.join(
             ".",
             self.persist_directory,
             repo_name
         )
 
-        self.index.storage_context.persist(
-            persist_dir=persist_dir_name)
+        if not os.path.exists(persist_dir_name):
+            return self.vectorize_db(repo_name, progress=progress, repo_info=repo_info)
 
-        print("VecDB Storing Done.")
+        # The repo record moves to the new commit before the update runs,
+        # so an update that failed is retried from the indexed commit.
+        indexed_commit = self.get_indexed_commit(persist_dir_name)
+        if indexed_commit is not None:
+            old_commit_hash = indexed_commit or None
 
-    def load_vecdb(
+        if old_commit_hash is None:
+            return self.vectorize_db(repo_name, progress=progress, repo_info=repo_info)
+
+        repo_info = repo_info or RepoCloner.get_repo_info(repo_name=repo_name)
+        new_commit_hash = repo_info['commit_hash']
+
+        try:
+            changes = RepoCloner.get_changed_files(
+                repo_path=repo_info['repo_path'],
+                old_commit_hash=old_commit_hash,
+                new_commit_hash=new_commit_hash
+            )
+        except Exception as e:
+            # The indexed commit isn't in the clone anymore.
+            print(f"Can't Diff From {old_commit_hash}, Vectorizing Again: {e}")
+            return self.vectorize_db(repo_name, progress=progress, repo_info=repo_info)
+
+        removed_paths = set(changes['deleted']) | set(changes['modified'])
+        removed_paths.update(old_path for old_path, _ in changes['renamed'])
+
+        upserted_paths = changes['added'] + changes['modified']
+        upserted_paths.extend(new_path for _, new_path in changes['renamed'])
+
+        # Changes to files of unsupported types don't touch the index.
+        self.load_supported_files()
+        supported_files_types = set(self.supported_files_types)
+
+        removed_paths = {
+            path for path in removed_paths
+            if os.path.splitext(path)[-1] in supported_files_types}
+        upserted_paths = [
+            path for path in upserted_paths
+            if os.path.splitext(path)[-1] in supported_files_types]
+
+        if not removed_paths and not upserted_paths:
+            if indexed_commit != new_commit_hash:
+                with open(os.path.join(persist_dir_name, INDEXED_COMMIT_FILE_NAME), 'w') as f:
+                    f.write(new_commit_hash)
+
+            print("VecDB Already Up To Date.")
+            return
+
+        storage_context = self.load_storage_context(persist_dir_name)
+
+        embed_model = self.get_doc_embed_model()
+
+        self.index = self.load_index(storage_context, embed_model)
+
+        ref_docs_info = self.index.docstore.get_all_ref_doc_info() or {}  # type: ignore
+
+        # Indexes built before `source_path` was stored can't be matched
+        # to files, so they have to be rebuilt once.
+        if ref_docs_info and not any(
+            'source_path' in ref_doc_info.metadata
+            for ref_doc_info in ref_docs_info.values()
+        ):
+            return self.vectorize_db(repo_name, progress=progress, repo_info=repo_info)
+
+        if BM25Index.exists(persist_dir_name):
+            self.bm25_index = BM25Index.from_persist_dir(persist_dir_name)
+        else:
+            self.bm25_index = BM25Index.from_docstore(self.index.docstore)  # type: ignore
+
+        removed_ref_doc_ids = [
+            ref_doc_id
+            for ref_doc_id, ref_doc_info in ref_docs_info.items()
+            if ref_doc_info.metadata.get('source_path') in removed_paths
+        ]
+
+        for ref_doc_id in removed_ref_doc_ids:
+            self.bm25_index.delete(ref_docs_info[ref_doc_id].node_ids)
+            self.index.delete_ref_doc(  # type: ignore
+                ref_doc_id,
+                delete_from_docstore=True
+            )
+
+        n_inserted = 0
+        for nodes in self.ingest_docs(
+            self.iter_docs(
+                repo_name, input_files=upserted_paths, commit_hash=new_commit_hash,
+                repo_info=repo_info),
+            embed_model
+        ):
+            self.index.insert_nodes(nodes)  # type: ignore
+            self.bm25_index.add_nodes(nodes)
+            n_inserted += len(nodes)
+            self.report_progress(progress, 'embed', n_inserted)
+
+        if progress is not None:
+            progress('persist', 0., f"{n_inserted} chunks")
+
+        self.persist(persist_dir_name, new_commit_hash)
+
+        RETRIEVAL_CACHE.invalidate_repo(repo_name)
+        INDEX_REGISTRY.invalidate_repo(repo_name)
+
+        print(
+            f"VecDB Updated: {len(removed_ref_doc_ids)} chunks removed, "
+            f"{n_inserted} chunks inserted.")
+        print(f"Embedding Cache: {self.embedding_cache.stats()}")  # type: ignore
+        print(f"Embedding Scheduler: {self.embed_scheduler.stats()}")  # type: ignore
+
+    def quantize_vecdb(
         self,
+        quantization: str | None,
         repo_name: str | None = None,
     ) -> None:
+        """
+        Switch the persisted vectors of a repo to 'int8' or 'binary' codes
+        (or back to plain float32 with None), without re-embedding.
+        Use `vecdb_modules.quantization.quantization_report` to pick one.
+        """
 
         if self.repo_name is None and repo_name is None:
             raise Exception("Must Specify repo_name!")
 
-        from llama_index.postprocessor.cohere_rerank import CohereRerank
-
         repo_name = repo_name or self.repo_name or ''
 
         persist_dir_name = os.path.join(
@@ -168,42 +801,271 @@ class VecDB:
             repo_name
         )
 
-        storage_context = StorageContext.from_defaults(
-            persist_dir=persist_dir_name)
+        if not NumpyVectorStore.exists(persist_dir_name):
+            raise Exception("Repo Must Be Vectorized Again Before Quantizing!")
 
-        embed_model = CohereEmbedding(
-            cohere_api_key=self.cohere_api_key,
-            input_type="search_query"
+        vector_store = NumpyVectorStore.from_persist_dir(persist_dir_name)
+        vector_store.set_quantization(quantization)
+        vector_store.persist(
+            persist_path=os.path.join(persist_dir_name, "default__vector_store.json"))
+
+        RETRIEVAL_CACHE.invalidate_repo(repo_name)
+        INDEX_REGISTRY.invalidate_repo(repo_name)
+
+        print(f"VecDB Quantization Set To: {quantization}")
+
+    def load_shared_index(
+        self,
+        repo_name: str,
+        commit_hash: str | None,
+        embed_model: BaseEmbedding,
+    ) -> SharedIndex:
+
+        persist_dir_name = os.path.join(
+            ".",
+            self.persist_directory,
+            repo_name
         )
 
-        index = load_index_from_storage(
-            storage_context=storage_context,
-            embed_model=embed_model
-        )  # type: ignore
+        storage_context = self.load_storage_context(persist_dir_name)
+
+        # Vecdbs persisted before BM25 was added stay vector only.
+        bm25_index = BM25Index.from_persist_dir(persist_dir_name) \
+            if BM25Index.exists(persist_dir_name) else None
+
+        return SharedIndex(
+            repo_name=repo_name,
+            commit_hash=commit_hash,
+            index=self.load_index(storage_context, embed_model),
+            bm25_index=bm25_index,
+            size_bytes=resident_size(persist_dir_name),
+        )
+
+    def load_vecdb(
+        self,
+        repo_name: str | None = None,
+    ) -> None:
+        """
+        Get the repo index from the process-wide `INDEX_REGISTRY`, loading it
+        only if no other session did, and build this session's retriever and
+        reranker (with its own API key) over it. Call `release` when done.
+        """
+
+        if self.repo_name is None and repo_name is None:
+            raise Exception("Must Specify repo_name!")
+
+        repo_name = repo_name or self.repo_name or ''
+
+        # The commit the persisted index was built from, scoping the shared
+        # index and the retrieval cache entries.
+        try:
+            commit_hash = RepoCloner.get_repo_info(repo_name)['commit_hash']
+        except KeyError:
+            commit_hash = None
 
-        self.postprocessor = CohereRerank(
-            top_n=2,
-            model="rerank-english-v3.0",
-            api_key=self.cohere_api_key
+        embed_model = CachedQueryEmbedding(
+            self.get_cohere_embed_model(input_type="search_query"),
+            cache=QUERY_EMBEDDING_CACHE
         )
 
+        self.release()
+        self.postprocessor = None
+        self.shared_index = INDEX_REGISTRY.acquire(
+            repo_name,
+            commit_hash,
+            loader=lambda: self.load_shared_index(
+                repo_name, commit_hash, embed_model)
+        )
+        index = self.shared_index.index
+
+        # Sessions that end without `release` give it back once collected.
+        self._release_shared_index = weakref.finalize(
+            self, INDEX_REGISTRY.release, self.shared_index)
+
+        # The IVF index is persisted with the vectors, only the search side
+        # can be tuned, per query as the store is shared.
         self.retriever = index.as_retriever(  # type: ignore
-            similarity_top_k=15,
+            similarity_top_k=self.similarity_top_k,
+            embed_model=embed_model,
+            vector_store_kwargs=dict(ivf_n_probe=self.ivf_n_probe)
+            if self.ivf_n_probe is not None else {},
         )
 
+        self.bm25_index = self.shared_index.bm25_index
+        if self.bm25_index is not None:
+            self.retriever = HybridRetriever(
+                vector_retriever=self.retriever,  # type: ignore
+                bm25_index=self.bm25_index,
+                docstore=index.docstore,
+                similarity_top_k=self.similarity_top_k,
+            )
+
+        self.query_embed_model = embed_model
+        self.docstore = index.docstore
+        self.loaded_repo_name = repo_name
+        self.commit_hash = commit_hash
+
         print("VecDB Loading Done.")
+        print(f"Query Embedding Cache: {QUERY_EMBEDDING_CACHE.stats()}")
+        print(f"Index Registry: {INDEX_REGISTRY.stats()}")
+
+    def load_federated_vecdb(
+        self,
+        repo_names: list[str] | None = None,
+        max_workers: int = 8,
+    ) -> None:
+        """
+        Query several repos at once (all the vectorized local repos by
+        default): their indexes are loaded concurrently, each as a
+        `load_vecdb` would, and a `FederatedRetriever` merges their results
+        before a single rerank.
+        """
+
+        if repo_names is None:
+            repo_names = list(RepoCloner.get_all_repos_info())
+
+        vectorized_repo_names = []
+        for repo_name in repo_names:
+            if os.path.isdir(os.path.join(self.persist_directory, repo_name)):
+                vectorized_repo_names.append(repo_name)
+            else:
+                print(f"Federated Query Skips Not Vectorized Repo: {repo_name}")
+
+        if not vectorized_repo_names:
+            raise Exception("No Vectorized Repo to Query!")
+
+        self.release()
+
+        # Rebuilt for the federated results on the next query.
+        self.postprocessor = None
+
+        self.federated_vecdbs = {
+            repo_name: VecDB(
+                repo_name=repo_name,
+                persist_directory=self.persist_directory,
+                cohere_api_key=self.cohere_api_key,
+                embed_base_url=self.embed_base_url,
+                ivf_n_probe=self.ivf_n_probe,
+                similarity_top_k=self.similarity_top_k,
+            )
+            for repo_name in vectorized_repo_names
+        }
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(
+                lambda vecdb: vecdb.load_vecdb(), self.federated_vecdbs.values()))
+
+        self.query_embed_model = CachedQueryEmbedding(
+            self.get_cohere_embed_model(input_type="search_query"),
+            cache=QUERY_EMBEDDING_CACHE
+        )
+
+        self.retriever = FederatedRetriever(
+            retrievers={
+                repo_name: vecdb.retriever  # type: ignore
+                for repo_name, vecdb in self.federated_vecdbs.items()
+            },
+            embed_model=self.query_embed_model,
+            similarity_top_k=self.similarity_top_k,
+            max_workers=max_workers,
+        )
+
+        # Results of several docstores, not cached by repo.
+        self.docstore = None
+        self.loaded_repo_name = None
+        self.commit_hash = None
+
+        print(f"Federated VecDB Loading Done: {vectorized_repo_names}")
+
+    def get_postprocessor(self) -> AdaptiveRerank:
+        from llama_index.postprocessor.cohere_rerank import CohereRerank
+
+        return AdaptiveRerank(
+            CohereRerank(
+                top_n=self.rerank_top_n,
+                model="rerank-english-v3.0",
+                api_key=self.cohere_api_key
+            ),
+            score_cache=get_rerank_score_cache(self.rerank_cache_path),
+            top_n=self.rerank_top_n,
+            # Per repo normalized scores put every repo's best hit at 1,
+            # whatever its relevance, so federated results are always reranked.
+            skip_margin=None if self.federated_vecdbs else self.rerank_skip_margin,
+        )
+
+    def release(self) -> None:
+        """Give the shared index(es) back to the registry."""
+
+        if self._release_shared_index is not None:
+            self._release_shared_index()
+
+        for vecdb in self.federated_vecdbs.values():
+            vecdb.release()
+
+        self._release_shared_index = None
+        self.shared_index = None
+        self.federated_vecdbs = {}
+        self.retriever = None
+
+    def get_query_embedding(self, text: str) -> list[float]:
+        """The query embedding retrieval uses for the text, cached with it."""
+
+        if self.query_embed_model is None:
+            self.load_vecdb()
+
+        return self.query_embed_model.get_query_embedding(text)  # type: ignore
 
     def query(self, text: str) -> List[NodeWithScore]:
         if self.retriever is None:
             self.load_vecdb()
 
+        # Built on the first query, federated repos only use their retrievers.
+        if self.postprocessor is None:
+            self.postprocessor = self.get_postprocessor()
+
+        if self.loaded_repo_name is None:
+            return self.postprocessor.postprocess_nodes(
+                nodes=self.retriever.retrieve(text),  # type: ignore
+                query_str=text
+            )
+
+        cache_key = RETRIEVAL_CACHE.make_key(
+            self.loaded_repo_name,  # type: ignore
+            self.commit_hash,
+            text,
+            self.similarity_top_k,
+            self.rerank_top_n
+        )
+
+        cached_results = RETRIEVAL_CACHE.get(cache_key)
+        if cached_results is not None:
+            cached_nodes = self.docstore.get_nodes(  # type: ignore
+                [node_id for node_id, _ in cached_results], raise_error=False)
+
+            if len(cached_nodes) == len(cached_results):
+                return [
+                    NodeWithScore(node=node, score=score)
+                    for node, (_, score) in zip(cached_nodes, cached_results)
+                ]
+
         nodes = self.retriever.retrieve(text)  # type: ignore
-        nodes = self.postprocessor.postprocess_nodes(
+        nodes = self.postprocessor.postprocess_nodes(  # type: ignore
             nodes=nodes,
             query_str=text
         )
+
+        RETRIEVAL_CACHE.put(
+            cache_key, [(node.node.node_id, node.score) for node in nodes])
+
         return nodes
 
+    def stats(self) -> dict:
+        return dict(
+            query_embedding_cache=QUERY_EMBEDDING_CACHE.stats(),
+            retrieval_cache=RETRIEVAL_CACHE.stats(),
+            rerank=self.postprocessor.stats() if self.postprocessor else None,
+        )
+
 
 class VecdbChatRAG(VecDB):
     def __init__(
@@ -224,9 +1086,17 @@ class VecdbChatRAG(VecDB):
 
         self.retrieved_node_ids = set()
 
-    def query(self, text: str):  # type: ignore
+        # Node ids and sources of the chunks in the last formatted results.
+        self.last_result_node_ids: list[str] = []
+        self.last_result_sources: list[str] = []
+
+    def retrieve_nodes(self, text: str) -> List[NodeWithScore]:
+        return super().query(text)
 
-        nodes = super().query(text)
+    def format_results(self, text: str, nodes: List[NodeWithScore]) -> str:
+
+        self.last_result_node_ids = []
+        self.last_result_sources = []
 
         i = 0
         ret_docs = ''
@@ -237,6 +1107,9 @@ class VecdbChatRAG(VecDB):
                 continue
 
             self.retrieved_node_ids.add(node_id)
+            self.last_result_node_ids.append(node_id)
+            self.last_result_sources.append(
+                node.metadata.get('source_path') or node.metadata.get('source', ''))
 
             doc = dict(
                 metadata=node.metadata,
@@ -253,3 +1126,6 @@ class VecdbChatRAG(VecDB):
             rag_str_result += " - All Retrieved Docs, In Chat History."
 
         return rag_str_result
+
+    def query(self, text: str):  # type: ignore
+        return self.format_results(text, self.retrieve_nodes(text))